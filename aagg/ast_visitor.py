@@ -1,18 +1,81 @@
 import clingo
-from tree_data import TreeData
+import itertools
+from tree_data import BODY_DATA, HEAD_DATA, HEAD_CONDITION_DATA
 from predicate import Predicate
 from ast_wrappers.conditional_literal import ConditionalLiteral
 from ast_wrappers.definition import Definition
 from ast_wrappers.show_signature import ShowSignature
 
 
+# Per class, a map of ASTType to the class' visit method for that type (None if it has none)
+dispatch_tables = {}
+
+# Per tuple of analysis classes, a map of ASTType to (analysis index, visit method) pairs
+fused_dispatch_tables = {}
+
+
+def dispatch_method(cls, ast_type):
+    """
+        Given a class and an ASTType.
+        Returns the method of the class named visit_<ASTType>, or None.
+        The name is built and looked up only once per class and ASTType
+    """
+    table = dispatch_tables.get(cls)
+    if table is None:
+        table = dispatch_tables[cls] = {}
+
+    try:
+        return table[ast_type]
+    except KeyError:
+        method = getattr(cls, "visit_" + str(ast_type), None)
+        table[ast_type] = method
+        return method
+
+
+def fused_dispatch(classes, ast_type):
+    """
+        Given the classes of the analyses of an ASTFusedVisitor and an ASTType.
+        Returns the list of (analysis index, visit method) pairs to call
+            on nodes of that type
+    """
+    table = fused_dispatch_tables.get(classes)
+    if table is None:
+        table = fused_dispatch_tables[classes] = {}
+
+    try:
+        return table[ast_type]
+    except KeyError:
+        methods = []
+        for index, cls in enumerate(classes):
+            method = dispatch_method(cls, ast_type)
+            if method is not None:
+                methods.append((index, method))
+        table[ast_type] = methods
+        return methods
+
+
+def child_data(data, node, key):
+    """
+        Given the TreeData of a node, the node, and a child key.
+        Returns the TreeData of the child:
+            everything under the 'head' of a rule is in the head, and the
+            condition of a conditional literal in the head is a condition
+    """
+    if key == 'head':
+        return HEAD_DATA
+    elif data.head and not data.condition and key == 'condition' and \
+            node.type == clingo.ast.ASTType.ConditionalLiteral:
+        return HEAD_CONDITION_DATA
+    return data
+
+
 class ASTVisitor(object):
 
-    def visit(self, x, data=TreeData()):
+    def visit(self, x, data=BODY_DATA):
         if isinstance(x, clingo.ast.AST):
-            attr = "visit_" + str(x.type)
-            if hasattr(self, attr):
-                return getattr(self, attr)(x, data)
+            method = dispatch_method(self.__class__, x.type)
+            if method is not None:
+                return method(self, x, data)
             else:
                 after = self.visit_children(x, data)
                 return after
@@ -23,14 +86,60 @@ class ASTVisitor(object):
         else:
             raise TypeError("unexpected type (%s)" % type(x))
 
-    def visit_children(self, x, data=TreeData()):
+    def visit_children(self, x, data=BODY_DATA):
         for key in x.child_keys:
             child_x = self.visit(getattr(x, key), data)
             x[key] = child_x
         return x
 
 
-class ASTReplacer(ASTVisitor):
+class ASTFusedVisitor(object):
+    """
+        Runs several analyses in a single traversal of an AST.
+        An analysis is any object with methods named visit_<ASTType>,
+            which are given each node of that type and its TreeData
+            before the children of the node are visited. A method may
+            return a node replacing the visited one, or None.
+        Analyses see each node in the order they were given, so a
+            replacing analysis should come first. Child slots are only
+            assigned when a child was replaced
+    """
+
+    def __init__(self, analyses):
+        self.analyses = analyses
+        self.classes = tuple(analysis.__class__ for analysis in analyses)
+
+    def visit(self, x, data=BODY_DATA):
+        if isinstance(x, clingo.ast.AST):
+            for index, method in fused_dispatch(self.classes, x.type):
+                replacement = method(self.analyses[index], x, data)
+                if replacement is not None:
+                    x = replacement
+
+            for key in x.child_keys:
+                child = x[key]
+                visited_child = self.visit(child, child_data(data, x, key))
+                if visited_child is not child:
+                    x[key] = visited_child
+            return x
+
+        elif isinstance(x, list):
+            visited = x
+            for index, y in enumerate(x):
+                visited_y = self.visit(y, data)
+                if visited_y is not y:
+                    if visited is x:
+                        visited = list(x)
+                    visited[index] = visited_y
+            return visited
+
+        elif x is None:
+            return x
+        else:
+            raise TypeError("unexpected type (%s)" % type(x))
+
+
+class ASTReplacer(object):
     """
         Some AST objects have string representations which do not
             match the Gringo syntax for that object. We can define
@@ -38,109 +147,138 @@ class ASTReplacer(ASTVisitor):
             overridden __str__ method.
         This visits the AST, replacing all encountered AST objects with
             custom-defined AST objects where appropriate
-
+        As an analysis, it may be fused with others in an ASTFusedVisitor
     """
 
+    def __init__(self):
+        self.visitor = ASTFusedVisitor([self])
+
     def replace(self, stm):
-        return super(ASTReplacer, self).visit(stm)
+        return self.visitor.visit(stm)
 
     # Must be named with capital letter to match the class name
     # noinspection PyPep8Naming
-    def visit_ConditionalLiteral(self, conditional_literal, data=TreeData()):
-        fixed_conditional_literal = ConditionalLiteral(conditional_literal)
-        return super(ASTReplacer, self).visit_children(fixed_conditional_literal, data)
+    def visit_ConditionalLiteral(self, conditional_literal, data=BODY_DATA):
+        return ConditionalLiteral(conditional_literal)
 
     # noinspection PyPep8Naming
-    def visit_Definition(self, definition, data=TreeData()):
-        fixed_definition = Definition(definition)
-        return super(ASTReplacer, self).visit_children(fixed_definition, data)
+    def visit_Definition(self, definition, data=BODY_DATA):
+        return Definition(definition)
 
     # noinspection PyPep8Naming
-    def visit_ShowSignature(self, show_signature, data=TreeData()):
-        fixed_show_signature = ShowSignature(show_signature)
-        return super(ASTReplacer, self).visit_children(fixed_show_signature, data)
+    def visit_ShowSignature(self, show_signature, data=BODY_DATA):
+        return ShowSignature(show_signature)
 
 
-def pool_and_arg_hash(pool, arg):
+def copy_node(x):
     """
-        Helper function for the ASTPoolInstantiator class
-        Given a pool and one if its arguments,
-        Returns a string value of the form:
-            "pool_location - argument_list - argument"
+        Given an AST node.
+        Returns a shallow copy of the node, whose children are shared
+            with the original. Nodes replaced by the ASTReplacer keep
+            their custom-defined class
     """
-    return "Pool+Arg Hash:  L%sC%s-%s-%s" % \
-           (pool['location']['begin']['line'], pool['location']['begin']['column'], pool['arguments'], arg)
+    node = clingo.ast.AST(x.type, **dict(x))
+    if type(x) is not clingo.ast.AST:
+        node = type(x)(node)
+    return node
 
 
-class ASTPoolInstantiator(ASTVisitor):
+class ASTPoolInstantiator(object):
     """
-        AST tree visitor class for recursively instantiating
-            a rule containing a pool into multiple rules
-            containing no pools
+        AST tree walker for instantiating a rule containing pools into
+            multiple rules containing no pools.
+        Instantiations are generated lazily. Subtrees which contain no
+            pool are shared between all instantiations rather than
+            copied, and only the nodes on the path from the statement
+            to a pool are copied for each instantiation
     """
 
-    def __init__(self):
-        self.stm = None
-        self.instantiations = None
-        self.operational_pool_hash = None
-        self.astCopier = ASTCopier()
-        self.astPoolInstantiator = None
+    def __init__(self, keep_pools=False):
+        self.keep_pools = keep_pools
+        self.pool_containment = {}  # id of a visited node: whether a pool occurs within it
 
     def instantiate_pools(self, stm):
         """
             Given a statement, possibly containing pool objects.
-            Resets the class' values because no data needs to be
-                kept for different rule instantiations; this allows
-                this class to be constructed once and only once.
-            Visits the rule recursively using the ASTVisitor.
-            When a Pool object is first encountered, this adds the
-                result of visit(stm) to a list of instantiations, where
-                we visit the statement with a flag indicating which
-                argument in the encountered rule we are expanding.
-                The pool is eliminated for each argument, and only the
-                result of visit(that argument) is returned put in
-                place of the pool.
-            Then recursively call the ASTPoolInstantiator on each
-                instantiation of that pool, in order to instantiate
-                other pools in the rule (if any exist)
-            Returns the list of pool instantiations
-        """
-        self.stm = stm
-        self.instantiations = []
-        self.operational_pool_hash = None
-
-        stm = super(ASTPoolInstantiator, self).visit(self.stm)
-        if len(self.instantiations) > 0:
-            return self.instantiations
-        else:
-            return [stm]
+            Returns the list of pool instantiations of the statement
+        """
+        return list(self.generate_instantiations(stm))
 
-    # noinspection PyPep8Naming
-    def visit_Pool(self, pool, data=TreeData()):
-        if self.operational_pool_hash is None:
-            # Encountered a pool while we are not actively replacing a pool with a specific one of its arguments
-
-            instantiations = []
-            for arg in pool['arguments']:
-                # Store a flag (string hash) of the argument we wish to use to replace its parent pool;
-                # Add a rule with that argument in place of its parent pool to a list of instantiations
-                self.operational_pool_hash = pool_and_arg_hash(pool, arg)
-                instantiations.append(super(ASTPoolInstantiator, self).visit(self.astCopier.deep_copy(self.stm)))
-
-            # Class-recursive part; instantiate all instantiations, in case multiple pools exist within the rule
-            self.astPoolInstantiator = ASTPoolInstantiator()
-            for instantiation in instantiations:
-                for instantiation_instantiation in self.astPoolInstantiator.instantiate_pools(instantiation):
-                    self.instantiations.append(instantiation_instantiation)
+    def generate_instantiations(self, stm):
+        """
+            Given a statement, possibly containing pool objects.
+            Yields each pool instantiation of the statement, in the order
+                of the pools in the statement and of their arguments
+            If keep_pools is set, a rule whose pools do not occur in any
+                potential counting literal or comparison (e.g. pools in
+                the head) is yielded with its pools, as they cannot affect
+                the counting analysis; the rule is still rewritten
+        """
+        self.pool_containment = {}
+        if not self.contains_pool(stm) or (self.keep_pools and not self.pools_in_candidates(stm)):
+            yield stm
         else:
-            # Encountered a pool while we are actively replacing a pool with a specific one of its arguments
-            #   If this is that specific pool, replace it with its visited argument
-            #   Otherwise, visit the pool's children as normal
-            for arg in pool['arguments']:
-                if self.operational_pool_hash == pool_and_arg_hash(pool, arg):
-                    return super(ASTPoolInstantiator, self).visit(arg, data)
+            for instantiation in self.expand(stm):
+                yield instantiation
+
+    def contains_pool(self, x):
+        """
+            Returns True if a pool occurs within x
+            Results are memoized by the identity of AST nodes, which are
+                all kept alive by the statement being instantiated
+        """
+        if isinstance(x, list):
+            return any(self.contains_pool(y) for y in x)
+        elif not isinstance(x, clingo.ast.AST):
+            return False
+
+        key = id(x)
+        if key not in self.pool_containment:
+            self.pool_containment[key] = x.type == clingo.ast.ASTType.Pool or \
+                any(self.contains_pool(x[child_key]) for child_key in x.child_keys)
+        return self.pool_containment[key]
+
+    def pools_in_candidates(self, stm):
+        """
+            Returns True if a pool occurs in a body literal of a function
+                or comparison, which may be a counting literal
+        """
+        if stm.type != clingo.ast.ASTType.Rule:
+            return False
+
+        for body_literal in stm['body']:
+            if body_literal.type == clingo.ast.ASTType.Literal and \
+                    (body_literal['atom'].type == clingo.ast.ASTType.SymbolicAtom or
+                     body_literal['atom'].type == clingo.ast.ASTType.Comparison) and \
+                    self.contains_pool(body_literal):
+                return True
+        return False
+
+    def expand(self, x):
+        """
+            Yields every pool-free variant of x, where each pool is
+                replaced by each of its arguments in turn
+        """
+        if not self.contains_pool(x):
+            yield x
 
-            return super(ASTPoolInstantiator, self).visit_children(pool, data)
+        elif isinstance(x, list):
+            for combination in itertools.product(*[list(self.expand(y)) for y in x]):
+                yield list(combination)
+
+        elif x.type == clingo.ast.ASTType.Pool:
+            for arg in x['arguments']:
+                for variant in self.expand(arg):
+                    yield variant
+
+        else:
+            child_keys = x.child_keys
+            child_variants = [list(self.expand(x[child_key])) for child_key in child_keys]
+            for combination in itertools.product(*child_variants):
+                node = copy_node(x)
+                for child_key, child in zip(child_keys, combination):
+                    node[child_key] = child
+                yield node
 
 
 class ASTCopier(ASTVisitor):
@@ -148,7 +286,7 @@ class ASTCopier(ASTVisitor):
     def deep_copy(self, ast):
         return self.visit(ast)
 
-    def visit(self, x, data=TreeData()):  # 'data' needed in arguments list so ASTVisitor will call this visit
+    def visit(self, x, data=BODY_DATA):  # 'data' needed in arguments list so ASTVisitor will call this visit
         if isinstance(x, clingo.ast.AST):
             x = clingo.ast.AST(x.type, **dict(x))
             return super(ASTCopier, self).visit(x, data)
@@ -156,7 +294,7 @@ class ASTCopier(ASTVisitor):
             return super(ASTCopier, self).visit(x, data)
 
 
-class ASTPredicateMapper(ASTVisitor):
+class ASTPredicateMapper(object):
     """
         Want to create an adjacency list where we have an edge from 
          x to y if x is in the head of a rule in which y is in the body.
@@ -164,15 +302,15 @@ class ASTPredicateMapper(ASTVisitor):
                 {x : (y,z)}            (note: (y,z) is a set of y and z)
          after observing a rule 'x :- y, z.' where y and z may be
          preceded by 'not'
+        As an analysis, it may be fused with others in an ASTFusedVisitor,
+         between calls to begin_statement and end_statement
     """
 
     def __init__(self):
         self.predicate_map = {}
         self.head_predicates = set()
         self.body_predicates = set()
-
-    def clear_map(self):
-        self.predicate_map = {}
+        self.visitor = ASTFusedVisitor([self])
 
     def map_rule_predicates(self, rule):
         """
@@ -184,49 +322,93 @@ class ASTPredicateMapper(ASTVisitor):
             Otherwise performs no operations
         """
         if isinstance(rule, clingo.ast.AST) and rule.type == clingo.ast.ASTType.Rule:
-            # Reset head and body predicate lists such that this class 
-            #  may be reused for all rules in the program
-            self.head_predicates = set()
-            self.body_predicates = set()
+            self.begin_statement()
+            self.visitor.visit(rule)
+            self.end_statement(rule)
 
-            super(ASTPredicateMapper, self).visit(rule["head"], TreeData(head=True))
-            super(ASTPredicateMapper, self).visit(rule["body"], TreeData(head=False))
+    def begin_statement(self):
+        # Reset head and body predicate lists such that this class 
+        #  may be reused for all rules in the program
+        self.head_predicates = set()
+        self.body_predicates = set()
 
+    def end_statement(self, stm):
+        """Adds the predicates found in the visited statement to the map, if it is a rule"""
+        if stm.type == clingo.ast.ASTType.Rule:
             for head_predicate in self.head_predicates:
+                self.add_dependencies(head_predicate, self.body_predicates)
 
-                if head_predicate not in self.predicate_map.keys():
-                    self.predicate_map[head_predicate] = set()
+    def add_dependencies(self, head_predicate, body_predicates):
+        """Adds edges from the head predicate to each of the body predicates"""
+        if head_predicate not in self.predicate_map:
+            self.predicate_map[head_predicate] = set()
 
-                self.predicate_map[head_predicate].update(self.body_predicates)
+        self.predicate_map[head_predicate].update(body_predicates)
 
     # Must be named with capital letter to match the class name
     # noinspection PyPep8Naming
-    def visit_ConditionalLiteral(self, conditional_literal, data=TreeData()):
-        """
-            If we encounter a conditional literal in the head, we are 
-                within either an Aggregate, Head Aggregate, or a Disjoint.
-            In all cases, we have a conditional literal of the form
-                            literal : conditions
-                    where conditions are a set of literals.
-            We want predicates in the literal to be marked as in the head,
-                and predicates in the conditions to be marked as in the
-                body.
-        """
-        if data.head:
-            conditional_literal['literal'] = super(ASTPredicateMapper, self).visit(conditional_literal['literal'], data)
-            conditional_literal['condition'] = super(ASTPredicateMapper, self).visit(conditional_literal['condition'],
-                                                                                     TreeData(head=False))
-            return conditional_literal
-        else:
-            return super(ASTPredicateMapper, self).visit_children(conditional_literal, data)
-
-    # Must be named with capital letter to match the class name
-    # noinspection PyPep8Naming
-    def visit_Function(self, function, data=TreeData()):
+    def visit_Function(self, function, data=BODY_DATA):
+        """
+            Predicates in the conditions of conditional literals in the
+                head (within an Aggregate, Head Aggregate, or Disjunction)
+                are marked as in the body
+        """
         predicate = Predicate(function['name'], len(function['arguments']))
-        if data.head:
+        if data.head and not data.condition:
             self.head_predicates.add(predicate)
         else:
             self.body_predicates.add(predicate)
 
-        return super(ASTPredicateMapper, self).visit_children(function, data)
+
+class ASTCanonicalizer(object):
+    """
+        Computes the shape of a rule: a key which is equal for two rules
+            if and only if they are identical up to the renaming of
+            variables. Predicate names, arities, and constants are kept;
+            variables are renamed by order of first occurrence
+    """
+
+    def __init__(self):
+        self.tokens = None
+        self.variable_ids = None
+        self.variable_names = None
+
+    def canonicalize(self, rule):
+        """
+            Given a rule.
+            Returns its shape key and the list of its variable names in
+                order of first occurrence (the i-th name is renamed V<i>)
+        """
+        self.tokens = []
+        self.variable_ids = {}
+        self.variable_names = []
+        self.visit(rule)
+        return tuple(self.tokens), self.variable_names
+
+    def visit(self, x):
+        if isinstance(x, clingo.ast.AST):
+            if x.type == clingo.ast.ASTType.Variable and x['name'] != '_':
+                name = x['name']
+                if name not in self.variable_ids:
+                    self.variable_ids[name] = len(self.variable_names)
+                    self.variable_names.append(name)
+                self.tokens.append("V%d" % self.variable_ids[name])
+                return
+
+            self.tokens.append(str(x.type))
+            for key in sorted(x.keys()):
+                if key != 'location' and key not in x.child_keys:
+                    self.tokens.append("%s=%s" % (key, x[key]))
+            self.tokens.append('(')
+            for key in x.child_keys:
+                self.visit(x[key])
+            self.tokens.append(')')
+        elif isinstance(x, list):
+            self.tokens.append('[')
+            for y in x:
+                self.visit(y)
+            self.tokens.append(']')
+        elif x is None:
+            self.tokens.append('None')
+        else:
+            raise TypeError("unexpected type (%s)" % type(x))
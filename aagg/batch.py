@@ -0,0 +1,182 @@
+#!/usr/bin/env python2.7
+"""
+    Rewrites many sets of encodings in one process (or a pool of worker
+        processes), as listed by a JSON manifest of the form
+
+        {
+            "defaults": {"aggregate_form": 2},
+            "jobs": [
+                {"name": "queens", "encodings": ["queens.lp"], "output": "out/queens.lp"},
+                {"encodings": ["a.lp", "b.lp"], "options": {"use_anonymous_variable": true}}
+            ]
+        }
+
+    Options are named as the arguments of main.py (see build_arguments),
+        and relative paths are relative to the manifest. A bare list of
+        jobs is also accepted.
+    Jobs of a process share the interpreter, the clingo module and a
+        RewritePlanCache. Rewritings are never confirmed interactively
+"""
+
+import argparse, json, multiprocessing, os, sys, time, traceback
+import constants
+from main import AutomatedAggregator, build_arguments, name_outfile
+from rewrite_plan import RewritePlanCache
+
+# RewritePlanCache shared by the jobs run in this process
+shared_plan_cache = None
+
+
+def load_manifest(path):
+    """
+        Given the path of a manifest
+        Returns its jobs, each with a name, encodings and output paths,
+            and options (the defaults of the manifest updated with those
+            of the job)
+    """
+    with open(path) as manifest_fd:
+        manifest = json.load(manifest_fd)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+
+    directory = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults', {})
+    jobs = []
+    for index, job in enumerate(manifest['jobs']):
+        if not job.get('encodings'):
+            raise ValueError("Job %d of %s has no encodings" % (index, path))
+        encodings = [os.path.join(directory, encoding) for encoding in job['encodings']]
+        options = dict(defaults)
+        options.update(job.get('options', {}))
+        jobs.append({
+            'name': job.get('name', os.path.basename(encodings[0])),
+            'encodings': encodings,
+            'output': os.path.join(directory, job['output']) if job.get('output') else name_outfile(encodings),
+            'options': options,
+        })
+    return jobs
+
+
+def init_worker(plan_cache_size):
+    global shared_plan_cache
+    shared_plan_cache = RewritePlanCache(plan_cache_size)
+    sys.stdout = open(os.devnull, 'w')
+
+
+def run_job(job):
+    """
+        Worker task: rewrites the encodings of a job, printing nothing
+        Returns the summary of the job
+    """
+    summary = {'name': job['name'], 'output': job['output']}
+    start = time.time()
+    try:
+        arguments = build_arguments(job['encodings'], output=job['output'], **job['options'])
+        arguments.confirm_rewrite = True  # Never prompt
+        arguments.quiet = True
+        if job.get('in_pool'):
+            arguments.jobs = 1  # Pool workers cannot start worker processes of their own
+
+        output_directory = os.path.dirname(job['output'])
+        if output_directory and not os.path.isdir(output_directory):
+            os.makedirs(output_directory)
+
+        if arguments.plan_cache_size > 0:
+            aggregator = AutomatedAggregator(arguments, shared_plan_cache)
+        else:
+            aggregator = AutomatedAggregator(arguments)
+        aggregator.run()
+
+        transformer = aggregator.transformer
+        summary.update({
+            'status': 'ok',
+            'input_statements': len(transformer.input_statements),
+            'output_statements': len(transformer.output_statements),
+            'rules_analyzed': transformer.screen_hits,
+            'rules_rewritten': len(transformer.rewrite_forms),
+            'forms': dict(("%s" % form, sum(1 for _, _, rewrite_form in transformer.rewrite_forms
+                                            if rewrite_form == form))
+                          for form in set(form for _, _, form in transformer.rewrite_forms)),
+            'warnings': transformer.warnings,
+            'timings': aggregator.timings,
+        })
+        if aggregator.satisfiable is not None:
+            summary['satisfiable'] = aggregator.satisfiable
+    except Exception:
+        summary['status'] = 'error'
+        summary['error'] = traceback.format_exc()
+    summary['seconds'] = time.time() - start
+    return summary
+
+
+def run_batch(jobs, processes, plan_cache_size):
+    """
+        Given jobs, the number of worker processes (0 to run the jobs in
+            this process) and the capacity of the shared plan caches
+        Yields the summary of every job, in order
+    """
+    global shared_plan_cache
+    if processes <= 0:
+        shared_plan_cache = RewritePlanCache(plan_cache_size)
+        stdout = sys.stdout
+        for job in jobs:
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                summary = run_job(job)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            yield summary
+        return
+
+    pool_jobs = [dict(job, in_pool=True) for job in jobs]
+    pool = multiprocessing.Pool(processes, init_worker, (plan_cache_size,))
+    try:
+        for summary in pool.imap(run_job, pool_jobs):
+            yield summary
+    finally:
+        pool.close()
+        pool.join()
+
+
+def print_summary(summary):
+    if summary['status'] != 'ok':
+        print("%-24s  FAILED  %s" % (summary['name'], summary['error'].strip().splitlines()[-1]))
+        return
+
+    forms = ", ".join("(%s) %d" % (form, count) for form, count in sorted(summary['forms'].items()))
+    line = "%-24s  %8.3fs  %5d of %5d rules rewritten%s  %d warnings  -> %s" % (
+        summary['name'], summary['seconds'], summary['rules_rewritten'], summary['rules_analyzed'],
+        " [%s]" % forms if forms else "", len(summary['warnings']), summary['output'])
+    if 'satisfiable' in summary:
+        line += "  SAT" if summary['satisfiable'] else "  UNSAT"
+    print(line)
+
+
+def define_args(arg_parser):
+    arg_parser.description = 'Rewrite the encodings of every job of a manifest in one run'
+    arg_parser.add_argument('manifest', help='JSON manifest of jobs')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=0,
+                            help='Run the jobs in a pool of this many worker processes (0 runs them in this process)')
+    arg_parser.add_argument('--plan-cache-size', type=int, default=constants.PLAN_CACHE_SIZE,
+                            help='Number of rule shapes whose rewrite analysis is cached across jobs')
+    arg_parser.add_argument('--summary', type=str, default='', help='Write the summaries of the jobs to this JSON file')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    define_args(parser)
+    args = parser.parse_args()
+
+    batch_start = time.time()
+    summaries = []
+    for job_summary in run_batch(load_manifest(args.manifest), args.jobs, args.plan_cache_size):
+        print_summary(job_summary)
+        summaries.append(job_summary)
+
+    failures = sum(1 for job_summary in summaries if job_summary['status'] != 'ok')
+    print("\n%d jobs in %.3fs, %d failed" % (len(summaries), time.time() - batch_start, failures))
+    if args.summary:
+        with open(args.summary, 'w') as summary_fd:
+            json.dump(summaries, summary_fd, sort_keys=True, indent=2, separators=(',', ': '))
+    sys.exit(1 if failures else 0)
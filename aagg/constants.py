@@ -3,7 +3,32 @@
 AGGR_FORM1 = 1  # Form:  b <= #count{ X : f(X) }
 AGGR_FORM2 = 2  # Form:  not #count{ Y : f(Y) } < b
 AGGR_FORM3 = 3  # Form:  not b - 1 = #count{ Y : f(Y) }, ..., not 0 = #count{ Y : f(Y) }
+AGGR_FORM_AUTO = 'auto'  # Choose the form of each rule with the FormCostModel
 
 LOCATION = {    # Custom 'Location' value for aagg-created AST objects, which do not correspond to a real file location
     'begin': {'column': 'inserted-by-aagg', 'line': 'inserted-by-aagg', 'filename': '<string>'},
     'end': {'column': 'inserted-by-aagg', 'line': 'inserted-by-aagg', 'filename': '<string>'}}
+
+MAX_COUNTING_CLIQUE = 16  # Size cap for the search of pairwise not-equal counting variables
+MAX_CLIQUE_SEARCH_NODES = 10000  # Search nodes the clique search expands before settling for its best clique so far
+
+PLAN_CACHE_SIZE = 4096  # Number of rule shapes whose rewrite plans are kept by the RewritePlanCache
+
+REBUILD_CACHE_VERSION = 'aagg-rebuild-2'  # Changing this invalidates every entry of existing rebuild caches
+
+OUTPUT_BUFFER_SIZE = 1 << 20  # Characters of output statements collected before each write to the output file
+
+GZIP_LEVEL = 6  # Compression level of gzip compressed output
+
+PARSE_THREADS = 4  # Number of input files read and parsed at a time
+
+# Program parts and external atom of incremental encodings, as used by clingo's incremental mode
+BASE_PART = 'base'  # Grounded once, before the first step
+STEP_PART = 'step'  # Grounded with the horizon of each step after the first
+CHECK_PART = 'check'  # Grounded with the horizon of each step
+QUERY_EXTERNAL = 'query'  # Assigned true for the horizon of the step being solved only
+
+# Stop conditions of the incremental mode: the solve result which ends it
+ISTOP_SAT = 'SAT'
+ISTOP_UNSAT = 'UNSAT'
+ISTOP_UNKNOWN = 'UNKNOWN'
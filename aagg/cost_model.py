@@ -0,0 +1,81 @@
+import os
+import json
+
+# Cost model used when none is given; see cost_model.json
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cost_model.json')
+
+# Features of a rewritten rule, in the order of the coefficients of each form
+FEATURES = ['intercept', 'b', 'projection', 'anonymous']
+
+
+def rule_features(b, projection_arity, anonymous):
+    """
+        Given the number of counting variables, the arity of the
+            projection predicate (0 if none is needed) and whether
+            anonymous variables are used.
+        Returns the feature vector of the rewritten rule
+    """
+    return [1.0, float(b), float(projection_arity), 1.0 if anonymous else 0.0]
+
+
+class FormCostModel:
+    """
+        Estimates the ground and solve cost of a rewritten rule in each
+            aggregate form, as a linear function of the features of the
+            rule, so that the cheapest valid form can be chosen per rule.
+        The coefficients are kept in a JSON file of the form
+            {"features": [...], "forms": {"1": [...], "2": [...], "3": [...]}}
+            which benchmarks/train_cost_model.py fits to the results of
+            benchmarks/matrix.py
+        A model not fitted to any results is marked "calibrated": false;
+            the shipped model is such a placeholder, under which the
+            lowest numbered valid form is always chosen
+    """
+
+    def __init__(self, coefficients, description='', calibrated=True):
+        self.coefficients = coefficients  # Form: list of coefficients, one per feature
+        self.description = description
+        self.calibrated = calibrated  # Whether the coefficients were fitted to benchmark results
+
+    @staticmethod
+    def load(path=DEFAULT_PATH):
+        """Loads a cost model from the given JSON file"""
+        with open(path) as model_fd:
+            model = json.load(model_fd)
+
+        if model.get('features') != FEATURES:
+            raise ValueError("Cost model %s must have the features %s" % (path, ", ".join(FEATURES)))
+        coefficients = {}
+        for form, form_coefficients in model['forms'].items():
+            if len(form_coefficients) != len(FEATURES):
+                raise ValueError("Cost model %s has %d coefficients for form %s, not %d" %
+                                 (path, len(form_coefficients), form, len(FEATURES)))
+            coefficients[int(form)] = [float(coefficient) for coefficient in form_coefficients]
+        return FormCostModel(coefficients, model.get('description', ''), model.get('calibrated', True))
+
+    def save(self, path):
+        model = {
+            'calibrated': self.calibrated,
+            'description': self.description,
+            'features': FEATURES,
+            'forms': dict((str(form), coefficients) for form, coefficients in self.coefficients.items()),
+        }
+        with open(path, 'w') as model_fd:
+            json.dump(model, model_fd, sort_keys=True, indent=2, separators=(',', ': '))
+            model_fd.write("\n")
+
+    def cost(self, form, features):
+        """Returns the estimated cost of the rule with the given features in the given form"""
+        return sum(coefficient * feature for coefficient, feature in zip(self.coefficients[form], features))
+
+    def choose(self, valid_forms, features):
+        """
+            Given the valid output forms of a rule and its features.
+            Returns the valid form of least estimated cost (the lowest
+                numbered form on ties), or None if no form is valid.
+                Forms unknown to the model are not chosen
+        """
+        modeled_forms = [form for form in sorted(valid_forms) if form in self.coefficients]
+        if len(modeled_forms) == 0:
+            return None
+        return min(modeled_forms, key=lambda form: (self.cost(form, features), form))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python2.7
+"""
+    Long-lived rewrite server listening on a Unix socket, so that
+        editors and build systems need not start Python and clingo for
+        every rewrite.
+
+    Requests and responses are JSON objects, one per line. A connection
+        may send any number of requests. A rewrite request has the form
+            {"id": 1, "program": "...", "options": {"aggregate_form": 2}}
+        with options named as the arguments of main.py (see
+        build_arguments), and is answered by
+            {"id": 1, "status": "ok", "program": "...", "report": [...],
+             "warnings": [...], "timings": {...}}
+        where each report entry holds a rule before and after rewriting
+        and its auxiliary rule, if any. Errors are answered by
+            {"id": 1, "status": "error", "error": "..."}
+    The commands {"command": "ping"}, {"command": "stats"} and
+        {"command": "shutdown"} are also understood.
+
+    Each connection is read on a thread of its own, and each request is
+        handled by a pool of worker threads sharing the visitor dispatch
+        tables and a RewritePlanCache, so idle connections hold no
+        worker. The responses to the requests of one connection are
+        written as the requests finish, so they may come in another order
+        (the "id" of a request is returned with its response).
+        Rewritings are never confirmed interactively
+"""
+
+import argparse, json, os, socket, stat, StringIO, sys, threading, time, traceback
+from multiprocessing.pool import ThreadPool
+import constants
+from main import AutomatedAggregator, build_arguments
+from rewrite_plan import SharedRewritePlanCache
+
+
+class Connection:
+    """A client connection, whose responses are written by the workers handling its requests"""
+
+    def __init__(self, client_socket):
+        self.socket = client_socket
+        self.writer = client_socket.makefile('wb')
+        self.lock = threading.Lock()  # Guards the writer, as workers may answer requests at the same time
+
+    def respond(self, response):
+        with self.lock:
+            try:
+                self.writer.write(json.dumps(response) + "\n")
+                self.writer.flush()
+            except socket.error:
+                pass  # The client went away
+
+    def stop_reading(self):
+        """Ends the reading of requests, so that the connection is closed once its requests are answered"""
+        try:
+            self.socket.shutdown(socket.SHUT_RD)
+        except socket.error:
+            pass  # Already closed
+
+    def close(self):
+        with self.lock:
+            self.socket.close()
+
+
+class RewriteDaemon:
+    """Handles the requests of every connection to the daemon"""
+
+    def __init__(self, plan_cache_size):
+        self.plan_cache = SharedRewritePlanCache(plan_cache_size)
+        self.lock = threading.Lock()  # Guards the counters and connections below
+        self.requests = 0
+        self.errors = 0
+        self.connections = set()  # Open Connections
+        self.closed = False  # Whether the pool of workers takes no further requests
+        self.started = time.time()
+        self.stopping = False
+
+    def serve_connection(self, connection, pool):
+        """
+            Reads the requests of a connection, and hands each to the
+                pool of workers, until the connection is closed or the
+                daemon shuts down
+            The connection is closed once every request read is answered
+        """
+        pending = []  # AsyncResults of requests which may not be answered yet
+        try:
+            for line in connection.socket.makefile('rb'):
+                if not line.strip():
+                    continue
+                pending = [result for result in pending if not result.ready()]
+                with self.lock:
+                    if not self.closed:
+                        pending.append(pool.apply_async(self.answer, (connection, line)))
+                        continue
+                connection.respond({'status': 'error', 'error': "The server is shutting down"})
+                break
+        except socket.error:
+            pass  # The client went away
+        finally:
+            for result in pending:
+                result.wait()
+            with self.lock:
+                self.connections.discard(connection)
+            connection.close()
+
+    def answer(self, connection, line):
+        """Handles a request line of the connection in a worker, and writes its response"""
+        connection.respond(self.handle(line))
+
+    def stop_connections(self):
+        """Stops reading requests from every open connection"""
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.stop_reading()
+
+    def handle(self, line):
+        """
+            Given a request line
+            Returns the response to the request
+        """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Requests must be JSON objects")
+        except ValueError as error:
+            return {'status': 'error', 'error': "Invalid request: %s" % error}
+
+        command = request.get('command', 'rewrite')
+        if command == 'rewrite':
+            response = self.rewrite(request)
+        elif command == 'ping':
+            response = {'status': 'ok'}
+        elif command == 'stats':
+            response = self.stats()
+        elif command == 'shutdown':
+            self.stopping = True
+            response = {'status': 'ok'}
+        else:
+            response = {'status': 'error', 'error': "Unknown command: %s" % command}
+
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def rewrite(self, request):
+        """
+            Given a rewrite request
+            Returns the rewritten program with its rewrite report
+        """
+        try:
+            if 'program' not in request:
+                raise ValueError("Rewrite requests must have a program")
+
+            # The output file is never opened, as the output is kept in memory
+            arguments = build_arguments([], output=os.devnull, **request.get('options', {}))
+            arguments.confirm_rewrite = True  # Never prompt
+            arguments.quiet = True
+            arguments.debug = False
+            arguments.jobs = 1  # Forking a threaded server is unsafe
+            arguments.trace = ''
+            arguments.profile = 0
+
+            if arguments.plan_cache_size > 0:
+                aggregator = AutomatedAggregator(arguments, self.plan_cache, request['program'])
+            else:
+                aggregator = AutomatedAggregator(arguments, program=request['program'])
+            out_fd = StringIO.StringIO()
+            aggregator.run(out_fd)
+
+            transformer = aggregator.transformer
+            response = {
+                'status': 'ok',
+                'program': out_fd.getvalue(),
+                'report': [{'before': before, 'after': after, 'auxiliary': auxiliary}
+                           for before, after, auxiliary in transformer.rewrite_report],
+                'warnings': transformer.warnings,
+                'timings': aggregator.timings,
+            }
+            if aggregator.satisfiable is not None:
+                response['satisfiable'] = aggregator.satisfiable
+                response['metrics'] = dict(aggregator.metrics)
+            if aggregator.steps is not None:
+                response['steps'] = [dict(step) for step in aggregator.steps]
+        except Exception as error:
+            with self.lock:
+                self.errors += 1
+            sys.stderr.write(traceback.format_exc())
+            response = {'status': 'error', 'error': "%s: %s" % (type(error).__name__, error)}
+
+        with self.lock:
+            self.requests += 1
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {
+                'status': 'ok',
+                'uptime': time.time() - self.started,
+                'requests': self.requests,
+                'errors': self.errors,
+                'plan_cache_hits': self.plan_cache.hits,
+                'plan_cache_misses': self.plan_cache.misses,
+                'plan_cache_size': len(self.plan_cache.plans),
+            }
+
+
+def serve(socket_path, workers, plan_cache_size):
+    """
+        Listens on the given socket path, handling up to the given
+            number of requests at a time, until a shutdown request.
+        On shutdown, the requests already read are answered, and then
+            every connection is closed
+    """
+    if os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise ValueError("%s exists and is not a socket" % socket_path)
+        os.remove(socket_path)  # Left by a daemon which did not shut down
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(workers * 4)
+    server.settimeout(0.5)  # So that shutdown requests are noticed
+
+    daemon = RewriteDaemon(plan_cache_size)
+    pool = ThreadPool(workers)
+    readers = []  # Threads reading the requests of each connection
+    sys.stderr.write("Listening on %s with %d workers\n" % (socket_path, workers))
+    try:
+        while not daemon.stopping:
+            try:
+                client_socket, _ = server.accept()
+            except socket.timeout:
+                continue
+            client_socket.settimeout(None)
+            connection = Connection(client_socket)
+            with daemon.lock:
+                daemon.connections.add(connection)
+            reader = threading.Thread(target=daemon.serve_connection, args=(connection, pool))
+            reader.daemon = True
+            reader.start()
+            readers = [thread for thread in readers if thread.is_alive()] + [reader]
+    finally:
+        server.close()
+        os.remove(socket_path)
+        daemon.stop_connections()
+        with daemon.lock:
+            daemon.closed = True
+        pool.close()
+        pool.join()
+        for reader in readers:
+            reader.join()
+
+
+def send(socket_path, request):
+    """
+        Client helper: sends a request to the daemon on the given socket
+        Returns the response
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request) + "\n")
+        return json.loads(client.makefile('rb').readline())
+    finally:
+        client.close()
+
+
+def define_args(arg_parser):
+    arg_parser.description = 'Serve rewrite requests on a Unix socket, or send one to a running server'
+    arg_parser.add_argument('-s', '--socket', type=str, default='/tmp/aagg.sock', help='Path of the Unix socket')
+    arg_parser.add_argument('-w', '--workers', type=int, default=4, help='Number of requests handled at a time')
+    arg_parser.add_argument('--plan-cache-size', type=int, default=constants.PLAN_CACHE_SIZE,
+                            help='Number of rule shapes whose rewrite analysis is cached across requests')
+    arg_parser.add_argument('--rewrite', type=str, nargs='+', default=[], metavar='ENCODING',
+                            help='Instead of serving, send the given encodings to the server and print the ' +
+                                 'rewritten program')
+    arg_parser.add_argument('--options', type=str, default='{}',
+                            help='JSON options of the request sent with --rewrite')
+    arg_parser.add_argument('--shutdown', action='store_true', help='Ask the server to shut down')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    define_args(parser)
+    args = parser.parse_args()
+
+    if args.shutdown:
+        send(args.socket, {'command': 'shutdown'})
+    elif args.rewrite:
+        program = ''
+        for encoding in args.rewrite:
+            with open(encoding) as enc:
+                program += enc.read()
+        reply = send(args.socket, {'program': program, 'options': json.loads(args.options)})
+        if reply['status'] != 'ok':
+            sys.stderr.write(reply['error'] + "\n")
+            sys.exit(1)
+        sys.stdout.write(reply['program'])
+        for warning in reply['warnings']:
+            sys.stderr.write(warning + "\n")
+    else:
+        sys.stdout = open(os.devnull, 'w')  # Request handling never writes to the client through stdout
+        serve(args.socket, args.workers, args.plan_cache_size)
@@ -0,0 +1,219 @@
+class PredicateDependencyGraph:
+    """
+        Reachability index over the predicate dependency graph.
+        Predicates are interned to integer ids with compact adjacency
+            lists. The graph is condensed into its strongly connected
+            components once, and the transitive closure of the
+            condensation is stored as one bitset per component, so each
+            dependency query is O(1)
+    """
+
+    def __init__(self, predicate_adjacency_list=None):
+        self.predicate_ids = {}
+        self.predicates = []
+        self.adjacency = []
+        self.component = []
+        self.reach = []
+
+        if predicate_adjacency_list is not None:
+            for predicate_head, predicate_bodies in predicate_adjacency_list.items():
+                head_id = self.intern(predicate_head)
+                body_ids = set(self.intern(predicate_body) for predicate_body in predicate_bodies)
+                self.adjacency[head_id] = tuple(sorted(body_ids.union(self.adjacency[head_id])))
+            self.build_index()
+
+    def intern(self, predicate):
+        """Returns the integer id of the predicate, assigning one if needed"""
+        predicate_id = self.predicate_ids.get(predicate)
+        if predicate_id is None:
+            predicate_id = len(self.predicates)
+            self.predicate_ids[predicate] = predicate_id
+            self.predicates.append(predicate)
+            self.adjacency.append(())
+        return predicate_id
+
+    def build_index(self):
+        """
+            Condenses the graph with an iterative version of Tarjan's
+                algorithm. Components are completed in reverse
+                topological order, so the reachability bitset of a
+                component is final once every component it reaches is
+        """
+        size = len(self.predicates)
+        index = [-1] * size
+        low_link = [0] * size
+        on_stack = [False] * size
+        stack = []
+        counter = 0
+
+        self.component = [-1] * size
+        self.reach = []
+
+        for root in range(size):
+            if index[root] != -1:
+                continue
+            index[root] = low_link[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, 0)]
+
+            while work:
+                node, position = work[-1]
+                successors = self.adjacency[node]
+                if position < len(successors):
+                    work[-1] = (node, position + 1)
+                    successor = successors[position]
+                    if index[successor] == -1:
+                        index[successor] = low_link[successor] = counter
+                        counter += 1
+                        stack.append(successor)
+                        on_stack[successor] = True
+                        work.append((successor, 0))
+                    elif on_stack[successor]:
+                        low_link[node] = min(low_link[node], index[successor])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[node])
+
+                if low_link[node] == index[node]:
+                    component_id = len(self.reach)
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        self.component[member] = component_id
+                        members.append(member)
+                        if member == node:
+                            break
+
+                    reach = 1 << component_id
+                    for member in members:
+                        for successor in self.adjacency[member]:
+                            successor_component = self.component[successor]
+                            if successor_component != component_id:
+                                reach |= self.reach[successor_component]
+                    self.reach.append(reach)
+
+    def depends_on(self, predicate1, predicate2):
+        """
+            Given two predicates.
+            Returns True if predicate1 is dependent (directly or indirectly)
+                on predicate2. Every predicate depends on itself
+        """
+        if predicate1 == predicate2:
+            return True
+
+        id1 = self.predicate_ids.get(predicate1)
+        id2 = self.predicate_ids.get(predicate2)
+        if id1 is None or id2 is None:
+            return False
+
+        return (self.reach[self.component[id1]] >> self.component[id2]) & 1 == 1
+
+
+class IncrementalDependencyGraph:
+    """
+        Predicate dependency graph which is updated edge by edge, as rules
+            are added to and removed from a program (see session.py).
+        Edges are reference counted by the rules they come from. The
+            reachability of each predicate is kept as a bitset of
+            predicate ids: adding an edge extends the bitsets of the
+            predicates reaching its head, and removing one recomputes
+            the bitsets of those predicates only
+    """
+
+    def __init__(self):
+        self.predicate_ids = {}
+        self.predicates = []
+        self.successors = []  # Per predicate id, a map of successor id to the number of rules with that edge
+        self.reach = []  # Per predicate id, the bitset of the ids it reaches (itself included)
+
+    def intern(self, predicate):
+        """Returns the integer id of the predicate, assigning one if needed"""
+        predicate_id = self.predicate_ids.get(predicate)
+        if predicate_id is None:
+            predicate_id = len(self.predicates)
+            self.predicate_ids[predicate] = predicate_id
+            self.predicates.append(predicate)
+            self.successors.append({})
+            self.reach.append(1 << predicate_id)
+        return predicate_id
+
+    def reaching(self, predicate_id):
+        """Returns the ids of the predicates which reach the given one"""
+        return [node for node in range(len(self.predicates)) if (self.reach[node] >> predicate_id) & 1]
+
+    def add_edge(self, head_predicate, body_predicate):
+        """
+            Given the head predicate and a body predicate of a rule.
+            Adds the dependency of the head on the body predicate
+            Returns the set of predicates whose reachability grew
+        """
+        head_id = self.intern(head_predicate)
+        body_id = self.intern(body_predicate)
+        count = self.successors[head_id].get(body_id, 0)
+        self.successors[head_id][body_id] = count + 1
+        if count > 0 or (self.reach[head_id] >> body_id) & 1:
+            return set()
+
+        # A predicate reaching the head now reaches whatever the body predicate reaches
+        added = self.reach[body_id]
+        grown = set()
+        for node in self.reaching(head_id):
+            if added & ~self.reach[node]:
+                self.reach[node] |= added
+                grown.add(self.predicates[node])
+        return grown
+
+    def remove_edge(self, head_predicate, body_predicate):
+        """
+            Given the head predicate and a body predicate of a removed rule.
+            Removes the rule's dependency of the head on the body predicate
+            Returns the set of predicates whose reachability shrank
+        """
+        head_id = self.predicate_ids[head_predicate]
+        body_id = self.predicate_ids[body_predicate]
+        count = self.successors[head_id][body_id]
+        if count > 1:
+            self.successors[head_id][body_id] = count - 1
+            return set()
+        del self.successors[head_id][body_id]
+
+        # Only the predicates which reached the head may have used the edge.
+        #   Their bitsets are recomputed as the least fixpoint from their successors
+        affected = self.reaching(head_id)
+        previous = dict((node, self.reach[node]) for node in affected)
+        for node in affected:
+            self.reach[node] = 1 << node
+        changed = True
+        while changed:
+            changed = False
+            for node in affected:
+                reach = self.reach[node]
+                for successor in self.successors[node]:
+                    reach |= self.reach[successor]
+                if reach != self.reach[node]:
+                    self.reach[node] = reach
+                    changed = True
+
+        return set(self.predicates[node] for node in affected if self.reach[node] != previous[node])
+
+    def depends_on(self, predicate1, predicate2):
+        """
+            Given two predicates.
+            Returns True if predicate1 is dependent (directly or indirectly)
+                on predicate2. Every predicate depends on itself
+        """
+        if predicate1 == predicate2:
+            return True
+
+        id1 = self.predicate_ids.get(predicate1)
+        id2 = self.predicate_ids.get(predicate2)
+        if id1 is None or id2 is None:
+            return False
+
+        return (self.reach[id1] >> id2) & 1 == 1
@@ -0,0 +1,404 @@
+import clingo
+import gzip
+import constants
+from source import SourceSpan
+
+ast = clingo.ast
+
+# Gringo syntax of the operators and signs of AST nodes, by enumeration member
+COMPARISON_OPERATORS = {
+    ast.ComparisonOperator.GreaterThan: '>',
+    ast.ComparisonOperator.LessThan: '<',
+    ast.ComparisonOperator.LessEqual: '<=',
+    ast.ComparisonOperator.GreaterEqual: '>=',
+    ast.ComparisonOperator.NotEqual: '!=',
+    ast.ComparisonOperator.Equal: '=',
+}
+
+BINARY_OPERATORS = {
+    ast.BinaryOperator.XOr: '^',
+    ast.BinaryOperator.Or: '?',
+    ast.BinaryOperator.And: '&',
+    ast.BinaryOperator.Plus: '+',
+    ast.BinaryOperator.Minus: '-',
+    ast.BinaryOperator.Multiplication: '*',
+    ast.BinaryOperator.Division: '/',
+    ast.BinaryOperator.Modulo: '\\',
+    ast.BinaryOperator.Power: '**',
+}
+
+SIGNS = {
+    ast.Sign.NoSign: '',
+    ast.Sign.Negation: 'not ',
+    ast.Sign.DoubleNegation: 'not not ',
+}
+
+AGGREGATE_FUNCTIONS = {
+    ast.AggregateFunction.Count: '#count',
+    ast.AggregateFunction.Sum: '#sum',
+    ast.AggregateFunction.SumPlus: '#sum+',
+    ast.AggregateFunction.Min: '#min',
+    ast.AggregateFunction.Max: '#max',
+}
+
+# Per ASTType, the emitter method for nodes of that type (None if nodes are emitted by str())
+emit_methods = {}
+
+
+def emit_method(ast_type):
+    """
+        Given an ASTType.
+        Returns the method of GringoEmitter named emit_<ASTType>, or None.
+            The name is built and looked up only once per ASTType
+    """
+    try:
+        return emit_methods[ast_type]
+    except KeyError:
+        method = getattr(GringoEmitter, "emit_" + str(ast_type), None)
+        emit_methods[ast_type] = method
+        return method
+
+
+def open_output(path, compress=False):
+    """
+        Given the path of an output file and whether to compress it.
+        Returns the file opened for writing, with a buffer of
+            constants.OUTPUT_BUFFER_SIZE bytes, or gzip compressed
+    """
+    if compress:
+        return gzip.open(path, 'wb', constants.GZIP_LEVEL)
+    return open(path, 'w', constants.OUTPUT_BUFFER_SIZE)
+
+
+class GringoEmitter(object):
+    """
+        Writes the Gringo syntax of statements directly from their AST
+            nodes, rather than through their __str__ methods, so that
+            the AST objects of the ASTReplacer are not needed for output.
+        Nodes of types without an emit method (theory and CSP nodes,
+            scripts) are written by their __str__ method
+    """
+
+    def emit(self, x):
+        """
+            Given an AST node.
+            Returns its Gringo syntax
+        """
+        method = emit_method(x.type)
+        if method is None:
+            return "%s" % x
+        return method(self, x)
+
+    def emit_list(self, xs, separator):
+        return separator.join([self.emit(x) for x in xs])
+
+    def emit_body(self, body):
+        # Literals of a body are separated by ';', as ',' also separates the conditions of conditional literals
+        return "; ".join([self.emit(literal) for literal in body])
+
+    def emit_guarded(self, aggregate, elements):
+        """
+            Given an aggregate and the syntax of its function and
+                elements.
+            Returns the syntax of the aggregate with its guards
+        """
+        if aggregate.left_guard is not None:
+            left_guard = aggregate.left_guard
+            elements = "%s %s %s" % (self.emit(left_guard.term), COMPARISON_OPERATORS[left_guard.comparison],
+                                     elements)
+        if aggregate.right_guard is not None:
+            right_guard = aggregate.right_guard
+            elements = "%s %s %s" % (elements, COMPARISON_OPERATORS[right_guard.comparison],
+                                     self.emit(right_guard.term))
+        return elements
+
+    # Terms
+    # Must be named with capital letter to match the class name
+    # noinspection PyPep8Naming
+    def emit_Id(self, identifier):
+        return identifier.id
+
+    # noinspection PyPep8Naming
+    def emit_Variable(self, variable):
+        return variable.name
+
+    # noinspection PyPep8Naming
+    def emit_Symbol(self, symbol):
+        return "%s" % symbol.symbol
+
+    # noinspection PyPep8Naming
+    def emit_UnaryOperation(self, operation):
+        argument = self.emit(operation.argument)
+        operator = operation.operator
+        if operator == ast.UnaryOperator.Absolute:
+            return "|%s|" % argument
+        elif operator == ast.UnaryOperator.Negation:
+            return "~%s" % argument
+        elif argument.startswith('-'):
+            return "-(%s)" % argument
+        return "-%s" % argument
+
+    # noinspection PyPep8Naming
+    def emit_BinaryOperation(self, operation):
+        right = self.emit(operation.right)
+        if right.startswith('-'):
+            right = "(%s)" % right
+        return "(%s%s%s)" % (self.emit(operation.left), BINARY_OPERATORS[operation.operator], right)
+
+    # noinspection PyPep8Naming
+    def emit_Interval(self, interval):
+        return "(%s..%s)" % (self.emit(interval.left), self.emit(interval.right))
+
+    # noinspection PyPep8Naming
+    def emit_Function(self, function):
+        name = "@" + function.name if function.external else function.name
+        arguments = function.arguments
+        if len(arguments) == 0:
+            return name if name else "()"
+        elif not name and len(arguments) == 1:
+            return "(%s,)" % self.emit(arguments[0])
+        return "%s(%s)" % (name, self.emit_list(arguments, ","))
+
+    # noinspection PyPep8Naming
+    def emit_Pool(self, pool):
+        """
+            Pools of functions of the same name, as parsed from pools in
+                the arguments of a function, are written that way:
+                        p(1;2)
+                instead of
+                        (p(1);p(2))
+                which is not valid as an atom
+        """
+        arguments = pool.arguments
+        first = arguments[0]
+        if first.type == ast.ASTType.Function and first.name and len(first.arguments) > 0 and \
+                all(argument.type == ast.ASTType.Function and argument.name == first.name and
+                    argument.external == first.external and len(argument.arguments) > 0
+                    for argument in arguments):
+            name = "@" + first.name if first.external else first.name
+            return "%s(%s)" % (name, ";".join([self.emit_list(argument.arguments, ",") for argument in arguments]))
+        return "(%s)" % self.emit_list(arguments, ";")
+
+    # Literals
+    # noinspection PyPep8Naming
+    def emit_BooleanConstant(self, constant):
+        return "#true" if constant.value else "#false"
+
+    # noinspection PyPep8Naming
+    def emit_SymbolicAtom(self, atom):
+        return self.emit(atom.term)
+
+    # noinspection PyPep8Naming
+    def emit_Comparison(self, comparison):
+        return "%s%s%s" % (self.emit(comparison.left), COMPARISON_OPERATORS[comparison.comparison],
+                           self.emit(comparison.right))
+
+    # noinspection PyPep8Naming
+    def emit_Literal(self, literal):
+        return SIGNS[literal.sign] + self.emit(literal.atom)
+
+    # noinspection PyPep8Naming
+    def emit_ConditionalLiteral(self, conditional_literal):
+        if len(conditional_literal.condition) == 0:
+            return self.emit(conditional_literal.literal)
+        return "%s : %s" % (self.emit(conditional_literal.literal), self.emit_list(conditional_literal.condition, ", "))
+
+    # noinspection PyPep8Naming
+    def emit_Aggregate(self, aggregate):
+        return self.emit_guarded(aggregate, "{ %s }" % self.emit_list(aggregate.elements, "; "))
+
+    # noinspection PyPep8Naming
+    def emit_BodyAggregateElement(self, element):
+        if len(element.condition) == 0:
+            return self.emit_list(element.tuple, ",")
+        return "%s : %s" % (self.emit_list(element.tuple, ","), self.emit_list(element.condition, ", "))
+
+    # noinspection PyPep8Naming
+    def emit_BodyAggregate(self, aggregate):
+        return self.emit_guarded(aggregate, "%s { %s }" % (AGGREGATE_FUNCTIONS[aggregate.function],
+                                                           self.emit_list(aggregate.elements, "; ")))
+
+    # noinspection PyPep8Naming
+    def emit_HeadAggregateElement(self, element):
+        return "%s : %s" % (self.emit_list(element.tuple, ","), self.emit(element.condition))
+
+    # noinspection PyPep8Naming
+    def emit_HeadAggregate(self, aggregate):
+        return self.emit_guarded(aggregate, "%s { %s }" % (AGGREGATE_FUNCTIONS[aggregate.function],
+                                                           self.emit_list(aggregate.elements, "; ")))
+
+    # noinspection PyPep8Naming
+    def emit_Disjunction(self, disjunction):
+        return self.emit_list(disjunction.elements, "; ")
+
+    # Statements
+    # noinspection PyPep8Naming
+    def emit_Rule(self, rule):
+        if len(rule.body) == 0:
+            return "%s." % self.emit(rule.head)
+        return "%s :- %s." % (self.emit(rule.head), self.emit_body(rule.body))
+
+    # noinspection PyPep8Naming
+    def emit_Definition(self, definition):
+        """
+            Constants are defaults unless overridden, so only an
+                overriding definition is annotated
+        """
+        if definition.is_default:
+            return "#const %s = %s." % (definition.name, self.emit(definition.value))
+        return "#const %s = %s. [override]" % (definition.name, self.emit(definition.value))
+
+    # noinspection PyPep8Naming
+    def emit_ShowSignature(self, show_signature):
+        """
+            When we encounter a show signature with no name, we write
+                        #show.
+                instead of
+                        #show /0.
+        """
+        if show_signature.csp:
+            return "%s" % show_signature
+        elif show_signature.name == '':
+            return "#show."
+        sign = '' if getattr(show_signature, 'positive', True) else '-'
+        return "#show %s%s/%d." % (sign, show_signature.name, show_signature.arity)
+
+    # noinspection PyPep8Naming
+    def emit_ShowTerm(self, show_term):
+        if show_term.csp:
+            return "%s" % show_term
+        elif len(show_term.body) == 0:
+            return "#show %s." % self.emit(show_term.term)
+        return "#show %s : %s." % (self.emit(show_term.term), self.emit_body(show_term.body))
+
+    # noinspection PyPep8Naming
+    def emit_Minimize(self, minimize):
+        """
+            Written as a weak constraint, or as a minimize statement
+                when its body is empty, as weak constraints need a body
+        """
+        weight = "%s@%s%s" % (self.emit(minimize.weight), self.emit(minimize.priority),
+                              "".join(["," + self.emit(term) for term in minimize.tuple]))
+        if len(minimize.body) == 0:
+            return "#minimize { %s }." % weight
+        return ":~ %s. [%s]" % (self.emit_body(minimize.body), weight)
+
+    # noinspection PyPep8Naming
+    def emit_Program(self, program):
+        if len(program.parameters) == 0:
+            return "#program %s." % program.name
+        return "#program %s(%s)." % (program.name, self.emit_list(program.parameters, ","))
+
+    # noinspection PyPep8Naming
+    def emit_External(self, external):
+        statement = "#external %s" % self.emit(external.atom)
+        if len(external.body) > 0:
+            statement += " : " + self.emit_body(external.body)
+        external_type = getattr(external, 'external_type', None)  # Not present before clingo 5.5
+        if external_type is not None:
+            return "%s. [%s]" % (statement, self.emit(external_type))
+        return statement + "."
+
+    # noinspection PyPep8Naming
+    def emit_Edge(self, edge):
+        statement = "#edge (%s,%s)" % (self.emit(edge.u), self.emit(edge.v))
+        if len(edge.body) > 0:
+            statement += " : " + self.emit_body(edge.body)
+        return statement + "."
+
+    # noinspection PyPep8Naming
+    def emit_Heuristic(self, heuristic):
+        statement = "#heuristic %s" % self.emit(heuristic.atom)
+        if len(heuristic.body) > 0:
+            statement += " : " + self.emit_body(heuristic.body)
+        return "%s. [%s@%s,%s]" % (statement, self.emit(heuristic.bias), self.emit(heuristic.priority),
+                                   self.emit(heuristic.modifier))
+
+    # noinspection PyPep8Naming
+    def emit_ProjectAtom(self, project_atom):
+        statement = "#project %s" % self.emit(project_atom.atom)
+        if len(project_atom.body) > 0:
+            statement += " : " + self.emit_body(project_atom.body)
+        return statement + "."
+
+    # noinspection PyPep8Naming
+    def emit_ProjectSignature(self, project_signature):
+        sign = '' if getattr(project_signature, 'positive', True) else '-'
+        return "#project %s%s/%d." % (sign, project_signature.name, project_signature.arity)
+
+    # noinspection PyPep8Naming
+    def emit_Defined(self, defined):
+        sign = '' if getattr(defined, 'positive', True) else '-'
+        return "#defined %s%s/%d." % (sign, defined.name, defined.arity)
+
+
+class StatementWriter(object):
+    """
+        Writes statements to an output file through a GringoEmitter.
+            Statements are collected and written in chunks of about
+            constants.OUTPUT_BUFFER_SIZE characters, as a write per
+            statement is slow (in particular when compressing)
+        Statements given as a SourceSpan are copied from the program
+            text along with the text (comments) preceding them, unless
+            rewritten; the text after the last statement is copied by
+            finish
+    """
+
+    def __init__(self, out_fd, buffer_size=constants.OUTPUT_BUFFER_SIZE):
+        self.out_fd = out_fd
+        self.emitter = GringoEmitter()
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+        self.source = None  # SourceText copied from, and the offset up to which it was copied
+        self.position = 0
+
+    def write(self, statement):
+        if isinstance(statement, SourceSpan):
+            self.write_span(statement)
+        else:
+            self.write_text(self.emitter.emit(statement) + "\n")
+
+    def write_span(self, span):
+        if span.source is not self.source:
+            self.finish_source()
+            self.source = span.source
+            self.position = 0
+
+        # Text between statements is copied even if the statement is rewritten
+        self.write_text(self.source.text[self.position:span.begin])
+        if span.rewritten:
+            self.write_text("\n".join([self.emitter.emit(statement) for statement in span.statements]))
+            self.position = self.source.statement_end(span.end)
+        else:
+            self.write_text(self.source.text[span.begin:span.end])
+            self.position = span.end
+
+    def write_text(self, text):
+        if len(text) > 0:
+            self.buffer.append(text)
+            self.buffered += len(text)
+            if self.buffered >= self.buffer_size:
+                self.flush()
+
+    def write_all(self, statements):
+        for statement in statements:
+            self.write(statement)
+        self.finish()
+
+    def finish_source(self):
+        if self.source is not None:
+            self.write_text(self.source.text[self.position:])
+            self.source = None
+            self.position = 0
+
+    def finish(self):
+        """Writes the rest of the program text copied from, then flushes"""
+        self.finish_source()
+        self.flush()
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.out_fd.write("".join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
@@ -1,9 +1,44 @@
 import clingo
+import collections
 import constants
-from tree_data import TreeData
+from tree_data import BODY_DATA, HEAD_DATA
+from ast_visitor import ASTFusedVisitor
 from variable_counter import VariableCounter
-from ast_visitor import ASTCopier
-from predicate import Predicate, predicate_dependency
+from rule_journal import RuleEditJournal
+from predicate import Predicate
+from rewrite_plan import RewritePlan
+from cost_model import rule_features
+
+
+def is_rewrite_candidate(rule):
+    """
+        Screens a rule before the full rewritability analysis
+        A rewritable rule has, at the top level of its body, at least two
+            positive literals of functions with arguments (the counting
+            functions) and one non-equality comparison
+        Returns False if the rule can certainly not be rewritten
+    """
+    function_literals = 0
+    comparison_literals = 0
+    for body_literal in rule['body']:
+        if body_literal.type != clingo.ast.ASTType.Literal:
+            continue
+
+        atom = body_literal['atom']
+        if atom.type == clingo.ast.ASTType.Comparison:
+            if atom['comparison'] != clingo.ast.ComparisonOperator.Equal:
+                comparison_literals += 1
+        elif atom.type == clingo.ast.ASTType.SymbolicAtom and \
+                body_literal.sign != clingo.ast.Sign.Negation and \
+                body_literal.sign != clingo.ast.Sign.DoubleNegation and \
+                atom['term'].type == clingo.ast.ASTType.Function and \
+                len(atom['term']['arguments']) > 0:
+            function_literals += 1
+
+        if function_literals >= 2 and comparison_literals >= 1:
+            return True
+
+    return False
 
 
 def get_function_counting_literals(rule, counting_vars):
@@ -29,67 +64,29 @@ def get_function_counting_literals(rule, counting_vars):
                         len(body_literal['atom']['term']['arguments']) > 0:
                     potential_literals.append(body_literal)
 
-    # Check exactly one counting variable appears in each potential function
-    for lit in potential_literals:
-        occurrences = 0
-        for var in counting_vars:
-            for lit_var in lit['atom']['term']['arguments']:
-                # Comparing string representations avoids AttributeErrors
-                if str(lit_var) == str(var):
-                    occurrences = occurrences + 1
-        if occurrences != 1:
-            potential_literals.remove(lit)
-    if len(potential_literals) < 1:
-        return []
-
-    # Check that all potential functions are identical and have the same length
-    for lit1 in potential_literals:
-        func1 = str(lit1).split("(")[0]
-        func1_arg_len = len(lit1['atom']['term']['arguments'])
-        for lit2 in potential_literals:
-            # This loop also compares each literal to itself and repeats
-            #     comparisons, but this is trivial
-            func2 = str(lit2).split("(")[0]
-            func2_arg_len = len(lit2['atom']['term']['arguments'])
-            if func1 != func2 or func1_arg_len != func2_arg_len:
-                return []
-
-    # Get the position of the counting variable in each of the potential
-    #      counting literals
-    position = -1
-    lit_args = potential_literals[0]['atom']['term']['arguments']
-    for var in counting_vars:
-        if position != -1:
-            break
-
-        for i in range(len(lit_args)):
-            if str(var) == str(lit_args[i]):
-                position = i
-                break
-
-    # Then use that position to verify the location of the counting
-    #    variable is the same for the for all the potential literals
+    # Keep the potential functions in which exactly one counting variable appears
+    potential_literals = [lit for lit in potential_literals
+                          if sum(1 for lit_var in lit['atom']['term']['arguments'] for var in counting_vars
+                                 # Comparing string representations avoids AttributeErrors
+                                 if str(lit_var) == str(var)) == 1]
+
+    # Group the potential functions by name, arity, position of the counting
+    #    variable and non-counting arguments. The counting literals are the
+    #    first group holding a literal of every counting variable; the
+    #    literals of other groups may be moved into the aggregate condition
+    families = collections.OrderedDict()
     for lit in potential_literals:
-        lit_var = lit['atom']['term']['arguments'][position]
-        positional_occurrence = False
-        for countVar in counting_vars:
-            if str(lit_var) == str(countVar):
-                positional_occurrence = True
-        if not positional_occurrence:
-            return []
-
-    # Verify the non-counting variables are identical in all potential literals
-    non_count_args = potential_literals[0]['atom']['term']['arguments'][:]
-    non_count_args.remove(non_count_args[position])
-    for otherLit in potential_literals:
-
-        lit_args = otherLit['atom']['term']['arguments'][:]
-        lit_args.remove(lit_args[position])
+        lit_args = lit['atom']['term']['arguments']
+        position = [i for i, lit_var in enumerate(lit_args) if str(lit_var) in counting_vars][0]
+        key = (lit['atom']['term']['name'], len(lit_args), position,
+               tuple(str(lit_var) for i, lit_var in enumerate(lit_args) if i != position))
+        families.setdefault(key, []).append(lit)
 
-        if cmp(non_count_args, lit_args) != 0:  # returns 0 for equality
-            return []
-
-    return potential_literals
+    for (_, _, position, _), family in families.items():
+        if set(str(lit['atom']['term']['arguments'][position]) for lit in family) == \
+                set(str(var) for var in counting_vars):
+            return family
+    return []
 
 
 def get_comparison_counting_literals(rule, counting_vars):
@@ -187,6 +184,18 @@ def get_counting_function_args(counting_function, counting_vars):
     return reg_args, ret_var, anon_args
 
 
+class SharedProjection:
+    """
+        A projection predicate whose auxiliary rule, written with the
+            rewrite which introduced it, serves every later rewrite which
+            projects the same counting function in the same way
+    """
+
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self.users = 1  # Rewrites using the projection, including the one which introduced it
+
+
 class EquivalenceTransformer:
     """
         This class is the basis for detecting and performing equivalence
@@ -200,71 +209,201 @@ class EquivalenceTransformer:
         self.variable_counter = VariableCounter()
         self.aux_rule = None
         self.aux_predicate = None
-        self.rule_functions = []
+        self.projection_key = None  # Key of the SharedProjection the rewrite uses, if any
+        self.journal = None
+        self.slot_variables = {}  # 'head' or body position: names of the variables occurring there
+        self.current_slot = None
+        self.head_predicates = []
         self.counting_literals = []
+        self.condition_literals = []  # Literals moved into the condition of the aggregate element
         self.counting_variables = []
+        self.aggregate_form = None
+        self.equiv_output_forms = []  # Valid output forms, as determined by transform
+        self.gain = None  # Estimated gain of the rewrite in the chosen form, if any
+        self.rule_original = None  # The rule as it was before transform rewrote it
+        self.plan = RewritePlan()
+
+    def analyze(self):
+        """
+            Explores the rule and checks its rewritability without
+                rewriting it
+            Returns the RewritePlan of the rule
+        """
+        with self.base_transformer.tracer.span('explore rule'):
+            self.explore(self.rule)
+        self.rewritable_forms()
+        return self.plan
 
-    def process(self):
+    def apply_plan(self, plan):
+        """
+            Given a RewritePlan computed for this rule (possibly by
+                another process), restores the counting literal and
+                variable information the plan describes
+            Returns the list of valid output forms of the plan
+        """
+        self.plan = plan
+        self.counting_literals = [self.rule['body'][position] for position in plan.literal_positions]
+        self.condition_literals = [self.rule['body'][position] for position in plan.condition_positions]
+        self.counting_variables = list(plan.counting_variables)
+        return list(plan.valid_forms)
+
+    def process(self, plan=None):
         """
             Processes a rule to perform rewriting
+            If a RewritePlan is given, the rule is not analyzed again
+        """
+        self.transform(plan)
+        self.report()
+
+    def transform(self, plan=None):
+        """
+            First part of process: analyzes the rule (unless a RewritePlan
+                is given), chooses its form and rewrites it, without any
+                output or user interaction, so that it can be timed
         """
         if self.base_transformer.Setting.DEBUG:
             print "equivalence_transformer: processing rule:  %s" % self.rule
 
-        rule_original = ASTCopier().deep_copy(self.rule)  # For resetting rule if rewrite is denied by user
-        self.rule = self.explore(self.rule)  # Garners information for rewritability checking
-        equiv_output_forms = self.rewritable_forms()  # Determines available output forms for this rule
+        tracer = self.base_transformer.tracer
+        if plan is None:
+            with tracer.span('explore rule'):
+                self.explore(self.rule)  # Garners information for rewritability checking
+            self.equiv_output_forms = self.rewritable_forms()  # Determines available output forms for this rule
+        else:
+            self.equiv_output_forms = self.apply_plan(plan)
 
         if self.base_transformer.Setting.DEBUG:
-            print "equivalence_transformer: valid output forms:  " + str(equiv_output_forms)
+            print "equivalence_transformer: valid output forms:  " + str(self.equiv_output_forms)
+
+        self.aggregate_form = self.choose_form(self.equiv_output_forms)
+        self.gain = self.estimated_gain() if self.aggregate_form in self.equiv_output_forms else None
+        if self.gain is not None and self.gain <= self.base_transformer.Setting.MIN_GAIN:
+            self.base_transformer.gated_rewrites += 1
 
-        if self.base_transformer.Setting.AGGR_FORM in equiv_output_forms:
-            self.rewrite_rule()
-            self.print_rewrite(rule_original)
-            self.confirm_rewrite(rule_original)  # Undoes rewriting if user denies rewrite
+        elif self.aggregate_form in self.equiv_output_forms:
+            self.rule_original = "%s" % self.rule
+            with tracer.span('rewrite', form=self.aggregate_form):
+                self.rewrite_rule()
 
-        elif len(equiv_output_forms) > 0:
+    def report(self):
+        """
+            Second part of process: prints the outcome of transform and,
+                if the rule was rewritten, asks the user to confirm the
+                rewrite (see confirm_rewrite)
+        """
+        if self.gain is not None and self.gain <= self.base_transformer.Setting.MIN_GAIN:
+            if not self.base_transformer.Setting.QUIET:
+                print "Rule:  %s\n\nNot rewritten, as its estimated ground size only shrinks by a factor of %.2f." % \
+                      (self.rule, self.gain)
+
+        elif self.aggregate_form in self.equiv_output_forms:
+            self.print_rewrite(self.rule_original)
+            if self.confirm_rewrite():  # Undoes rewriting if user denies rewrite
+                self.base_transformer.rewrite_forms.append((len(self.counting_variables),
+                                                            self.projection_arity(),
+                                                            self.aggregate_form))
+                self.base_transformer.rewrite_report.append((self.rule_original, "%s" % self.rule,
+                                                             "%s" % self.aux_rule if self.aux_rule is not None
+                                                             else None))
+
+        elif len(self.equiv_output_forms) > 0:
             # Equivalent output forms exist, but not for the requested form.
             # Currently this only occurs for forms (2) and (3) because a cyclic dependency exists
-            print "Warning! Rule:  %s\n\nCould not be rewritten due to a cyclic dependency." % rule_original
+            warning = "Warning! Rule:  %s\n\nCould not be rewritten due to a cyclic dependency." % self.rule
+            self.base_transformer.warnings.append(warning)
+            if not self.base_transformer.Setting.QUIET:
+                print warning
 
-    def explore(self, x, data=TreeData()):
+    def projection_arity(self):
         """
-            Recursively traverse AST of the rule.
-            Record encountered comparisons and functions for use in
-                checking for potential rewritings of the rule
+            Returns the arity of the projection predicate the rewrite
+                introduces, or 0 if none is needed
         """
-        if isinstance(x, clingo.ast.AST):
-            # Record non-equality comparisons for use in rewritability checking
-            if x.type == clingo.ast.ASTType.Comparison:
-                if x['comparison'] != clingo.ast.ComparisonOperator.Equal:
-                    self.variable_counter.mark_comparison(x['left'], x['right'], x['comparison'])
-
-            # Record body functions for use in rewritability checking
-            elif x.type == clingo.ast.ASTType.Function:
-                if not data.head:
-                    self.rule_functions.append(x)
-
-            return self.explore_children(x, data)
+        counting_function = get_counting_function_from_literals(self.counting_literals)
+        arity = len(counting_function['arguments'])
+        return arity - 1 if arity > 1 else 0
 
-        elif isinstance(x, list):
-            return [self.explore(y, data) for y in x]
-        elif x is None:
-            return x
-        else:
-            raise TypeError("unexpected type")
+    def estimated_gain(self):
+        """
+            Returns the factor by which rewriting in the chosen form is
+                estimated to shrink the ground instances of the counting
+                literals (see GroundSizeEstimator), or None if there is
+                no estimate: no minimum gain was set, the counting
+                predicate has no facts, or rules of the program derive it
+        """
+        estimator = self.base_transformer.ground_estimator
+        if estimator is None:
+            return None
+        counting_function = get_counting_function_from_literals(self.counting_literals)
+        counting_predicate = Predicate(counting_function['name'], len(counting_function['arguments']))
+        if len(self.base_transformer.predicate_adjacency_list.get(counting_predicate, ())) > 0:
+            return None  # The facts of the instance are only part of its domain
+        return estimator.gain(counting_function, self.counting_variables, self.aggregate_form)
 
-    def explore_children(self, x, data=TreeData()):
-        for key in x.child_keys:
-            attr = self.explore(x[key], TreeData(data.head or key == "head"))
-            x[key] = attr
-        return x
+    def choose_form(self, equiv_output_forms):
+        """
+            Given the valid output forms of the rule.
+            Returns the form to rewrite the rule in: the form set by the
+                user, or with --aggregate-form auto, the valid form of
+                least cost according to the cost model (None if no form
+                is valid)
+        """
+        setting = self.base_transformer.Setting
+        if setting.AGGR_FORM != constants.AGGR_FORM_AUTO:
+            return setting.AGGR_FORM
+        if len(equiv_output_forms) == 0:
+            return None
+
+        features = rule_features(len(self.counting_variables), self.projection_arity(), setting.USE_ANON)
+        aggregate_form = self.base_transformer.cost_model.choose(equiv_output_forms, features)
+        if setting.DEBUG:
+            print "equivalence_transformer: estimated costs:  " + \
+                  ", ".join("(%d) %.3f" % (form, self.base_transformer.cost_model.cost(form, features))
+                            for form in sorted(equiv_output_forms)
+                            if form in self.base_transformer.cost_model.coefficients)
+        return aggregate_form
+
+    def explore(self, rule):
+        """
+            Traverses the AST of the rule once, without modifying it.
+            The analyses needed for checking rewritability are fused
+                into this single traversal:
+            Records encountered comparisons, the variables occurring in
+                the head and in each body literal, and (by the
+                ASTPredicateMapper) the head predicates
+        """
+        rule_mapper = self.base_transformer.rule_mapper
+        rule_mapper.begin_statement()
+        visitor = ASTFusedVisitor([self, rule_mapper])
+
+        self.current_slot = 'head'
+        self.slot_variables['head'] = set()
+        visitor.visit(rule['head'], HEAD_DATA)
+        for position, body_literal in enumerate(rule['body']):
+            self.current_slot = position
+            self.slot_variables[position] = set()
+            visitor.visit(body_literal, BODY_DATA)
+
+        self.head_predicates = list(rule_mapper.head_predicates)
+
+    # Must be named with capital letter to match the class name
+    # noinspection PyPep8Naming
+    def visit_Comparison(self, comparison, data=BODY_DATA):
+        # Record non-equality comparisons for use in rewritability checking
+        if comparison['comparison'] != clingo.ast.ComparisonOperator.Equal:
+            self.variable_counter.mark_comparison(comparison['left'], comparison['right'], comparison['comparison'])
+
+    # noinspection PyPep8Naming
+    def visit_Variable(self, variable, data=BODY_DATA):
+        self.slot_variables[self.current_slot].add(variable['name'])
 
     def print_rewrite(self, rule_before_rewriting):
         """
             Prints to console the rule before and after rewriting, and
-                an auxiliary rule, if any
+                an auxiliary rule, if any (unless in quiet mode)
         """
+        if self.base_transformer.Setting.QUIET:
+            return
         print "\nBefore rewriting: %s" % rule_before_rewriting
         print "After rewriting:  %s\n" % self.rule
         if self.aux_rule is not None:
@@ -272,65 +411,103 @@ class EquivalenceTransformer:
             print "Warning: This is not strongly equivalent for programs with " \
                   "rules or facts containing the predicate:  %s\n" % \
                   self.aux_predicate
+        elif self.aux_predicate is not None:
+            print "\t(Uses the Auxiliary Predicate of an Earlier Rewrite)  %s\n" % self.aux_predicate
 
-    def confirm_rewrite(self, rule_before_rewriting):
+    def confirm_rewrite(self):
         """
-            Given the rule before rewrite is performed.
             If rewriting is not confirmed by cli, prompts the user to
-                confirm the proposed rewrite and acts accordingly.
+                confirm the proposed rewrite and acts accordingly,
+                rolling back the edits of the rewrite if it is denied.
             Otherwise the rule is automatically confirmed.
+            Returns whether the rewrite is kept
         """
         if not self.base_transformer.Setting.CONFIRM_REWRITE:
             option = raw_input("Confirm rewriting (y/n) ").lower()
             if option == "n" or option == "no":
                 print("Rule rewriting denied.\n")
+                self.journal.rollback()
+                if self.projection_key is not None:
+                    projections = self.base_transformer.projections
+                    projections[self.projection_key].users -= 1
+                    if self.aux_rule is not None:  # The projection was introduced by this rewrite
+                        del projections[self.projection_key]
+                    self.projection_key = None
+                if self.aux_rule is not None:
+                    self.base_transformer.new_predicates.remove(self.aux_predicate)
                 self.aux_rule = None
-                self.rule = rule_before_rewriting
-                self.base_transformer.new_predicates.remove(self.aux_predicate)
+                self.aux_predicate = None
+                return False
             else:
                 print("Rule rewriting confirmed.\n")
+        return True
 
-    def counting_vars_used_elsewhere(self, check_rule, counting_literals, counting_vars):
-        """
-            Recursive wrapper for counting_vars_not_used_elsewhere_helper.
-            Checks if any of the given counting variable occurs within 
-                the given rule, not including the counting_literals
-            Returns true if an occurrence is found; false otherwise
-        """
-        for lit in counting_literals:
-            check_rule['body'].remove(lit)
-
-        return self.counting_vars_used_elsewhere_helper(check_rule, counting_vars)
-
-    def counting_vars_used_elsewhere_helper(self, node, counting_vars):
+    def condition_literal_positions(self, literal_positions, counting_vars):
         """
-            Recursively check children of all nodes in AST for 'arguments'
-                child key, then check 'arguments' for counting variables
-            Returns False if no occurrence
+            Finds the literals in which counting variables occur, other
+                than the counting literals at the given body positions.
+            Such literals are moved into the condition of the aggregate
+                element if they come in families: for a literal L(V) of
+                a single counting variable V, the body holds L(V) for
+                every counting variable, as q(X) and q(Y) in
+                    :- p(X), p(Y), q(X), q(Y), X < Y.
+                which is rewritten into
+                    :- 2 <= #count{ X : p(X), q(X) }.
+                and the other variables of L must be bound outside the
+                moved literals, so that they stay global
+            Uses the variables of each head and body literal recorded
+                by explore, so the rule is not traversed again
+            Returns the positions of the literals to move, or None if a
+                counting variable occurs in any other way
         """
-        if isinstance(node, clingo.ast.AST):
-
-            if node.type == clingo.ast.ASTType.Variable:
-                if str(node) in counting_vars:
-                    return True
-
-            # If a node does not have arguments but has children, check children
-            elif len(node.child_keys) > 0:
-                ret = False
-                for key in node.child_keys:
-                    ret = ret or self.counting_vars_used_elsewhere_helper(node[key], counting_vars)
-                return ret
-
-        elif isinstance(node, list):
-            ret = False
-            for entry in node:
-                ret = ret or self.counting_vars_used_elsewhere_helper(entry, counting_vars)
-            return ret
-
-        else:
-            raise TypeError("unexpected type")
-
-    def circular_dependencies(self, counting_predicate):
+        for var in counting_vars:
+            if var in self.slot_variables['head']:
+                return None
+
+        canonicalizer = self.base_transformer.canonicalizer
+        families = collections.OrderedDict()  # Template of a family: positions of its literals by counting variable
+        for position, body_literal in enumerate(self.rule['body']):
+            if position in literal_positions:
+                continue
+            occurring = [var for var in counting_vars if var in self.slot_variables[position]]
+            if len(occurring) == 0:
+                continue
+            if len(occurring) > 1 or body_literal.type != clingo.ast.ASTType.Literal or \
+                    body_literal['atom'].type not in (clingo.ast.ASTType.SymbolicAtom, clingo.ast.ASTType.Comparison):
+                return None
+
+            # Literals of a family are identical up to their counting variable
+            shape, variable_names = canonicalizer.canonicalize(body_literal)
+            template = (shape, tuple(None if name == occurring[0] else name for name in variable_names))
+            families.setdefault(template, {}).setdefault(occurring[0], []).append(position)
+
+        moved_positions = set(position for members in families.values() for positions in members.values()
+                              for position in positions)
+        bound_variables = set()
+        for position, body_literal in enumerate(self.rule['body']):
+            if position in literal_positions or (position not in moved_positions and
+                                                 body_literal.type == clingo.ast.ASTType.Literal and
+                                                 body_literal.sign == clingo.ast.Sign.NoSign and
+                                                 body_literal['atom'].type == clingo.ast.ASTType.SymbolicAtom):
+                bound_variables.update(self.slot_variables[position])
+
+        for (_, variable_names), members in families.items():
+            if set(members.keys()) != set(counting_vars):
+                return None
+            for name in variable_names:
+                if name is not None and name not in bound_variables:
+                    return None
+
+        return sorted(moved_positions)
+
+    def condition_predicates(self, condition_literals):
+        """Returns the predicates of the atoms among the given condition literals"""
+        return [Predicate(literal['atom']['term']['name'], len(literal['atom']['term']['arguments']))
+                for literal in condition_literals
+                if literal['atom'].type == clingo.ast.ASTType.SymbolicAtom and
+                literal['atom']['term'].type == clingo.ast.ASTType.Function]
+
+    def circular_dependencies(self, counting_predicate, condition_predicates, head_predicates):
         """
             Certain output forms for a rewriting are equivalent only if the
                 predicates in the body of the input rule are not dependent 
@@ -340,34 +517,20 @@ class EquivalenceTransformer:
                 a rule in which y is in the body. Ex:
                         "x(A) :- y(A)."
                 However, the dependency property is transitive across predicates.
-            Given a predicate, the counting predicate.
-            Returns True if the counting predicate depends on any
-                predicate in the head of the rule
+            Given the counting predicate, the predicates of the condition
+                literals, which are moved into the aggregate with it, and
+                the head predicates of the rule.
+            Returns True if the counting predicate or a condition
+                predicate depends on any predicate in the head of the rule
         """
-        for head_predicate in self.get_head_predicates():
-            if predicate_dependency(
-                    self.base_transformer.predicate_adjacency_list,
-                    counting_predicate,
-                    head_predicate):
-                return True
+        dependency_graph = self.base_transformer.dependency_graph
+        for head_predicate in head_predicates:
+            for predicate in [counting_predicate] + condition_predicates:
+                if dependency_graph.depends_on(predicate, head_predicate):
+                    return True
 
         return False
 
-    def get_head_predicates(self):
-        """
-            Uses the ASTPredicateMapper to get the predicate map for the 
-                current rule. (slightly overkill)
-            From the predicate map, returns a list of the predicates in 
-                the head of the current rule
-        """
-        # generate a new map from the current rule
-        self.base_transformer.predicate_mapper.clear_map()
-        self.base_transformer.predicate_mapper.map_rule_predicates(self.rule)
-        predicate_map = self.base_transformer.predicate_mapper.predicate_map
-
-        # head predicates will be the only predicates with dependencies
-        return predicate_map.keys()
-
     def rewritable_forms(self):
         """
             Checks if the rule meets conditions to be rewritable by 
@@ -376,30 +539,50 @@ class EquivalenceTransformer:
                 the counting predicate does not depend on the head predicates
             Returns the list of valid output forms for potential rewriting
         """
-        counting_vars = self.variable_counter.get_counting_variables()
+        tracer = self.base_transformer.tracer
+        with tracer.span('counting variable search'):
+            counting_vars = self.variable_counter.get_counting_variables()
         if len(counting_vars) < 2:
             return []
 
-        check_rule = ASTCopier().deep_copy(self.rule)
+        with tracer.span('literal checks'):
+            counting_literals = get_function_counting_literals(self.rule, counting_vars)
+            counting_literals += get_comparison_counting_literals(self.rule, counting_vars)
+            if len(counting_literals) < 3:  # Must be at least two counting functions and one comparison
+                return []
 
-        counting_literals = get_function_counting_literals(check_rule, counting_vars)
-        counting_literals += get_comparison_counting_literals(check_rule, counting_vars)
-        if len(counting_literals) < 3:  # Must be at least two counting functions and one comparison
-            return []
+            literal_positions = []
+            for lit in counting_literals:
+                for position, body_lit in enumerate(self.rule['body']):
+                    if body_lit is lit:
+                        literal_positions.append(position)
+                        break
 
-        if self.counting_vars_used_elsewhere(check_rule, counting_literals, counting_vars):
-            return []
+            condition_positions = self.condition_literal_positions(literal_positions, counting_vars)
+            if condition_positions is None:
+                return []
+            condition_literals = [self.rule['body'][position] for position in condition_positions]
+            condition_predicates = self.condition_predicates(condition_literals)
 
         counting_function = get_counting_function_from_literals(counting_literals)
         counting_predicate = Predicate(counting_function['name'], len(counting_function['arguments']))
-        if self.circular_dependencies(counting_predicate):
+        head_predicates = self.head_predicates
+        with tracer.span('circularity check'):
+            circular = self.circular_dependencies(counting_predicate, condition_predicates, head_predicates)
+        if circular:
             valid_forms = [constants.AGGR_FORM1]
         else:
             valid_forms = [constants.AGGR_FORM1, constants.AGGR_FORM2, constants.AGGR_FORM3]
 
         # record counting literal and variable information for performing rewriting later
         self.counting_literals = counting_literals
+        self.condition_literals = condition_literals
         self.counting_variables = counting_vars
+        self.plan = RewritePlan(literal_positions, counting_vars, valid_forms,
+                                (counting_predicate.name, counting_predicate.arity),
+                                [(head_predicate.name, head_predicate.arity) for head_predicate in head_predicates],
+                                condition_positions,
+                                [(predicate.name, predicate.arity) for predicate in condition_predicates])
         return valid_forms
 
     def get_projection_predicate(self, counting_function, counting_var, arity):
@@ -411,9 +594,15 @@ class EquivalenceTransformer:
             If a collision occurs with other function names in the current
                 operating file, then # is 1. If there is still a 
                 collision, # is incremented until there is none
+            Outside the base part, the name of the rule's #program part
+                is appended, so projections of different parts differ
             Returns the new projection predicate
         """
-        new_predicate = Predicate(counting_function['name'] + '_project_' + str(counting_var), arity)
+        name = counting_function['name'] + '_project_' + str(counting_var)
+        part = self.base_transformer.program_part
+        if part is not None and part.name != constants.BASE_PART:
+            name += '_' + part.name
+        new_predicate = Predicate(name, arity)
         iteration = 1
         while new_predicate in self.base_transformer.in_predicates or \
                 new_predicate in self.base_transformer.new_predicates:
@@ -431,6 +620,9 @@ class EquivalenceTransformer:
                 auxiliary term
             When this is called, we are certain to have a counting
                 variable within the given counting_function
+            The parameters of the rule's #program part are appended to
+                the projected arguments, as a part grounded at several
+                steps (e.g. step(t)) must not define the same atoms twice
         """
 
         # Get the functions arguments, less its counting variable
@@ -440,8 +632,22 @@ class EquivalenceTransformer:
                 if counting_var == str(function_var):
                     projected_args.remove(function_var)
                     break
-
-        projection_predicate = self.get_projection_predicate(counting_function, counting_var, len(projected_args))
+        projection_key = None
+        if self.base_transformer.share_projections:
+            projection_key = self.get_projection_key(counting_function, projected_args)
+        projected_args.extend(self.part_parameters())
+
+        # An identical projection introduced by an earlier rewrite is used instead of a new one
+        projection = self.base_transformer.projections.get(projection_key)
+        if projection is not None:
+            projection_predicate = projection.predicate
+            projection.users += 1
+        else:
+            projection_predicate = self.get_projection_predicate(counting_function, counting_var,
+                                                                 len(projected_args))
+            if projection_key is not None:
+                self.base_transformer.projections[projection_key] = SharedProjection(projection_predicate)
+        self.projection_key = projection_key
 
         # Make Function and Literal with projected arguments and name
         aux_function = clingo.ast.Function(constants.LOCATION,
@@ -451,6 +657,8 @@ class EquivalenceTransformer:
         aux_literal = clingo.ast.Literal(constants.LOCATION,
                                          clingo.ast.Sign.NoSign,
                                          clingo.ast.SymbolicAtom(aux_function))
+        if projection is not None:
+            return projection_predicate, aux_literal, None
 
         # Make rule defining the auxiliary function
         counting_literal = clingo.ast.Literal(constants.LOCATION,
@@ -460,10 +668,45 @@ class EquivalenceTransformer:
 
         return projection_predicate, aux_literal, aux_rule
 
+    def get_projection_key(self, counting_function, projected_args):
+        """
+            Given the counting function and its arguments less the
+                counting variable.
+            Returns the key of the projection of the counting function:
+                the output file it is written to (with --split-output),
+                its #program part, predicate, the position of the
+                counting variable, and the shape of the projected
+                arguments (see ASTCanonicalizer), so that projections
+                which differ only in the names of their variables share
+                a key, and each output file defines the projections its
+                rules use
+        """
+        part = self.base_transformer.program_part
+        if part is None:
+            part_key = (constants.BASE_PART, ())
+        else:
+            part_key = (part.name, tuple(parameter.id for parameter in part.parameters))
+        arguments = counting_function['arguments']
+        position = [index for index, argument in enumerate(arguments) if str(argument) in self.counting_variables][0]
+        shape, _ = self.base_transformer.canonicalizer.canonicalize(projected_args)
+        return self.base_transformer.output_file, part_key, counting_function['name'], len(arguments), position, shape
+
+    def part_parameters(self):
+        """Returns a constant term for each parameter of the #program part of the rule"""
+        part = self.base_transformer.program_part
+        if part is None:
+            return []
+        return [clingo.ast.Function(constants.LOCATION, parameter.id, [], False) for parameter in part.parameters]
+
     def rewrite_rule(self):
-        """Performs aggregate rewriting on the given rule"""
-        for lit in self.counting_literals:
-            self.rule['body'].remove(lit)
+        """
+            Performs aggregate rewriting on the given rule
+            Edits are recorded in a RuleEditJournal, so confirm_rewrite
+                can undo them
+        """
+        self.journal = RuleEditJournal(self.rule)
+        for lit in self.counting_literals + self.condition_literals:
+            self.journal.remove(lit)
 
         counting_function = get_counting_function_from_literals(self.counting_literals)
         rewritten_literals = self.create_aggregate_literals(counting_function)
@@ -475,7 +718,8 @@ class EquivalenceTransformer:
 
             rewritten_literals.append(aux_lit)
 
-        self.rule['body'] += rewritten_literals
+        self.journal.extend(rewritten_literals)
+        self.journal.commit()
 
     def create_aggregate_literals(self, counting_function):
         """
@@ -489,29 +733,38 @@ class EquivalenceTransformer:
         regular_args, counting_var, anonymous_args = get_counting_function_args(counting_function,
                                                                                 self.counting_variables)
 
+        # The condition literals of the counting variable of the counting function (those of the
+        #    other counting variables are dropped, as each element stands for one counting variable)
+        canonicalizer = self.base_transformer.canonicalizer
+        conditions = [literal for literal in self.condition_literals
+                      if str(counting_var) in canonicalizer.canonicalize(literal)[1]]
+
         # Create aggregate elements having the form:
         #    "F(_,Y) : F(_,Y)"    if using anonymous variable, for proper grounding
-        #    "X : F(X,Y)"         otherwise
+        #    "F(X,Y) : F(X,Y), G(X)"    if using anonymous variable with condition literals,
+        #                               as the counting variable occurs in the conditions
+        #    "X : F(X,Y), G(X)"    otherwise
         if self.base_transformer.Setting.USE_ANON:
-            rewritten_function = clingo.ast.Function(constants.LOCATION, function_name, anonymous_args, False)
+            rewritten_function = clingo.ast.Function(constants.LOCATION, function_name,
+                                                     regular_args if len(conditions) > 0 else anonymous_args, False)
             rewritten_literal = clingo.ast.Literal(constants.LOCATION,
                                                    clingo.ast.Sign.NoSign,
                                                    clingo.ast.SymbolicAtom(rewritten_function))
             aggregate_components = [clingo.ast.ConditionalLiteral(constants.LOCATION,
                                                                   rewritten_literal,
-                                                                  [rewritten_literal])]
+                                                                  [rewritten_literal] + conditions)]
 
         else:
             rewritten_function = clingo.ast.Function(constants.LOCATION, function_name, regular_args, False)
             rewritten_lit = clingo.ast.Literal(constants.LOCATION,
                                                clingo.ast.Sign.NoSign,
                                                clingo.ast.SymbolicAtom(rewritten_function))
-            aggregate_components = [clingo.ast.BodyAggregateElement([counting_var], [rewritten_lit])]
+            aggregate_components = [clingo.ast.BodyAggregateElement([counting_var], [rewritten_lit] + conditions)]
 
         num_counting_vars = len(self.counting_variables)  # Let b be the number of counting variables
 
-        # Make aggregate of one of three output forms, as specified by the user
-        if self.base_transformer.Setting.AGGR_FORM == 3:
+        # Make aggregate of one of three output forms, as specified by the user (or chosen by the cost model)
+        if self.aggregate_form == constants.AGGR_FORM3:
             # Form:  not b-1={}, not b-2={}, ..., not 0={}
 
             aggr_literals = []
@@ -538,7 +791,7 @@ class EquivalenceTransformer:
                 aggr_literal = clingo.ast.Literal(constants.LOCATION, clingo.ast.Sign.Negation, rwn_aggr)
                 aggr_literals.append(aggr_literal)
 
-        elif self.base_transformer.Setting.AGGR_FORM == 2:
+        elif self.aggregate_form == constants.AGGR_FORM2:
             # Form:  not {} < b
 
             aggr_left_guard = None
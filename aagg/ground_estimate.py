@@ -0,0 +1,128 @@
+import clingo
+import collections
+import constants
+from ast_visitor import ASTPoolInstantiator
+from emitter import GringoEmitter
+from predicate import Predicate
+
+
+class GroundSizeEstimator:
+    """
+        Estimates, without grounding, how many ground instances the
+            counting literals of a rule have before and after rewriting,
+            from the facts of an instance.
+        For a counting predicate f whose matching facts fall into groups
+            of sizes g by their arguments other than the counting one,
+            the b counting literals are joined into sum(g^b) instances
+            before rewriting. After rewriting, each fact is an element of
+            each created aggregate, and (if a projection is needed) an
+            instance of the auxiliary rule, and each group an instance of
+            the rule
+    """
+
+    def __init__(self):
+        self.facts = {}  # Predicate: set of argument tuples, as Gringo text
+        self.emitter = GringoEmitter()
+        self.groups = {}  # (predicate, argument pattern): group sizes, as computed by group_sizes
+
+    @staticmethod
+    def load(paths):
+        """Returns an estimator of the facts of the given instance files"""
+        estimator = GroundSizeEstimator()
+        instantiator = ASTPoolInstantiator(False)
+        for path in paths:
+            with open(path) as instance_fd:
+                statements = []
+                clingo.parse_program(instance_fd.read(), statements.append)
+            for statement in statements:
+                for instantiation in instantiator.instantiate_pools(statement):
+                    estimator.add_fact(instantiation)
+        return estimator
+
+    def add_fact(self, statement):
+        """Records the statement if it is a fact of a function (facts of constants are not counted over)"""
+        if statement.type != clingo.ast.ASTType.Rule or len(statement.body) > 0 or \
+                statement.head.type != clingo.ast.ASTType.Literal or statement.head.sign != clingo.ast.Sign.NoSign or \
+                statement.head.atom.type != clingo.ast.ASTType.SymbolicAtom or \
+                statement.head.atom.term.type != clingo.ast.ASTType.Function:
+            return
+
+        function = statement.head.atom.term
+        facts = self.facts.setdefault(Predicate(function.name, len(function.arguments)), set())
+        tuples = [()]
+        for argument in function.arguments:
+            tuples = [arguments + (value,) for arguments in tuples for value in self.argument_values(argument)]
+        facts.update(tuples)
+        self.groups.clear()
+
+    def argument_values(self, argument):
+        """Returns the Gringo text of each value of a fact's argument: those of an interval, or the argument itself"""
+        if argument.type == clingo.ast.ASTType.Interval:
+            try:
+                return [str(value) for value in range(int(self.emitter.emit(argument.left)),
+                                                      int(self.emitter.emit(argument.right)) + 1)]
+            except ValueError:
+                pass  # Bounds which are not numbers, e.g. constants defined elsewhere
+        return [self.emitter.emit(argument)]
+
+    def group_sizes(self, predicate, pattern):
+        """
+            Given a predicate with facts, and the pattern of a counting
+                literal: per argument, None for the counting variable,
+                True for another variable, or else the text of a term
+                which facts must match.
+            Returns the number of matching facts in each group of facts
+                agreeing on the variable arguments
+        """
+        key = (predicate, pattern)
+        if key not in self.groups:
+            groups = collections.Counter()
+            for arguments in self.facts[predicate]:
+                if all(term is None or term is True or term == value for term, value in zip(pattern, arguments)):
+                    groups[tuple(value for term, value in zip(pattern, arguments) if term is True)] += 1
+            self.groups[key] = groups.values()
+        return self.groups[key]
+
+    def estimate(self, counting_function, counting_variables, aggregate_form):
+        """
+            Given the counting function of a rule, its counting variables
+                and the form it is rewritten in.
+            Returns the estimated numbers of ground instances of the
+                counting literals before and after rewriting, or None if
+                the counting predicate has no (matching) facts
+        """
+        predicate = Predicate(counting_function['name'], len(counting_function['arguments']))
+        if predicate not in self.facts:
+            return None
+
+        pattern = []
+        for argument in counting_function['arguments']:
+            if str(argument) in counting_variables:
+                pattern.append(None)
+            elif argument.type == clingo.ast.ASTType.Variable:
+                pattern.append(True)
+            else:
+                pattern.append(self.emitter.emit(argument))
+        group_sizes = self.group_sizes(predicate, tuple(pattern))
+        facts = sum(group_sizes)
+        if facts == 0:
+            return None
+
+        b = len(counting_variables)
+        before = sum(size ** b for size in group_sizes)
+        after = facts * (b if aggregate_form == constants.AGGR_FORM3 else 1) + len(group_sizes)
+        if len(counting_function['arguments']) > 1:
+            after += facts  # Instances of the auxiliary rule defining the projection
+        return before, after
+
+    def gain(self, counting_function, counting_variables, aggregate_form):
+        """
+            As estimate, but returns the factor by which rewriting shrinks
+                the ground instances of the counting literals (None if
+                there is no estimate)
+        """
+        estimate = self.estimate(counting_function, counting_variables, aggregate_form)
+        if estimate is None:
+            return None
+        before, after = estimate
+        return float(before) / after
@@ -1,8 +1,11 @@
 #!/usr/bin/env python2.7
 
-import clingo, argparse, sys, json, time
+import clingo, argparse, collections, cProfile, mmap, os, pstats, sys, json, time
+from multiprocessing.pool import ThreadPool
 import constants
 from transformer import Transformer
+from emitter import open_output
+from tracer import Tracer, NULL_TRACER
 
 
 def define_args(arg_parser):
@@ -12,9 +15,17 @@ def define_args(arg_parser):
     aggregate_form_help = 'Use the designated form for all created aggregates.  ' + \
                           '(1) b <= #count{ Y : f(Y) }  * * * * * * * * * * * * ' + \
                           '(2) not #count{ Y : f(Y) } < b  * * * * * * * * * * * ' + \
-                          '(3) not b - 1 = #count{ Y : f(Y) }, ..., not 0 = #count{ Y : f(Y) } '
+                          '(3) not b - 1 = #count{ Y : f(Y) }, ..., not 0 = #count{ Y : f(Y) }  * * * ' + \
+                          '(auto) the valid form of least estimated cost for each rule under a cost model ' + \
+                          'calibrated with benchmarks/train_cost_model.py, see --cost-model; ' + \
+                          'the shipped model is not calibrated and always chooses the lowest numbered valid form '
     arg_parser.add_argument('encoding', nargs='*', default=[], help='Gringo input files')
     arg_parser.add_argument('-o', '--output', type=str, default='', help='Specify a file name for the output')
+    arg_parser.add_argument('--split-output', action='store_true',
+                            help='Write the rewritten statements of each encoding to its own output file, ' +
+                                 'in the directory given by --output if any')
+    arg_parser.add_argument('--gzip', action='store_true',
+                            help='Compress the output with gzip (implied by an output file name ending in .gz)')
     arg_parser.add_argument('--no-rewrite', action='store_true',
                             help='Disables all rewriting and simply parses the given program')
     arg_parser.add_argument('--confirm-rewrite', action='store_true',
@@ -23,17 +34,110 @@ def define_args(arg_parser):
                             help='Use anonymous variables in the aggregate')
     arg_parser.add_argument('-r', '--run-clingo', action='store_true',
                             help='Run clingo to ground and solve the program after performing any rewriting')
+    arg_parser.add_argument('--compare-original', action='store_true',
+                            help='Also ground and solve the original program, and compare its ground program ' +
+                                 'size and search statistics with those of the rewritten program (implies -r)')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='Ground and solve the program step by step, as clingo\'s incremental mode: ' +
+                                 'base and check(0) first, then step(t) and check(t) for t = 1, 2, ..., ' +
+                                 'solving at each step with the external query(t) true (implies -r)')
+    arg_parser.add_argument('--imin', type=int, default=0, help='Minimum number of steps of --incremental')
+    arg_parser.add_argument('--imax', type=int, default=0,
+                            help='Maximum number of steps of --incremental (0 for no limit)')
+    arg_parser.add_argument('--istop', choices=[constants.ISTOP_SAT, constants.ISTOP_UNSAT, constants.ISTOP_UNKNOWN],
+                            default=constants.ISTOP_SAT, help='Result which stops --incremental')
+    arg_parser.add_argument('-q', '--quiet', action='store_true',
+                            help='Do not print proposed rewritings, warnings or progress messages ' +
+                                 '(rewritings are then not confirmed interactively)')
     arg_parser.add_argument('-d', '--debug', action='store_true', help='Run in debug mode')
-    arg_parser.add_argument('--aggregate-form', type=int, default=constants.AGGR_FORM1, help=aggregate_form_help)
+    arg_parser.add_argument('--aggregate-form', type=aggregate_form, default=constants.AGGR_FORM1,
+                            help=aggregate_form_help)
+    arg_parser.add_argument('--cost-model', type=str, default='',
+                            help='JSON cost model used by --aggregate-form auto (by default aagg/cost_model.json, ' +
+                                 'an uncalibrated placeholder)')
+    arg_parser.add_argument('--instance', type=str, nargs='+', default=[], metavar='FILE',
+                            help='Instance files whose facts give the predicate domains of --min-gain ' +
+                                 '(they are not rewritten)')
+    arg_parser.add_argument('--min-gain', type=float, default=0,
+                            help='Rewrite a rule only if the ground instances of its counting literals, ' +
+                                 'estimated from the facts of --instance, shrink by more than this factor ' +
+                                 '(rules counting over derived predicates or predicates without facts are ' +
+                                 'rewritten regardless)')
+    arg_parser.add_argument('--stream', action='store_true',
+                            help='Parse the program twice, collecting predicate dependencies in the first pass ' +
+                                 'and writing each statement as soon as it is rewritten in the second')
+    arg_parser.add_argument('--keep-pools', action='store_true',
+                            help='Do not instantiate pools which cannot affect the counting analysis, i.e. in ' +
+                                 'rules where no pool occurs in a body literal of a function or comparison ' +
+                                 '(e.g. pools in the head); such rules are still rewritten')
+    arg_parser.add_argument('--preserve-source', action='store_true',
+                            help='Copy statements which are not rewritten from the input as they are, keeping ' +
+                                 'their formatting and comments (ignored with --cache-dir)')
+    arg_parser.add_argument('--plan-cache-size', type=int, default=constants.PLAN_CACHE_SIZE,
+                            help='Number of rule shapes whose rewrite analysis is cached (0 disables the cache)')
+    arg_parser.add_argument('--cache-dir', type=str, default='',
+                            help='Keep per-file parsing and analysis results in this directory, ' +
+                                 'so unchanged input files are not processed again on later runs')
+    arg_parser.add_argument('--trace', type=str, default='',
+                            help='Write a trace of the nested phases of the run (down to the steps of each rule) ' +
+                                 'to this file, in Chrome trace-event JSON')
+    arg_parser.add_argument('--profile', type=int, nargs='?', const=30, default=0, metavar='N',
+                            help='Profile the run with cProfile and print its N (default 30) most time consuming ' +
+                                 'functions')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='Check rules for rewritability in a pool of this many worker processes')
+
+
+def aggregate_form(value):
+    """Argument type of --aggregate-form: a form number or 'auto'"""
+    if value == constants.AGGR_FORM_AUTO:
+        return value
+    forms = [constants.AGGR_FORM1, constants.AGGR_FORM2, constants.AGGR_FORM3]
+    if value not in [str(form) for form in forms]:
+        raise argparse.ArgumentTypeError("must be one of %s or %s" %
+                                         (", ".join(str(form) for form in forms), constants.AGGR_FORM_AUTO))
+    return int(value)
+
+
+def build_arguments(encodings, **options):
+    """
+        Given a list of encodings and options named as their argparse
+            destinations (e.g. aggregate_form=2, confirm_rewrite=True).
+        Returns arguments as if parsed from the command line, so that
+            AutomatedAggregator can be run from other scripts
+    """
+    arg_parser = argparse.ArgumentParser()
+    define_args(arg_parser)
+    arguments = arg_parser.parse_args([])
+    arguments.encoding = list(encodings)
+    for name, value in options.items():
+        if not hasattr(arguments, name):
+            raise ValueError("Unknown argument: %s" % name)
+        setattr(arguments, name, value)
+    return arguments
+
+
+def validate_arguments(arguments):
+    """Raises a ValueError if the given arguments do not make sense together"""
+    if arguments.min_gain > 0 and not arguments.instance:
+        raise ValueError("--min-gain needs the facts of --instance files, as without them no gain is estimated")
+
+
+def read_file(path):
+    """Returns the contents of the file at the given path, read through a memory map"""
+    with open(path, 'rb') as file_fd:
+        if os.fstat(file_fd.fileno()).st_size == 0:
+            return ''  # Empty files cannot be mapped
+        mapped = mmap.mmap(file_fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return mapped[:]
+        finally:
+            mapped.close()
 
 
 def open_files(encodings):
     """Used to open list of encodings given via commandline"""
-    full_program = ''
-    for encoding in encodings:
-        with open(encoding, 'r') as enc:
-            full_program += enc.read()
-    return full_program
+    return ''.join([read_file(encoding) for encoding in encodings])
 
 
 def name_outfile(encodings):
@@ -50,6 +154,137 @@ def name_outfile(encodings):
     return ret + '_rewritten.lp'
 
 
+def statistic(statistics, *keys):
+    """
+        Given a clingo statistics map and a path of keys
+        Returns the statistic at that path, or 0 if clingo did not
+            report it (e.g. when the program was solved while grounding)
+    """
+    for key in keys:
+        if not isinstance(statistics, dict) or key not in statistics:
+            return 0
+        statistics = statistics[key]
+    return statistics
+
+
+def program_metrics(statistics, ground_time, solve_time):
+    """
+        Given the statistics of a clingo control which has solved its
+            program, and the ground and solve times.
+        Returns an ordered map of the ground program size and search
+            effort. Aggregates are the count and sum bodies of the
+            ground program
+    """
+    return collections.OrderedDict([
+        ('atoms', statistic(statistics, 'problem', 'lp', 'atoms')),
+        ('rules', statistic(statistics, 'problem', 'lp', 'rules')),
+        ('bodies', statistic(statistics, 'problem', 'lp', 'bodies')),
+        ('aggregates', statistic(statistics, 'problem', 'lp', 'count_bodies') +
+         statistic(statistics, 'problem', 'lp', 'sum_bodies')),
+        ('variables', statistic(statistics, 'problem', 'generator', 'vars')),
+        ('constraints', statistic(statistics, 'problem', 'generator', 'constraints')),
+        ('choices', statistic(statistics, 'solving', 'solvers', 'choices')),
+        ('conflicts', statistic(statistics, 'solving', 'solvers', 'conflicts')),
+        ('ground time', ground_time),
+        ('solve time', solve_time),
+    ])
+
+
+def query_atom(step):
+    """Returns the external atom which is true at the step of the given horizon only"""
+    return clingo.Function(constants.QUERY_EXTERNAL, [clingo.Number(step)])
+
+
+def incremental_parts(step):
+    """Returns the program parts grounded at the given step of the incremental mode"""
+    if step == 0:
+        return [(constants.BASE_PART, []), (constants.CHECK_PART, [clingo.Number(0)])]
+    return [(constants.STEP_PART, [clingo.Number(step)]), (constants.CHECK_PART, [clingo.Number(step)])]
+
+
+def stop_solving(step, result, imin, imax, istop):
+    """
+        Given a step, the solve result of the step before (None before
+            the first step), and the step limits and stop condition of
+            the incremental mode.
+        Returns whether the incremental mode stops before the step
+    """
+    if 0 < imax <= step:
+        return True
+    if result is None or step < imin:
+        return False
+    if istop == constants.ISTOP_SAT:
+        return result.satisfiable
+    if istop == constants.ISTOP_UNSAT:
+        return result.unsatisfiable
+    return result.unknown
+
+
+def solve_incremental(control, imin=0, imax=0, istop=constants.ISTOP_SAT, tracer=NULL_TRACER, **span_args):
+    """
+        Given a control holding an incremental program, and the step
+            limits (imax 0 for none) and stop condition of the
+            incremental mode.
+        Grounds and solves the program step by step, as clingo's
+            incremental mode does: base and check(0) are grounded first,
+            then step(t) and check(t) for each horizon t. Before solving
+            at horizon t, the external query(t) is made true and that of
+            the step before is released
+        Returns the metrics of each step, with its horizon and result,
+            and the solve result of the last step
+    """
+    steps = []
+    result = None
+    step = 0
+    while not stop_solving(step, result, imin, imax, istop):
+        if step > 0:
+            control.release_external(query_atom(step - 1))
+            control.cleanup()
+
+        with tracer.span('ground', step=step, **span_args):
+            ground_start = time.time()
+            control.ground(incremental_parts(step))
+            ground_time = time.time() - ground_start
+        control.assign_external(query_atom(step), True)
+
+        with tracer.span('solve', step=step, **span_args):
+            solve_start = time.time()
+            result = control.solve()
+            solve_time = time.time() - solve_start
+
+        metrics = program_metrics(control.statistics, ground_time, solve_time)
+        steps.append(collections.OrderedDict([('step', step)] + metrics.items() +
+                                             [('satisfiable', result.satisfiable)]))
+        step += 1
+    return steps, result
+
+
+def print_steps(title, steps):
+    """Prints the ground program size and times of each step of an incremental run"""
+    print("\n" + title + "\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n")
+    print(" %5s %12s %12s %10s %10s %8s" % ('step', 'ground time', 'solve time', 'atoms', 'rules', 'result'))
+    for step in steps:
+        result = "SAT" if step['satisfiable'] else "UNSAT" if step['satisfiable'] is not None else "UNKNOWN"
+        print(" %5d %12.3f %12.3f %10d %10d %8s" % (step['step'], step['ground time'], step['solve time'],
+                                                    step['atoms'], step['rules'], result))
+    print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+
+
+def print_metric_deltas(original_metrics, rewritten_metrics):
+    """Prints the metrics of the original and rewritten program side by side"""
+    print("\nOriginal vs. Rewritten Program\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n")
+    print(" %-12s %14s %14s %14s %9s" % ('', 'original', 'rewritten', 'delta', 'change'))
+    for name, original in original_metrics.items():
+        rewritten = rewritten_metrics[name]
+        value_format = "%14.3f" if name.endswith('time') else "%14d"
+        line = " %-12s " % name + value_format % original + " " + value_format % rewritten + \
+               " " + value_format.replace('%', '%+') % (rewritten - original)
+        if original != 0:
+            line += " %+8.1f%%" % (100.0 * (rewritten - original) / original)
+        print(line)
+    print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+
+
 def on_model(model):
     """
         Used in Solver callback to print models when they are found
@@ -62,100 +297,389 @@ class Setting:
     """Holds arguments to be passed to the transformer"""
 
     def __init__(self, arguments):
+        validate_arguments(arguments)
         self.ENCODINGS = arguments.encoding
         self.NO_REWRITE = arguments.no_rewrite
-        self.CONFIRM_REWRITE = arguments.confirm_rewrite
+        self.CONFIRM_REWRITE = arguments.confirm_rewrite or arguments.quiet
         self.USE_ANON = arguments.use_anonymous_variable
-        self.RUN_CLINGO = arguments.run_clingo
+        self.COMPARE_ORIGINAL = arguments.compare_original
+        self.RUN_CLINGO = arguments.run_clingo or arguments.compare_original or arguments.incremental
+        self.INCREMENTAL = arguments.incremental
+        self.IMIN = arguments.imin
+        self.IMAX = arguments.imax
+        self.ISTOP = arguments.istop
         self.DEBUG = arguments.debug
+        self.QUIET = arguments.quiet
         self.AGGR_FORM = arguments.aggregate_form
-        if arguments.output != '':
+        self.COST_MODEL = arguments.cost_model
+        self.INSTANCES = arguments.instance
+        self.MIN_GAIN = arguments.min_gain
+        self.JOBS = arguments.jobs
+        self.STREAM = arguments.stream
+        self.PLAN_CACHE_SIZE = arguments.plan_cache_size
+        self.CACHE_DIR = arguments.cache_dir
+        self.KEEP_POOLS = arguments.keep_pools
+        # Cached statements are not parsed from the input, so they cannot be copied from it
+        self.PRESERVE_SOURCE = arguments.preserve_source and not arguments.cache_dir
+        self.TRACE = arguments.trace
+        self.PROFILE = arguments.profile
+        self.SPLIT_OUTPUT = arguments.split_output
+        if arguments.output != '' and not self.SPLIT_OUTPUT:
             self.OUTFILE = arguments.output
         else:
-            self.OUTFILE = name_outfile(arguments.encoding)
+            self.OUTFILE = name_outfile(arguments.encoding) + ('.gz' if arguments.gzip else '')
+        self.GZIP = arguments.gzip or self.OUTFILE.endswith('.gz')
+
+        # Output file of each encoding, with --split-output
+        self.OUTFILES = []
+        if self.SPLIT_OUTPUT:
+            for encoding in arguments.encoding:
+                outfile = name_outfile([encoding]) + ('.gz' if arguments.gzip else '')
+                if arguments.output != '':
+                    outfile = os.path.join(arguments.output, os.path.basename(outfile))
+                self.OUTFILES.append(outfile)
 
 
 class AutomatedAggregator:
     """Main class. Controls and runs the rewritings"""
 
-    def __init__(self, arguments):
+    def __init__(self, arguments, plan_cache=None, program=None):
         # Apply arguments to Setting class, to be passed to transformer
         self.setting = Setting(arguments)
 
+        # Program text to rewrite instead of the encodings, if given (see daemon.py)
+        self.program = program
+
+        # RewritePlanCache shared with other runs in this process, if any
+        self.plan_cache = plan_cache
+
         # Create clingo controller for building, grounding, and solving program
-        self.control = clingo.Control(['--warn=none'])
-        self.control.use_enumeration_assumption = False
+        self.control = self.create_control()
+        self.statistics = {}
+
+        # Ground program metrics of the rewritten and (if compared) original program
+        self.metrics = None
+        self.original_metrics = None
+
+        # Metrics of each step of the rewritten and original program, with --incremental
+        self.steps = None
+        self.original_steps = None
+
+        # Transformer of the last run, and whether its program was satisfiable (if solved)
+        self.transformer = None
+        self.satisfiable = None
+
+        # Seconds spent in each phase of the last run, by phase name
+        self.timings = {}
+
+        # Records the nested spans of a run, if a trace was requested
+        self.tracer = Tracer() if self.setting.TRACE else NULL_TRACER
 
-    def run_clingo(self):
+    @staticmethod
+    def create_control():
+        control = clingo.Control(['--warn=none'])
+        control.use_enumeration_assumption = False
+        return control
+
+    def run_clingo(self, control=None):
         """
-            Grounds and solves the program while gathering
+            Grounds and solves the program of the given control (that of
+                the rewritten program by default) while gathering
                 timing and satisfiability statistics
             Returns ground and solve times, and if program was satisfiable
         """
-        ground_start = time.time()
-        self.control.ground([('base', [])])
-        ground_time = time.time() - ground_start
+        if control is None:
+            control = self.control
+
+        if self.setting.INCREMENTAL:
+            steps, ret = solve_incremental(control, self.setting.IMIN, self.setting.IMAX, self.setting.ISTOP,
+                                           self.tracer, original=control is not self.control)
+            ground_time = sum(step['ground time'] for step in steps)
+            solve_time = sum(step['solve time'] for step in steps)
+            if control is self.control:
+                self.steps = steps
+            else:
+                self.original_steps = steps
+        else:
+            with self.tracer.span('ground', original=control is not self.control):
+                ground_start = time.time()
+                control.ground([('base', [])])
+                ground_time = time.time() - ground_start
 
-        solve_start = time.time()
-        ret = self.control.solve()  # on_model)            # TODO: How to get this to output models to console?
-        solve_time = time.time() - solve_start
+            with self.tracer.span('solve', original=control is not self.control):
+                solve_start = time.time()
+                ret = control.solve()  # on_model)            # TODO: How to get this to output models to console?
+                solve_time = time.time() - solve_start
 
+        if control is self.control:
+            self.timings['ground'] = ground_time
+            self.timings['solve'] = solve_time
         return ground_time, solve_time, ret.satisfiable
 
     def log_statistics(self, parse_time, transform_time, ground_time, solve_time, satisfiable):
-        """Logs time and satisfiability stats to controller"""
-        self.control.statistics['summary']['times']['py-parse'] = parse_time
-        self.control.statistics['summary']['times']['py-transform'] = transform_time
-        self.control.statistics['summary']['times']['py-solve'] = solve_time
-        self.control.statistics['summary']['times']['py-ground'] = ground_time
-        self.control.statistics['summary']['satisfiable'] = satisfiable
-        self.control.statistics['summary']['times']['py-gs'] = ground_time + solve_time
-        self.control.statistics['summary']['times']['py-total'] = parse_time + transform_time + ground_time + solve_time
-
-    def run(self):
-        """Parse and transform the program"""
-        print("\nRewriting " + ' '.join(self.setting.ENCODINGS) + "\n\n")
-        with open(self.setting.OUTFILE, "w") as out_fd:
-            with self.control.builder() as b:
-                transformer = Transformer(b, self.setting, out_fd)
-
-                parse_start = time.time()
-                clingo.parse_program(
-                    open_files(self.setting.ENCODINGS),
-                    lambda stm: transformer.add_statement(stm))
-                parse_time = time.time() - parse_start
+        """
+            Logs time, satisfiability and ground program statistics,
+                along with the statistics of the controller
+            The controller returns a copy of its statistics, so they
+                are kept in self.statistics
+        """
+        self.statistics = self.control.statistics
+        self.metrics = program_metrics(self.statistics, ground_time, solve_time)
 
-                if self.setting.DEBUG:
-                    transformer.print_input_statements()
+        summary = self.statistics.setdefault('summary', {})
+        summary['satisfiable'] = satisfiable
+        summary['ground-program'] = dict(self.metrics)
+        if self.steps is not None:
+            summary['steps'] = [dict(step) for step in self.steps]
+        times = summary.setdefault('times', {})
+        times['py-parse'] = parse_time
+        times['py-transform'] = transform_time
+        times['py-solve'] = solve_time
+        times['py-ground'] = ground_time
+        times['py-gs'] = ground_time + solve_time
+        times['py-total'] = parse_time + transform_time + ground_time + solve_time
 
-                transform_start = time.time()
-                transformer.explore_statements()
-                transformer.transform_statements()
-                transform_time = time.time() - transform_start
+    def compare_original(self, satisfiable):
+        """
+            Given whether the rewritten program was satisfiable.
+            Grounds and solves the original program in a second
+                controller, then prints its metrics side by side with
+                those of the rewritten program
+        """
+        control = self.create_control()
+        with control.builder() as b:
+            for program, _ in self.read_programs():
+                clingo.parse_program(program, lambda stm: b.add(stm))
+        ground_time, solve_time, original_satisfiable = self.run_clingo(control)
+        self.original_metrics = program_metrics(control.statistics, ground_time, solve_time)
 
-                if self.setting.DEBUG:
-                    transformer.print_output_statements()
+        self.statistics.setdefault('summary', {})['original-program'] = dict(self.original_metrics)
+        if self.original_steps is not None:
+            self.statistics['summary']['original-steps'] = [dict(step) for step in self.original_steps]
+            print_steps("Steps of the Original Program", self.original_steps)
+        print_metric_deltas(self.original_metrics, self.metrics)
+        if original_satisfiable != satisfiable:
+            print("\nWarning: The original program is %s, but the rewritten program is %s" %
+                  ("SAT" if original_satisfiable else "UNSAT", "SAT" if satisfiable else "UNSAT"))
 
-                transformer.write_statements()
-                print("\n\nOutput written to " + self.setting.OUTFILE + "\n")
+    def read_programs(self):
+        """
+            Yields the text of the program given, or else of each
+                encoding, each with its file name (None for the program)
+            Each encoding is read only when the next one is requested, so
+                a caller which drops the text of a file before that keeps
+                at most one file in memory
+        """
+        if self.program is not None:
+            yield self.program, None
+            return
+        for encoding in self.setting.ENCODINGS:
+            yield read_file(encoding), encoding
+
+    def parse_files(self, transformer):
+        """
+            Reads and parses the program given, or else each encoding,
+                the encodings in a pool of threads
+            Yields the parsed InputFile of each, in order
+        """
+        if self.program is not None:
+            yield transformer.parse_file(self.program)
+            return
+
+        encodings = self.setting.ENCODINGS
+        if len(encodings) <= 1:
+            for encoding in encodings:
+                yield transformer.parse_file(read_file(encoding), encoding)
+            return
+
+        pool = ThreadPool(min(len(encodings), constants.PARSE_THREADS))
+        try:
+            for input_file in pool.imap(lambda encoding: transformer.parse_file(read_file(encoding), encoding),
+                                        encodings):
+                yield input_file
+        finally:
+            pool.close()
+            pool.join()
+
+    def run(self, out_fd=None):
+        """
+            Parse and transform the program
+            The output is written to the given file descriptor, or else
+                to Setting.OUTFILE (or with --split-output, to Setting.OUTFILES)
+            The time of each phase is recorded in self.timings
+            If requested, the run is profiled, and its trace is written
+        """
+        if self.setting.PROFILE:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                self.run_program(out_fd)
+            finally:
+                profiler.disable()
+                print("\nProfile\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n")
+                pstats.Stats(profiler, stream=sys.stdout).sort_stats('tottime').print_stats(self.setting.PROFILE)
+        else:
+            self.run_program(out_fd)
+
+        if self.setting.TRACE:
+            self.tracer.export(self.setting.TRACE)
+            self.print_slowest_rules()
+            print("Trace written to " + self.setting.TRACE + "\n")
+
+    def print_slowest_rules(self, count=10):
+        slowest = self.tracer.slowest('transform rule', count)
+        if len(slowest) == 0:
+            return
+        print("\nSlowest Rules\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n")
+        for seconds, args in slowest:
+            print(" %10.6fs  %s" % (seconds, args['rule']))
+        print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
 
-                if self.setting.RUN_CLINGO:
+    def run_program(self, out_fd=None):
+        if out_fd is None and self.setting.SPLIT_OUTPUT:
+            for directory in set(os.path.dirname(outfile) for outfile in self.setting.OUTFILES):
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+            self.rewrite_program(None)  # Output files are opened when written
+        elif out_fd is None:
+            with open_output(self.setting.OUTFILE, self.setting.GZIP) as out_fd:
+                self.rewrite_program(out_fd)
+        else:
+            self.rewrite_program(out_fd)
+
+    def rewrite_program(self, out_fd):
+        self.timings = {}
+        if not self.setting.QUIET:
+            print("\nRewriting " + ' '.join(self.setting.ENCODINGS) + "\n\n")
+        with self.control.builder() as b:
+            transformer = Transformer(b, self.setting, out_fd, self.tracer, self.plan_cache)
+            self.transformer = transformer
+
+            if self.setting.STREAM:
+                parse_time, transform_time = self.stream_program(transformer)
+            else:
+                parse_time, transform_time = self.transform_program(transformer)
+            if self.setting.DEBUG:
+                transformer.print_statistics()
+            if not self.setting.QUIET:
+                print("\n\nOutput written to " + ", ".join(self.output_files(out_fd)) + "\n")
+
+            if self.setting.RUN_CLINGO:
+                if not self.setting.QUIET:
                     print("\nGrounding and solving...")
+                if not self.setting.STREAM:
                     transformer.build_statements()
-                    ground_time, solve_time, satisfiable = self.run_clingo()
-                    self.log_statistics(parse_time, transform_time, ground_time, solve_time, satisfiable)
-                    if self.setting.DEBUG:
-                        print(json.dumps(self.control.statistics, sort_keys=True, indent=2, separators=(',', ': ')))
-                    else:
-                        print("SAT" if satisfiable else "UNSAT")
-
-
-parser = argparse.ArgumentParser()
-define_args(parser)
-args = parser.parse_args()
-if not args.encoding:  # close if no input encodings are given
-    parser.print_help()
-    sys.exit(0)
-
-aagg = AutomatedAggregator(args)
-aagg.run()
+                ground_time, solve_time, satisfiable = self.run_clingo()
+                self.satisfiable = satisfiable
+                self.log_statistics(parse_time, transform_time, ground_time, solve_time, satisfiable)
+                if self.steps is not None and not self.setting.QUIET:
+                    print_steps("Steps of the Rewritten Program", self.steps)
+                if self.setting.COMPARE_ORIGINAL:
+                    self.compare_original(satisfiable)
+                if self.setting.DEBUG:
+                    print(json.dumps(self.statistics, sort_keys=True, indent=2, separators=(',', ': ')))
+                else:
+                    print("SAT" if satisfiable else "UNSAT")
+
+    def output_files(self, out_fd):
+        """Returns the names of the files written with the given file descriptor (None with --split-output)"""
+        if out_fd is None:
+            return self.setting.OUTFILES
+        return [self.setting.OUTFILE]
+
+    def transform_program(self, transformer):
+        """
+            Parses the whole program, then transforms it and writes it
+            Returns parse and transform times
+        """
+        with self.tracer.span('parse'):
+            parse_start = time.time()
+            # Each file is parsed on its own, as clingo does; files are added as soon as they are parsed
+            for input_file in self.parse_files(transformer):
+                transformer.add_file(input_file)
+            parse_time = time.time() - parse_start
+            self.timings['parse'] = parse_time
+
+        if self.setting.DEBUG:
+            transformer.print_input_statements()
+
+        with self.tracer.span('explore'):
+            explore_start = time.time()
+            transformer.explore_statements()
+            self.timings['explore'] = time.time() - explore_start
+
+        with self.tracer.span('transform'):
+            transform_start = time.time()
+            transformer.transform_statements()
+            self.timings['transform'] = time.time() - transform_start
+            transform_time = time.time() - explore_start
+
+        if self.setting.DEBUG:
+            transformer.print_output_statements()
+
+        with self.tracer.span('write'):
+            write_start = time.time()
+            if transformer.out_fd is None:
+                for input_file, outfile in zip(transformer.input_files, self.setting.OUTFILES):
+                    with open_output(outfile, self.setting.GZIP) as out_fd:
+                        transformer.set_output(out_fd)
+                        transformer.write_statements(input_file)
+            else:
+                transformer.write_statements()
+            self.timings['write'] = time.time() - write_start
+        return parse_time, transform_time
+
+    def stream_program(self, transformer):
+        """
+            Parses the program (each file on its own) twice. The first pass only gathers
+                predicate dependencies; the second transforms and writes
+                each statement as it is parsed
+            Each pass reads the files one at a time and drops the text of
+                a file before reading the next one
+            Returns the times of the first and second pass, which are
+                recorded as the explore and transform phases (the second
+                pass also includes writing)
+        """
+        with self.tracer.span('explore'):
+            parse_start = time.time()
+            for program, _ in self.read_programs():
+                clingo.parse_program(program, lambda stm: transformer.map_statement(stm))
+                del program  # Not kept while the next file is read
+            transformer.finish_exploration()
+            parse_time = time.time() - parse_start
+            self.timings['explore'] = parse_time
+
+        with self.tracer.span('transform'):
+            transform_start = time.time()
+            split_output = transformer.out_fd is None
+            for index, (program, _) in enumerate(self.read_programs()):
+                if split_output:
+                    transformer.set_output(open_output(self.setting.OUTFILES[index], self.setting.GZIP))
+                    transformer.output_file = index
+                transformer.set_source(program)
+                clingo.parse_program(program, lambda stm: transformer.stream_statement(stm))
+                transformer.flush_output()
+                transformer.set_source(None)
+                del program  # Not kept while the next file is read
+                if split_output:
+                    transformer.out_fd.close()
+            transform_time = time.time() - transform_start
+            self.timings['transform'] = transform_time
+
+        return parse_time, transform_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    define_args(parser)
+    args = parser.parse_args()
+    if not args.encoding:  # close if no input encodings are given
+        parser.print_help()
+        sys.exit(0)
+    try:
+        validate_arguments(args)
+    except ValueError as error:
+        parser.error(str(error))
+
+    aagg = AutomatedAggregator(args)
+    aagg.run()
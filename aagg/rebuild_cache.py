@@ -0,0 +1,98 @@
+import os
+import threading
+import hashlib
+import cPickle
+import constants
+
+
+class InputFile:
+    """
+        Tracks the range of input statements parsed from one input file,
+            the range of output statements they were transformed into,
+            and the data of that file which is stored in a RebuildCache
+    """
+
+    def __init__(self, key, filename=None):
+        self.key = key
+        self.filename = filename  # None for a program not read from a file
+        self.start = 0
+        self.end = 0
+        self.output_start = 0
+        self.output_end = 0
+        self.text = None  # Contents of the file, until its statements are added
+        self.statements = None  # Parsed statements, until they are added
+        self.entry = None  # CacheEntry loaded for this file, if any
+        self.program = None  # Preprocessed statements as Gringo text, if not loaded
+        self.mapper = None  # ASTPredicateMapper of the statements of the file, if not loaded
+        self.edges = None  # Predicate dependency edges of the file, if not loaded
+
+
+class CacheEntry:
+    """
+        The results for one input file which do not depend on other files:
+            its preprocessed (pool-instantiated) statements as Gringo text,
+            the predicate dependency edges its rules contribute, and the
+            RewritePlans of its rules by statement index within the file
+        Predicates are stored as (name, arity) pairs
+    """
+
+    def __init__(self, program, statement_count, edges, plans):
+        self.program = program
+        self.statement_count = statement_count
+        self.edges = edges
+        self.plans = plans
+
+
+class RebuildCache:
+    """
+        On-disk cache of CacheEntry objects keyed by a hash of the
+            contents of each input file. Files whose contents are
+            unchanged since the last run need not be preprocessed,
+            explored, or analyzed again
+    """
+
+    def __init__(self, directory, fingerprint=''):
+        self.directory = directory
+        self.fingerprint = fingerprint  # Settings which change the cached results
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # Guards the counters, as files are parsed by concurrent threads
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, program):
+        """Returns the cache key of the given file contents"""
+        digest = hashlib.sha1(constants.REBUILD_CACHE_VERSION)
+        digest.update(self.fingerprint)
+        digest.update(program)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def load(self, key):
+        """Returns the CacheEntry stored under the given key, or None"""
+        try:
+            with open(self.path(key), 'rb') as entry_fd:
+                entry = cPickle.load(entry_fd)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return entry
+
+    def reject(self, key):
+        """Counts the entry loaded under the given key as a miss, as it turned out not to be usable"""
+        with self.lock:
+            self.hits -= 1
+            self.misses += 1
+
+    def store(self, key, entry):
+        """Stores the entry, replacing the file atomically so readers never see partial entries"""
+        temporary_path = self.path(key) + '.%d.tmp' % os.getpid()
+        with open(temporary_path, 'wb') as entry_fd:
+            cPickle.dump(entry, entry_fd, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temporary_path, self.path(key))
@@ -0,0 +1,139 @@
+import collections
+import threading
+import constants
+from predicate import Predicate
+
+
+class RewritePlan:
+    """
+        The outcome of checking a rule for rewritability, detached from
+            the rule's AST so that it may be passed between processes.
+        Holds the positions of the counting literals in the rule body,
+            the names of the counting variables, and the valid output
+            forms. A plan with no valid forms marks a rule which cannot
+            be rewritten
+        The counting predicate and head predicates, as (name, arity)
+            pairs, are kept so that the valid forms can be revalidated
+            against a changed predicate dependency graph
+        The positions of the literals moved into the aggregate condition,
+            and their predicates, are kept likewise
+    """
+
+    def __init__(self, literal_positions=(), counting_variables=(), valid_forms=(),
+                 counting_predicate=None, head_predicates=(), condition_positions=(), condition_predicates=()):
+        self.literal_positions = tuple(literal_positions)
+        self.counting_variables = tuple(str(var) for var in counting_variables)
+        self.valid_forms = tuple(valid_forms)
+        self.counting_predicate = counting_predicate
+        self.head_predicates = tuple(head_predicates)
+        self.condition_positions = tuple(condition_positions)
+        self.condition_predicates = tuple(condition_predicates)
+
+    def derive(self, counting_variables=None, valid_forms=None):
+        """Returns a copy of this plan with the given fields replaced"""
+        if counting_variables is None:
+            counting_variables = self.counting_variables
+        if valid_forms is None:
+            valid_forms = self.valid_forms
+        return RewritePlan(self.literal_positions, counting_variables, valid_forms,
+                           self.counting_predicate, self.head_predicates,
+                           self.condition_positions, self.condition_predicates)
+
+    def __str__(self):
+        return "positions %s, counting variables %s, forms %s" % \
+               (list(self.literal_positions), list(self.counting_variables), list(self.valid_forms))
+
+    def abstract(self, variable_names):
+        """
+            Given the variable names of the analyzed rule, in order of
+                first occurrence (see ASTCanonicalizer)
+            Returns a copy of this plan whose counting variables are
+                named by canonical position, for storing in a cache
+        """
+        variable_ids = dict((name, index) for index, name in enumerate(variable_names))
+        return self.derive(counting_variables=["V%d" % variable_ids[var] for var in self.counting_variables])
+
+    def instantiate(self, variable_names):
+        """
+            Given the variable names of a rule having the same shape as
+                the rule this plan was abstracted from
+            Returns a copy of this plan naming the variables of that rule
+        """
+        return self.derive(counting_variables=[variable_names[int(var[1:])] for var in self.counting_variables])
+
+    def checked_predicates(self):
+        """
+            Returns the counting predicate and the condition predicates,
+                as Predicates: those whose dependency on a head predicate
+                decides the valid forms (none if there is no counting
+                predicate)
+        """
+        if self.counting_predicate is None:
+            return []
+        return [Predicate(*predicate) for predicate in (self.counting_predicate,) + self.condition_predicates]
+
+    def revalidate(self, dependency_graph):
+        """
+            Given the current predicate dependency graph
+            Returns a copy of this plan whose valid forms reflect whether
+                the counting predicate or a condition predicate depends
+                on a head predicate
+        """
+        if self.counting_predicate is None:
+            return self
+
+        predicates = self.checked_predicates()
+        for head_predicate in self.head_predicates:
+            for predicate in predicates:
+                if dependency_graph.depends_on(predicate, Predicate(*head_predicate)):
+                    return self.derive(valid_forms=[constants.AGGR_FORM1])
+        return self.derive(valid_forms=[constants.AGGR_FORM1, constants.AGGR_FORM2, constants.AGGR_FORM3])
+
+
+class RewritePlanCache:
+    """
+        Bounded LRU cache of abstracted RewritePlans keyed by rule shape,
+            so that rules which are identical up to variable renaming are
+            analyzed only once
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.plans = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, shape):
+        """Returns the plan stored for the given shape, or None"""
+        plan = self.plans.pop(shape, None)
+        if plan is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.plans[shape] = plan  # Move to most recently used position
+        return plan
+
+    def put(self, shape, plan):
+        if self.capacity <= 0:
+            return
+        self.plans.pop(shape, None)
+        self.plans[shape] = plan
+        if len(self.plans) > self.capacity:
+            self.plans.popitem(last=False)
+
+
+class SharedRewritePlanCache(RewritePlanCache):
+    """RewritePlanCache which may be used by several threads at once"""
+
+    def __init__(self, capacity):
+        RewritePlanCache.__init__(self, capacity)
+        self.lock = threading.Lock()
+
+    def get(self, shape):
+        with self.lock:
+            return RewritePlanCache.get(self, shape)
+
+    def put(self, shape, plan):
+        with self.lock:
+            RewritePlanCache.put(self, shape, plan)
@@ -0,0 +1,37 @@
+class RuleEditJournal:
+    """
+        Records edits to the body of a rule, so that a rewrite can be
+            undone without keeping a deep copy of the rule.
+        The original body list is never mutated. Committing assigns the
+            rule a new list holding the edited body; rolling back assigns
+            the original list again
+    """
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.original_body = rule['body']
+        self.removed = set()  # ids of removed literals, which are compared by identity
+        self.appended = []
+
+    def remove(self, literal):
+        for body_literal in self.original_body:
+            if body_literal is literal:
+                self.removed.add(id(literal))
+                return
+        raise ValueError("literal is not in the rule body")
+
+    def append(self, literal):
+        self.appended.append(literal)
+
+    def extend(self, literals):
+        self.appended.extend(literals)
+
+    def body(self):
+        """Returns the body of the rule with the recorded edits applied"""
+        return [literal for literal in self.original_body if id(literal) not in self.removed] + self.appended
+
+    def commit(self):
+        self.rule['body'] = self.body()
+
+    def rollback(self):
+        self.rule['body'] = self.original_body
@@ -0,0 +1,245 @@
+"""
+    Library API for rewriting a program which grows (and shrinks) at
+        runtime, as in multi-shot applications:
+
+        session = RewriteSession(builder, aggregate_form=2)
+        rule_ids = session.add_program("p(X) :- q(X,Y), q(X,Z), Y != Z.")
+        session.flush()  # Adds the rewritten statements to the builder
+        session.remove(rule_ids[-1])
+
+    Options are named as the arguments of main.py (see build_arguments).
+        Rewritings are never confirmed interactively.
+
+    The predicate dependency graph, including the auxiliary predicates of
+        projections, is updated with each added or removed statement, and
+        only the rules whose circularity verdict may have changed (those
+        whose counting predicate's reachability changed) are checked
+        again. A session keeps no global state, so several sessions may
+        be used at once, in separate threads
+"""
+
+import clingo
+import collections
+import os
+from main import Setting, build_arguments
+from transformer import Transformer
+from ast_visitor import ASTCopier, ASTPredicateMapper
+from dependency_graph import IncrementalDependencyGraph
+from emitter import GringoEmitter, StatementWriter
+
+
+class SessionStatement:
+    """A statement added to a RewriteSession, with its output statements and the edges it contributes"""
+
+    def __init__(self, statement, instantiations):
+        self.statement = statement
+        self.instantiations = instantiations  # Pool instantiations, never rewritten in place
+        self.output_statements = []
+        self.plans = []  # RewritePlan of each rewrite candidate among the instantiations
+        self.aux_predicates = []
+        self.edges = set()  # (head predicate, body predicate) pairs of the output statements
+        self.part = None  # #program statement in effect where the statement was added (None for base)
+        self.flushed = False
+
+
+class RewriteSession:
+    """
+        Rewrites statements one by one as they are added, and keeps the
+            rewritings of earlier statements valid as statements are
+            added and removed
+    """
+
+    def __init__(self, builder=None, **options):
+        arguments = build_arguments([], output=os.devnull, **options)
+        arguments.confirm_rewrite = True  # Never prompt
+        arguments.quiet = True
+        arguments.jobs = 1
+        arguments.stream = False
+        arguments.cache_dir = ''
+        self.setting = Setting(arguments)
+
+        self.builder = builder
+        self.transformer = Transformer(builder, self.setting, None)
+        self.graph = IncrementalDependencyGraph()
+        self.transformer.dependency_graph = self.graph
+        # Statements may be removed, so a projection is never shared by the rules of several statements
+        self.transformer.share_projections = False
+        self.copier = ASTCopier()
+        self.emitter = GringoEmitter()
+
+        self.statements = collections.OrderedDict()  # SessionStatement by id, in order of addition
+        self.next_id = 0
+        self.counting_index = {}  # Counting or condition predicate: ids of statements with a rule counting over it
+        self.rechecks = 0  # Rules checked again because the reachability of their counting predicate changed
+        self.warnings = self.transformer.warnings
+
+    def add(self, statement):
+        """
+            Given a statement (clingo AST).
+            Adds and rewrites the statement, rechecking earlier rules
+                whose verdict the new dependencies may change
+            Returns the id of the statement
+        """
+        instantiations = self.transformer.preprocess_statement(statement, map_predicates=False)
+        entry = SessionStatement(statement, instantiations)
+        entry.part = self.transformer.program_part
+        statement_id = self.next_id
+        self.next_id += 1
+        self.statements[statement_id] = entry
+
+        # The input dependencies of the statement count in the check of its own rules
+        input_edges = self.statement_edges(instantiations)
+        changed = self.add_edges(input_edges)
+        self.recheck(changed, statement_id)
+
+        self.transform(statement_id, entry)
+        self.add_edges(entry.edges - input_edges)
+        self.remove_edges(input_edges - entry.edges)
+        return statement_id
+
+    def add_program(self, program):
+        """
+            Given program text, adds each of its statements
+            Returns the ids of the statements
+        """
+        statements = []
+        clingo.parse_program(program, statements.append)
+        return [self.add(statement) for statement in statements]
+
+    def remove(self, statement_id):
+        """
+            Given the id of an added statement.
+            Removes the statement, rechecking rules whose verdict the
+                removed dependencies may change
+            Statements already flushed to the builder remain in it
+        """
+        entry = self.statements.pop(statement_id)
+        self.release(statement_id, entry)
+        self.recheck(self.remove_edges(entry.edges))
+
+    def statement_edges(self, statements):
+        """Returns the set of (head, body) predicate pairs of the rules among the given statements"""
+        mapper = ASTPredicateMapper()
+        for statement in statements:
+            mapper.map_rule_predicates(statement)
+        edges = set()
+        for head_predicate, body_predicates in mapper.predicate_map.items():
+            self.graph.intern(head_predicate)
+            for body_predicate in body_predicates:
+                edges.add((head_predicate, body_predicate))
+
+            # Names of auxiliary predicates are released with their rewriting, so they are not input predicates
+            for predicate in [head_predicate] + list(body_predicates):
+                if predicate not in self.transformer.new_predicates:
+                    self.transformer.in_predicates.add(predicate)
+        return edges
+
+    def add_edges(self, edges):
+        """Returns the set of predicates whose reachability grew"""
+        changed = set()
+        for head_predicate, body_predicate in edges:
+            changed.update(self.graph.add_edge(head_predicate, body_predicate))
+        return changed
+
+    def remove_edges(self, edges):
+        """Returns the set of predicates whose reachability shrank"""
+        changed = set()
+        for head_predicate, body_predicate in edges:
+            changed.update(self.graph.remove_edge(head_predicate, body_predicate))
+        return changed
+
+    def transform(self, statement_id, entry):
+        """
+            Rewrites the instantiations of the statement, recording its
+                output statements, plans, auxiliary predicates and edges
+        """
+        entry.output_statements = []
+        entry.plans = []
+        entry.aux_predicates = []
+        for instantiation in entry.instantiations:
+            if instantiation.type == clingo.ast.ASTType.Rule:
+                instantiation = self.copier.deep_copy(instantiation)  # Kept unrewritten for rechecks
+            output_statements, equivalence_transformer = self.transformer.rewrite_rule(instantiation)
+            entry.output_statements.extend(output_statements)
+
+            if equivalence_transformer is not None:
+                plan = equivalence_transformer.plan
+                entry.plans.append(plan)
+                for predicate in plan.checked_predicates():
+                    self.counting_index.setdefault(predicate, set()).add(statement_id)
+                if equivalence_transformer.aux_predicate is not None:
+                    entry.aux_predicates.append(equivalence_transformer.aux_predicate)
+
+        # Output statements include the rules defining auxiliary predicates
+        entry.edges = self.statement_edges(entry.output_statements)
+
+    def release(self, statement_id, entry):
+        """Releases the auxiliary predicate names and index entries of the statement's rewriting"""
+        for predicate in entry.aux_predicates:
+            self.transformer.new_predicates.discard(predicate)
+        for plan in entry.plans:
+            for predicate in plan.checked_predicates():
+                self.counting_index.get(predicate, set()).discard(statement_id)
+
+    def recheck(self, changed_predicates, skipped_id=None):
+        """
+            Given the predicates whose reachability changed.
+            Rewrites again the statements with a rule counting over one
+                of these predicates, or moving a literal of one into its
+                aggregate condition, whose valid forms changed.
+            A rewriting only adds dependencies on auxiliary predicates,
+                which no other rule uses, so rewriting again never
+                changes the verdict of further rules
+        """
+        statement_ids = set()
+        for predicate in changed_predicates:
+            statement_ids.update(self.counting_index.get(predicate, ()))
+        statement_ids.discard(skipped_id)
+
+        for statement_id in sorted(statement_ids):
+            entry = self.statements[statement_id]
+            self.rechecks += 1
+            if all(plan.revalidate(self.graph).valid_forms == plan.valid_forms for plan in entry.plans):
+                continue
+
+            previous_output = [self.emitter.emit(statement) for statement in entry.output_statements]
+            edges = entry.edges
+            self.release(statement_id, entry)
+            part = self.transformer.program_part
+            self.transformer.program_part = entry.part  # Projections are named after the part of the rule
+            self.transform(statement_id, entry)
+            self.transformer.program_part = part
+            self.add_edges(entry.edges - edges)
+            self.remove_edges(edges - entry.edges)
+            if entry.flushed and [self.emitter.emit(statement) for statement in entry.output_statements] != \
+                    previous_output:
+                self.warnings.append("Warning! The rewriting of statement %d changed after it was flushed:  %s" %
+                                     (statement_id, entry.statement))
+
+    def output_statements(self):
+        """Returns the output statements of every statement in the session, in order"""
+        return [output_statement for entry in self.statements.values()
+                for output_statement in entry.output_statements]
+
+    def flush(self, builder=None):
+        """
+            Adds the output statements of the statements added since the
+                last flush to the given builder (by default, that of the
+                session)
+            Returns the number of statements added
+        """
+        if builder is None:
+            builder = self.builder
+        added = 0
+        for entry in self.statements.values():
+            if entry.flushed:
+                continue
+            for output_statement in entry.output_statements:
+                builder.add(output_statement)
+                added += 1
+            entry.flushed = True
+        return added
+
+    def write(self, out_fd):
+        """Writes the output statements of the session to the given file descriptor"""
+        StatementWriter(out_fd).write_all(self.output_statements())
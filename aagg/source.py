@@ -0,0 +1,74 @@
+import re
+
+NEWLINE = re.compile(r'\n')
+
+# Whitespace and comments which may separate the end of a statement's location from its closing period
+STATEMENT_TAIL = re.compile(r'(?:\s+|%\*.*?\*%|%[^\n]*)*\.', re.DOTALL)
+
+
+class SourceText:
+    """
+        The text of a parsed program, by which the locations of its
+            statements are mapped to spans of the text
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.line_offsets = [0]  # Offset of the first character of each line
+        self.line_offsets.extend(match.end() for match in NEWLINE.finditer(text))
+
+    def offset(self, position):
+        """
+            Given a position of a clingo location (1-based line and column).
+            Returns the offset of the position in the text, or None if
+                the position is not in the text
+        """
+        line = position['line']
+        if not isinstance(line, int) or not 0 < line <= len(self.line_offsets):
+            return None
+        offset = self.line_offsets[line - 1] + position['column'] - 1
+        return offset if 0 <= offset <= len(self.text) else None
+
+    def span(self, statement):
+        """
+            Given a statement parsed from this text.
+            Returns the SourceSpan of the statement, or None if its
+                location is not in the text
+        """
+        begin = self.offset(statement.location['begin'])
+        end = self.offset(statement.location['end'])
+        if begin is None or end is None or end < begin:
+            return None
+        return SourceSpan(self, begin, end)
+
+    def statement_end(self, end):
+        """
+            Given the end offset of a statement's location.
+            Returns the offset after the period closing the statement,
+                which the location may not include
+        """
+        if end > 0 and self.text[end - 1] == '.':
+            return end
+        match = STATEMENT_TAIL.match(self.text, end)
+        return match.end() if match is not None else end
+
+
+class SourceSpan:
+    """
+        A statement of the input program as the span of the program text
+            it was parsed from.
+        Unless the statement was rewritten, its text is written to the
+            output as is, which keeps its formatting (and pools) and the
+            comments around it. Otherwise its output statements are
+            written in its place
+    """
+
+    def __init__(self, source, begin, end):
+        self.source = source
+        self.begin = begin
+        self.end = end
+        self.statements = []  # Output statements, kept if they are to be grounded or were rewritten
+        self.rewritten = False
+
+    def __str__(self):
+        return self.source.text[self.begin:self.end]
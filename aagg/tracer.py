@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import threading
+
+
+class Span(object):
+    """
+        A timed, named region of a Tracer, used as a context manager.
+        Spans opened within a span are nested in it
+    """
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.tracer.record(self.name, self.start, time.time(), self.args)
+        return False
+
+
+class NullSpan(object):
+    """Span of the NullTracer, which records nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+
+class Tracer(object):
+    """
+        Records the start and duration of nested spans, e.g.
+            with tracer.span('transform rule', rule=statement):
+                ...
+        Span arguments are converted to strings when the span is opened,
+            so a rule is described as it was before being rewritten.
+            The NullTracer does not convert them at all.
+        The trace can be exported in the Chrome trace-event format,
+            which chrome://tracing and Perfetto display as a timeline
+    """
+    enabled = True
+
+    def __init__(self):
+        self.events = []  # (name, start, end, thread id, arguments)
+        self.lock = threading.Lock()
+
+    def span(self, name, **args):
+        return Span(self, name, dict((key, "%s" % value) for key, value in args.items()))
+
+    def record(self, name, start, end, args):
+        event = (name, start, end, threading.current_thread().ident, args)
+        with self.lock:
+            self.events.append(event)
+
+    def drain(self, thread_id=None):
+        """
+            Given the thread id to report the events under (by default,
+                that of their thread).
+            Removes and returns the recorded events, e.g. to send those
+                of a worker process to the Tracer of its parent with merge
+        """
+        with self.lock:
+            events, self.events = self.events, []
+        if thread_id is None:
+            return events
+        return [(name, start, end, thread_id, args) for name, start, end, _, args in events]
+
+    def merge(self, events):
+        """Given events drained from another Tracer, records them in this one"""
+        with self.lock:
+            self.events.extend(events)
+
+    def slowest(self, name, count):
+        """Returns the given number of longest spans of the given name, as (seconds, arguments)"""
+        durations = [(end - start, args) for span_name, start, end, _, args in self.events if span_name == name]
+        return sorted(durations, key=lambda duration: -duration[0])[:count]
+
+    def export(self, path):
+        """Writes the trace to the given file as Chrome trace-event JSON"""
+        origin = min(start for _, start, _, _, _ in self.events) if self.events else 0
+        process_id = os.getpid()
+        trace_events = [{
+            'name': name,
+            'ph': 'X',
+            'ts': (start - origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': process_id,
+            'tid': thread_id,
+            'args': args,
+        } for name, start, end, thread_id, args in self.events]
+
+        with open(path, 'w') as trace_fd:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_fd)
+
+
+class NullTracer(object):
+    """Tracer used when tracing is disabled; its spans cost one call"""
+    enabled = False
+
+    def __init__(self):
+        self.null_span = NullSpan()
+
+    def span(self, name, **args):
+        return self.null_span
+
+    def drain(self, thread_id=None):
+        return []
+
+    def merge(self, events):
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -1,6 +1,59 @@
+import os
 import clingo
-from equivalence_transformer import EquivalenceTransformer
-from ast_visitor import ASTReplacer, ASTPoolInstantiator, ASTPredicateMapper
+import multiprocessing
+import constants
+from equivalence_transformer import EquivalenceTransformer, is_rewrite_candidate
+from ast_visitor import ASTReplacer, ASTPoolInstantiator, ASTPredicateMapper, ASTCanonicalizer, ASTFusedVisitor
+from rewrite_plan import RewritePlanCache
+from dependency_graph import PredicateDependencyGraph
+from predicate import Predicate
+from rebuild_cache import RebuildCache, InputFile, CacheEntry
+from cost_model import FormCostModel, DEFAULT_PATH
+from ground_estimate import GroundSizeEstimator
+from emitter import StatementWriter
+from source import SourceText, SourceSpan
+from tracer import Tracer, NULL_TRACER
+
+
+# Transformer whose input statements are analyzed by a worker process.
+#   Workers are forked, so they inherit the statements instead of pickling them
+worker_transformer = None
+
+
+def init_worker(transformer):
+    global worker_transformer
+    worker_transformer = transformer
+    if transformer.tracer.enabled:
+        # Spans of the parent (and its lock, which another thread may hold) are not inherited
+        transformer.tracer = Tracer()
+
+
+def analyze_statement(index, transformer=None):
+    """
+        Worker task: checks rewritability of the indexed input rule of
+            the given transformer (by default, that of the worker)
+        Returns the index and the RewritePlan of the rule
+    """
+    if transformer is None:
+        transformer = worker_transformer
+    statement = transformer.input_statements[index]
+    with transformer.tracer.span('analyze rule', rule=statement):
+        shape, variable_names, plan = transformer.cached_plan(statement)
+        if plan is None:
+            plan = EquivalenceTransformer(statement, transformer).analyze()
+            transformer.cache_plan(shape, variable_names, plan)
+    return index, plan
+
+
+def analyze_worker_statement(index):
+    """
+        Worker task: analyzes the indexed input rule like analyze_statement
+        Returns the index, the RewritePlan of the rule, and the spans the
+            worker recorded meanwhile, under the worker's process id, as
+            they would otherwise be lost with the worker process
+    """
+    index, plan = analyze_statement(index)
+    return index, plan, worker_transformer.tracer.drain(os.getpid())
 
 
 class Transformer:
@@ -10,56 +63,250 @@ class Transformer:
         Invokes EquivalenceTransformer per rule for rewriting.
     """
 
-    def __init__(self, builder, setting, output_file_descriptor):
+    def __init__(self, builder, setting, output_file_descriptor, tracer=NULL_TRACER, plan_cache=None):
         self.builder = builder
         self.Setting = setting
         self.out_fd = output_file_descriptor
+        self.writer = StatementWriter(output_file_descriptor)
+        self.tracer = tracer
 
         self.astReplacer = ASTReplacer()
-        self.astPoolInstantiator = ASTPoolInstantiator()
+        self.astPoolInstantiator = ASTPoolInstantiator(setting.KEEP_POOLS)
         self.predicate_mapper = ASTPredicateMapper()
+        self.rule_mapper = ASTPredicateMapper()  # Finds head predicates of single rules for EquivalenceTransformer
+        self.statement_mapper = None  # Mapper of the statements being added, see set_statement_mapper
+        self.preprocessor = None
+        self.set_statement_mapper(self.predicate_mapper)
+        self.canonicalizer = ASTCanonicalizer()
+        # The plan cache may be shared by the transformers of several programs (see batch.py)
+        self.plan_cache = plan_cache if plan_cache is not None else RewritePlanCache(setting.PLAN_CACHE_SIZE)
         self.input_statements = []
         self.output_statements = []
+        self.source = None  # SourceText of the program being parsed, if statements are passed through
+        self.statement_spans = {}  # SourceSpan of each input statement kept for rewriting or grounding, by index
         self.predicate_adjacency_list = {}
+        self.dependency_graph = PredicateDependencyGraph()
         self.in_predicates = set()
         self.new_predicates = set()
+        self.program_part = None  # #program statement of the rules being rewritten (None for base)
+        self.share_projections = True  # Whether rewrites use identical projections of earlier rewrites
+        self.projections = {}  # SharedProjection by projection key (see EquivalenceTransformer.get_projection_key)
+        self.output_file = None  # With --split-output, index of the file written to, as projections are not shared
+        self.screen_skips = 0  # Rules rejected by is_rewrite_candidate
+        self.screen_hits = 0  # Rules passed on to the EquivalenceTransformer
+
+        if setting.CACHE_DIR:
+            self.rebuild_cache = RebuildCache(setting.CACHE_DIR, "keep-pools=%s" % setting.KEEP_POOLS)
+        else:
+            self.rebuild_cache = None
+        self.input_files = []
+        self.known_plans = {}  # Plans of input statements loaded from the rebuild cache, by index
+        self.changed_verdicts = 0  # Loaded plans whose valid forms changed with the dependency graph
+
+        if setting.AGGR_FORM == constants.AGGR_FORM_AUTO:
+            self.cost_model = FormCostModel.load(setting.COST_MODEL or DEFAULT_PATH)
+            if not self.cost_model.calibrated and not setting.QUIET:
+                print("Warning: The cost model %s is not calibrated, so --aggregate-form auto uses the lowest "
+                      "numbered valid form of each rule; see benchmarks/train_cost_model.py" %
+                      (setting.COST_MODEL or DEFAULT_PATH))
+        else:
+            self.cost_model = None
+        if setting.MIN_GAIN > 0:
+            self.ground_estimator = GroundSizeEstimator.load(setting.INSTANCES)
+        else:
+            self.ground_estimator = None
+        self.gated_rewrites = 0  # Rewrites not applied as their estimated gain was below Setting.MIN_GAIN
+        self.rewrite_forms = []  # (b, projection arity, form) of every confirmed rewrite
+        self.rewrite_report = []  # (rule before, rule after, auxiliary rule or None) of every confirmed rewrite
+        self.warnings = []  # Rules which could not be rewritten in the requested form
+
+    def set_source(self, program):
+        """
+            Given the text of the program about to be parsed (None once
+                it was written).
+            With Setting.PRESERVE_SOURCE, statements which are not
+                rewritten are copied from this text to the output
+        """
+        self.source = SourceText(program) if self.Setting.PRESERVE_SOURCE and program is not None else None
 
     def add_statement(self, stm):
-        self.input_statements.extend(self.preprocess_statement(stm))
+        span = self.source.span(stm) if self.source is not None else None
+        statements = self.preprocess_statement(stm)
+        if span is None:
+            self.input_statements.extend(statements)
+        elif not self.Setting.RUN_CLINGO and not any(self.may_rewrite(statement) or
+                                                     statement.type == clingo.ast.ASTType.Program
+                                                     for statement in statements):
+            # Only the span of the statement is kept, as it is copied to the output. #program
+            # statements are kept whole, as the part they begin names the projections of its rules
+            self.input_statements.append(span)
+        else:
+            for statement in statements:
+                self.statement_spans[len(self.input_statements)] = span
+                self.input_statements.append(statement)
+
+    def may_rewrite(self, statement):
+        return not self.Setting.NO_REWRITE and statement.type == clingo.ast.ASTType.Rule and \
+            is_rewrite_candidate(statement)
+
+    def set_statement_mapper(self, mapper):
+        """
+            Given an ASTPredicateMapper.
+            Sets the mapper which records the predicates of added
+                statements, fused with the replacer in preprocessing
+        """
+        self.statement_mapper = mapper
+        self.preprocessor = ASTFusedVisitor([self.astReplacer, mapper])
+
+    def parse_file(self, program, filename=None):
+        """
+            Given the contents of one input file and its name, parses it.
+            If the rebuild cache holds an entry for these contents, the
+                cached preprocessed statements are parsed instead.
+            Nothing of the transformer is changed, so several files may
+                be parsed in concurrent threads
+            Returns the InputFile of the contents, holding its parsed
+                statements until it is added by add_file
+        """
+        key = self.rebuild_cache.key(program) if self.rebuild_cache is not None else None
+        input_file = InputFile(key, filename)
+        if key is not None:
+            input_file.entry = self.rebuild_cache.load(key)
+
+        statements = []
+        if input_file.entry is not None:
+            try:
+                clingo.parse_program(input_file.entry.program, statements.append)
+            except RuntimeError:
+                statements = []
+            # Skip the '#program base.' statement clingo reports before any parsed statement;
+            #  an entry whose program does not parse to its statements is treated as a miss
+            if len(statements) == input_file.entry.statement_count + 1:
+                statements = statements[1:]
+            else:
+                self.rebuild_cache.reject(key)
+                input_file.entry = None
+                statements = []
 
-    def preprocess_statement(self, stm):
+        if input_file.entry is None:
+            input_file.text = program
+            clingo.parse_program(program, statements.append)
+            if filename is not None:
+                # clingo names the file of every parsed program '<string>'
+                for statement in statements:
+                    location = statement.location
+                    statement.location = {'begin': dict(location['begin'], filename=filename),
+                                          'end': dict(location['end'], filename=filename)}
+        input_file.statements = statements
+        return input_file
+
+    def add_file(self, input_file):
+        """
+            Given an InputFile parsed by parse_file, adds its statements.
+            The cached plans of the rules of a file loaded from the
+                rebuild cache are kept so that they need not be analyzed
+                again
+        """
+        input_file.start = len(self.input_statements)
+        if input_file.entry is None:
+            input_file.mapper = ASTPredicateMapper()
+            self.set_statement_mapper(input_file.mapper)
+            self.set_source(input_file.text)
+            for statement in input_file.statements:
+                self.add_statement(statement)
+            self.set_statement_mapper(self.predicate_mapper)
+            self.source = None
+        else:
+            # Cached statements contain no pools, so only the replacer is needed
+            self.input_statements.extend(self.astReplacer.replace(stm) for stm in input_file.statements)
+
+            for index, plan in input_file.entry.plans.items():
+                self.known_plans[input_file.start + index] = plan
+
+        input_file.statements = None
+        input_file.text = None
+        input_file.end = len(self.input_statements)
+        self.input_files.append(input_file)
+
+    def preprocess_statement(self, stm, map_predicates=True):
         """
             Given a statement.
             Replaces AST objects in the rule, those which have non-Gringo syntax
                 string representations, with custom-defined AST objects for
                 which the __str__ method is overridden
+            In the same traversal, unless map_predicates is False, records
+                the predicate dependencies of the statement. Pools need
+                not be instantiated for this, as the functions of a pool
+                are visited as its arguments
             Then, if a (or multiple) pools exist within the statement,
                 instantiate the statement into a set of multiple equivalent
-                statements, where each contains no pools
+                statements, where each contains no pools (unless pools are
+                kept where they cannot affect rewriting)
             Returns the preprocessed statement(s)
         """
-        stm = self.astReplacer.replace(stm)
-
-        pool_instantiated_rules = []
-        for instantiation in self.astPoolInstantiator.instantiate_pools(stm):
-            pool_instantiated_rules.append(instantiation)
+        with self.tracer.span('preprocess'):
+            with self.tracer.span('replace'):
+                if map_predicates:
+                    self.statement_mapper.begin_statement()
+                    stm = self.preprocessor.visit(stm)
+                    self.statement_mapper.end_statement(stm)
+                else:
+                    stm = self.astReplacer.replace(stm)
 
-        return pool_instantiated_rules
+            with self.tracer.span('instantiate pools'):
+                return self.astPoolInstantiator.instantiate_pools(stm)
 
     def explore_statements(self):
         """
-            Explores the input statements. Traverses each rule to:
-            1) Create an adjacency list of predicate dependencies which
-                is later used to determine 'safety' or rewriting to 
-                output forms (2) and (3).
+            Explores the input statements, whose predicates were mapped
+                while preprocessing them, to:
+            1) Create an adjacency list of predicate dependencies, and
+                its reachability index, which is later used to determine
+                'safety' or rewriting to output forms (2) and (3).
             2) Develop a set of all predicates in the input program 
                 which is later used to avoid naming collisions that may
                 occur when introducing new function names during rule
                 rewriting (for if projection must be used)
         """
-        for stm in self.input_statements:
-            self.predicate_mapper.map_rule_predicates(stm)
+        for input_file in self.input_files:
+            if input_file.entry is not None:
+                for head_predicate, body_predicates in input_file.entry.edges:
+                    self.predicate_mapper.add_dependencies(
+                        Predicate(*head_predicate),
+                        [Predicate(*body_predicate) for body_predicate in body_predicates])
+                continue
+
+            # Each file was mapped on its own, to record the dependencies it contributes
+            file_mapper = input_file.mapper
+            for head_predicate, body_predicates in file_mapper.predicate_map.items():
+                self.predicate_mapper.add_dependencies(head_predicate, body_predicates)
+
+            if input_file.key is not None:
+                input_file.edges = [((head_predicate.name, head_predicate.arity),
+                                     [(body_predicate.name, body_predicate.arity)
+                                      for body_predicate in body_predicates])
+                                    for head_predicate, body_predicates in file_mapper.predicate_map.items()]
+                # Statements are recorded before rewriting changes them
+                input_file.program = "\n".join(self.writer.emitter.emit(stm) for stm in
+                                               self.input_statements[input_file.start:input_file.end])
+
+        self.finish_exploration()
+
+    def map_statement(self, stm):
+        """
+            First pass of streaming mode. Given a statement as parsed,
+                records only its predicate dependencies; the statement
+                itself is not kept
+        """
+        self.predicate_mapper.map_rule_predicates(stm)
+
+    def finish_exploration(self):
+        """
+            Builds the predicate dependency information from the
+                predicate map gathered by exploring every statement
+        """
         self.predicate_adjacency_list = self.predicate_mapper.predicate_map
+        self.dependency_graph = PredicateDependencyGraph(self.predicate_adjacency_list)
 
         if self.Setting.DEBUG:
             self.print_predicate_graph()
@@ -74,23 +321,176 @@ class Transformer:
             The transform_rule function returns a list, for the case 
                 when a projection rule is created
         """
-        if self.Setting.NO_REWRITE:
-            self.output_statements = self.input_statements
+        plans = {}
+        if not self.Setting.NO_REWRITE:
+            if self.Setting.JOBS > 1 or self.rebuild_cache is not None:
+                with self.tracer.span('analyze statements', jobs=self.Setting.JOBS):
+                    plans = self.analyze_statements()
 
-        else:
-            for statement in self.input_statements:
-                parsed_statements = self.transform_rule(statement)
-                for parsed_statement in parsed_statements:
-                    self.output_statements.append(parsed_statement)
+            # Plans loaded from the rebuild cache were made with the dependency graph of their run
+            for index, plan in self.known_plans.items():
+                plans[index] = plan.revalidate(self.dependency_graph)
+                if plans[index].valid_forms != plan.valid_forms:
+                    self.changed_verdicts += 1
+
+        split_output = self.out_fd is None
+        for file_index, (input_file, start, end) in enumerate(self.file_ranges()):
+            if split_output:
+                self.output_file = file_index
+            output_start = len(self.output_statements)
+            for index in range(start, end):
+                statement = self.input_statements[index]
+                if self.Setting.NO_REWRITE:
+                    self.add_output(index, [statement], False)
+                else:
+                    rewrites = len(self.rewrite_forms)
+                    parsed_statements = self.transform_rule(statement, plans.get(index))
+                    self.add_output(index, parsed_statements, len(self.rewrite_forms) > rewrites)
+            if input_file is not None:
+                input_file.output_start = output_start
+                input_file.output_end = len(self.output_statements)
+
+        if not self.Setting.NO_REWRITE and self.rebuild_cache is not None:
+            self.store_files(plans)
+
+    def file_ranges(self):
+        """
+            Yields each input file with the range of its input statements,
+                or if statements were added on their own, None with the
+                range of all input statements
+        """
+        if len(self.input_files) == 0:
+            yield None, 0, len(self.input_statements)
+        for input_file in self.input_files:
+            yield input_file, input_file.start, input_file.end
+
+    def add_output(self, index, statements, rewritten):
+        """
+            Given the index of an input statement, its output statements
+                and whether it was rewritten.
+            Adds the output statements, or if the input statement has a
+                SourceSpan, adds them to the span (shared by the pool
+                instantiations of a statement) in their place
+        """
+        span = self.statement_spans.get(index)
+        if span is None:
+            self.output_statements.extend(statements)
+            return
+
+        if len(self.output_statements) == 0 or self.output_statements[-1] is not span:
+            self.output_statements.append(span)
+        span.statements.extend(statements)
+        span.rewritten = span.rewritten or rewritten
 
-    def write_statements(self):
+    def analyze_statements(self):
+        """
+            Checks the rewritability of every input rule not loaded from
+                the rebuild cache, in a pool of Setting.JOBS worker
+                processes if more than one job is requested.
+            Only the analysis runs in parallel; rewriting, naming of
+                auxiliary predicates, and confirmation prompts happen
+                afterwards in input order, so the output is identical
+                to that of a serial run.
+                The spans of the workers are merged into self.tracer
+            Returns a map of input statement index to RewritePlan
+        """
+        rule_indices = [index for index, statement in enumerate(self.input_statements)
+                        if isinstance(statement, clingo.ast.AST) and statement.type == clingo.ast.ASTType.Rule and
+                        index not in self.known_plans and is_rewrite_candidate(statement)]
+        if len(rule_indices) == 0:
+            return {}
+
+        if self.Setting.JOBS <= 1:
+            # The transformer is passed along, as other threads may be analyzing other programs (see daemon.py)
+            return dict(analyze_statement(index, self) for index in rule_indices)
+
+        chunk_size = max(1, len(rule_indices) // (self.Setting.JOBS * 4))
+        pool = multiprocessing.Pool(self.Setting.JOBS, init_worker, (self,))
+        try:
+            plans = {}
+            for index, plan, events in pool.imap_unordered(analyze_worker_statement, rule_indices, chunk_size):
+                plans[index] = plan
+                self.tracer.merge(events)
+        finally:
+            pool.close()
+            pool.join()
+        return plans
+
+    def store_files(self, plans):
+        """
+            Given the plans of the input statements.
+            Stores a rebuild cache entry for every input file which was
+                not loaded from the cache
+        """
+        for input_file in self.input_files:
+            if input_file.entry is not None or input_file.key is None:
+                continue
+
+            file_plans = dict((index - input_file.start, plan) for index, plan in plans.items()
+                              if input_file.start <= index < input_file.end)
+            entry = CacheEntry(input_file.program, input_file.end - input_file.start, input_file.edges, file_plans)
+            self.rebuild_cache.store(input_file.key, entry)
+
+    def stream_statement(self, stm):
+        """
+            Second pass of streaming mode. Given a statement as parsed,
+                preprocesses and transforms it, then immediately writes
+                the result to the output file (and adds it to the
+                builder, if the program will be grounded)
+            No AST or output statement is kept beyond the statement
+                being written. Output is flushed to the file after each
+                rewritten statement, so that rewrites appear on disk while
+                the rest of the program is still being parsed
+        """
+        span = self.source.span(stm) if self.source is not None else None
+        rewrites = len(self.rewrite_forms)
+        for statement in self.preprocess_statement(stm, map_predicates=False):
+            if self.Setting.NO_REWRITE:
+                output_statements = [statement]
+            else:
+                output_statements = self.transform_rule(statement)
+
+            for output_statement in output_statements:
+                if span is None:
+                    self.write_statement(output_statement)
+                else:
+                    span.statements.append(output_statement)
+                if self.Setting.RUN_CLINGO:
+                    self.builder.add(output_statement)
+
+        if span is not None:
+            span.rewritten = len(self.rewrite_forms) > rewrites
+            self.write_statement(span)
+        if len(self.rewrite_forms) > rewrites:
+            self.writer.flush()
+            self.out_fd.flush()
+
+    def set_output(self, output_file_descriptor):
+        """Sets the file descriptor output statements are written to"""
+        self.out_fd = output_file_descriptor
+        self.writer = StatementWriter(output_file_descriptor)
+
+    def write_statements(self, input_file=None):
         """
             Writes output statements to the given file descriptor, 
-                correcting any potential output errors
+                in Gringo syntax
+            If an input file is given, only the output statements of
+                its input statements are written
         """
-        for statement in self.output_statements:
-            statement_str = "%s" % statement
-            self.out_fd.write(statement_str + "\n")
+        if input_file is None:
+            self.writer.write_all(self.output_statements)
+        else:
+            self.writer.write_all(self.output_statements[input_file.output_start:input_file.output_end])
+
+    def write_statement(self, statement):
+        """
+            Writes a statement to the given file descriptor. It may be
+                buffered until flush_output is called
+        """
+        self.writer.write(statement)
+
+    def flush_output(self):
+        self.writer.finish()
 
     def build_statements(self):
         """
@@ -100,26 +500,100 @@ class Transformer:
                 rewritten statements.
         """
         for statement in self.output_statements:
-            self.builder.add(statement)
+            if isinstance(statement, SourceSpan):
+                for span_statement in statement.statements:
+                    self.builder.add(span_statement)
+            else:
+                self.builder.add(statement)
 
-    def transform_rule(self, statement):
+    def transform_rule(self, statement, plan=None):
         """
             Transforms rule using EquivalenceTransformer class
+            If the rule was already analyzed, its RewritePlan is given
             Returns outputted rule, whether transformed or not.
                 If an auxiliary rule was created, returns that too.
         """
+        return self.rewrite_rule(statement, plan)[0]
+
+    def rewrite_rule(self, statement, plan=None):
+        """
+            As transform_rule, but also returns the EquivalenceTransformer
+                of the rule (None if the rule was screened out), whose
+                plan and auxiliary predicate the caller may keep
+        """
         if not isinstance(statement, clingo.ast.AST) or \
                 statement.type != clingo.ast.ASTType.Rule:
-            return [statement]
+            if isinstance(statement, clingo.ast.AST) and statement.type == clingo.ast.ASTType.Program:
+                self.program_part = statement  # Projections are defined within the part of their rule
+            return [statement], None
+
+        elif not is_rewrite_candidate(statement):
+            self.screen_skips += 1
+            return [statement], None
 
         else:
-            equivalence_transformer = EquivalenceTransformer(statement, self)
-            equivalence_transformer.process()
+            self.screen_hits += 1
+            with self.tracer.span('transform rule', rule=statement):
+                shape = variable_names = None
+                if plan is None:
+                    with self.tracer.span('plan cache lookup'):
+                        shape, variable_names, plan = self.cached_plan(statement)
+
+                equivalence_transformer = EquivalenceTransformer(statement, self)
+                equivalence_transformer.transform(plan)
+                if plan is None:
+                    self.cache_plan(shape, variable_names, equivalence_transformer.plan)
+            # Printing and confirming the rewrite are not part of the timed span
+            equivalence_transformer.report()
             processed_rules = [equivalence_transformer.rule]
 
             if equivalence_transformer.aux_rule is not None:
                 processed_rules.append(equivalence_transformer.aux_rule)
-            return processed_rules
+            return processed_rules, equivalence_transformer
+
+    def cached_plan(self, statement):
+        """
+            Looks up the plan of a rule having the same shape as the given
+                rule, i.e. being identical up to variable renaming
+            Returns the shape and variable names of the rule, and the
+                cached plan instantiated for the rule (None if not cached)
+            As the cache may be shared with other programs, the plan is
+                revalidated against the dependency graph of this program
+        """
+        if self.plan_cache.capacity <= 0:
+            return None, None, None
+
+        shape, variable_names = self.canonicalizer.canonicalize(statement)
+        plan = self.plan_cache.get(shape)
+        if plan is not None:
+            plan = plan.instantiate(variable_names).revalidate(self.dependency_graph)
+        return shape, variable_names, plan
+
+    def cache_plan(self, shape, variable_names, plan):
+        """Stores the plan of an analyzed rule under the rule's shape"""
+        if shape is not None:
+            self.plan_cache.put(shape, plan.abstract(variable_names))
+
+    def print_statistics(self):
+        print("\nRewrite Statistics\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n")
+        print(" Rules skipped by screening:  %d" % self.screen_skips)
+        print(" Rules analyzed:  %d" % self.screen_hits)
+        print(" Rewrite plan cache hits:  %d" % self.plan_cache.hits)
+        print(" Rewrite plan cache misses:  %d" % self.plan_cache.misses)
+        if self.rebuild_cache is not None:
+            print(" Rebuild cache file hits:  %d" % self.rebuild_cache.hits)
+            print(" Rebuild cache file misses:  %d" % self.rebuild_cache.misses)
+            print(" Cached rules with a changed circularity verdict:  %d" % self.changed_verdicts)
+        if self.ground_estimator is not None:
+            print(" Rewrites below the minimum estimated gain:  %d" % self.gated_rewrites)
+        if len(self.projections) > 0:
+            print(" Projections introduced:  %d" % len(self.projections))
+            print(" Rewrites using an earlier projection:  %d" %
+                  sum(projection.users - 1 for projection in self.projections.values()))
+        for form in sorted(set(form for _, _, form in self.rewrite_forms)):
+            print(" Rules rewritten in form (%s):  %d" % (form, sum(1 for _, _, rewrite_form in self.rewrite_forms
+                                                                 if rewrite_form == form)))
+        print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
 
     def print_predicate_graph(self):
         print("\nInput Predicate "
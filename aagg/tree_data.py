@@ -1,5 +1,11 @@
 class TreeData:
     """This class is used to track information about parent nodes"""
-    def __init__(self, head=False):
+    def __init__(self, head=False, condition=False):
         self.head = head
+        self.condition = condition  # Within the condition of a conditional literal in the head
 
+
+# TreeData objects are never modified, so visitors share these instead of allocating one per node
+BODY_DATA = TreeData()
+HEAD_DATA = TreeData(head=True)
+HEAD_CONDITION_DATA = TreeData(head=True, condition=True)
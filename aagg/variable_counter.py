@@ -1,4 +1,5 @@
 import clingo
+import constants
 
 
 def convert_binary_op_to_var_plus_int(term):
@@ -125,77 +126,187 @@ class VariableCounter:
                 else:
                     self.comparison_variables['greatThan'][var2] = [var1]
 
-    def longest_path_finder(self, comp_type, seen_set, current_var):
+    def comparison_graph_vertices(self, comp_type):
         """
-            Given a comparison type, set of variables already seen,
-                and our current variable
-            Return variables in longest continuous path of comparisons
-                between variables, recursively exploring each path in 
-                the comparison 'tree' of given comparison type
+            Given a comparison type
+            Returns the sorted list of variables occurring in a comparison
+                of that type, so that searches break ties deterministically
         """
-        # First check special cases for each comparison type
-        if comp_type == 'greatThan':
-            # Abort path if a cycle is found in greatThan case, for this means nonsense logic
-            if self.comparison_variables[comp_type].has_key(current_var):
-                for nextVar in self.comparison_variables[comp_type][current_var]:
-                    if nextVar in seen_set:  # if we've seen a var which currVar is greater than...
-                        return []
-
-        elif comp_type == 'notEqual':
-            # Simpy return current path if current variable does not 
-            #  have a comparison with all other seen variables, in notEqual case
-            for seenVar in seen_set:
-                if current_var not in self.comparison_variables[comp_type][seenVar]:
-                    return list(seen_set)
-
-        # Add current variable to the path and the set of seen variables
-        seen_set.add(current_var)
-
-        # Get set of variables having a comparison with the current variable
-        if self.comparison_variables[comp_type].has_key(current_var):  # error checking
-            nextVars = set([nextVar for nextVar in self.comparison_variables[comp_type][current_var]])
-            operating_set = nextVars
-        else:
-            operating_set = set()
-
-        # Subtract variables already seen from the next path step candidates
-        operating_set = operating_set - seen_set
-
-        if len(operating_set) == 0:
-            # Return if no more paths
-            return list(seen_set)
-        else:
-            # get longest path from this node for each var it has comparisons with
-            path_sets = []
-            for var in operating_set:
-                path_sets.append(self.longest_path_finder(comp_type, seen_set.copy(), var))
-
-            # return longest of paths
-            greatest_path = []
-            for path in path_sets:
-                if len(path) > len(greatest_path):
-                    greatest_path = path
-            return greatest_path
+        vertices = set(self.comparison_variables[comp_type].keys())
+        for adjacent_vars in self.comparison_variables[comp_type].values():
+            vertices.update(adjacent_vars)
+        return sorted(vertices)
+
+    def acyclic_variables(self):
+        """
+            Finds the strongly connected components of the greatThan graph
+                (iterative Tarjan) and keeps the variables which do not lie
+                on a cycle; a cycle of greatThan comparisons is nonsense logic
+            Returns those variables in reverse topological order, i.e. each
+                variable is listed after every variable it is greater than
+        """
+        graph = self.comparison_variables['greatThan']
+        index = {}
+        low_link = {}
+        on_stack = set()
+        stack = []
+        ordered = []
+        counter = 0
+
+        for root in self.comparison_graph_vertices('greatThan'):
+            if root in index:
+                continue
+            index[root] = low_link[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(graph.get(root, [])))]
+
+            while work:
+                var, successors = work[-1]
+                advanced = False
+                for next_var in successors:
+                    if next_var not in index:
+                        index[next_var] = low_link[next_var] = counter
+                        counter += 1
+                        stack.append(next_var)
+                        on_stack.add(next_var)
+                        work.append((next_var, iter(graph.get(next_var, []))))
+                        advanced = True
+                        break
+                    elif next_var in on_stack:
+                        low_link[var] = min(low_link[var], index[next_var])
+                if advanced:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[var])
+
+                if low_link[var] == index[var]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == var:
+                            break
+                    # Components are emitted after every component they reach
+                    if len(component) == 1 and var not in graph.get(var, []):
+                        ordered.append(var)
+
+        return ordered
+
+    def longest_chain(self):
+        """
+            Finds the longest continuous chain of greatThan comparisons
+                by dynamic programming over the acyclic variables, taken
+                in reverse topological order
+            Returns the variables in that chain
+        """
+        graph = self.comparison_variables['greatThan']
+        ordered = self.acyclic_variables()
+
+        chain_length = {}
+        chain_next = {}
+        for var in ordered:
+            chain_length[var] = 1
+            chain_next[var] = None
+            for next_var in sorted(set(graph.get(var, []))):
+                if next_var in chain_length and chain_length[next_var] + 1 > chain_length[var]:
+                    chain_length[var] = chain_length[next_var] + 1
+                    chain_next[var] = next_var
+
+        start = None
+        for var in sorted(chain_length.keys()):
+            if start is None or chain_length[var] > chain_length[start]:
+                start = var
+
+        chain = []
+        while start is not None:
+            chain.append(start)
+            start = chain_next[start]
+        return chain
+
+    def largest_clique(self, size_cap=constants.MAX_COUNTING_CLIQUE, node_budget=constants.MAX_CLIQUE_SEARCH_NODES):
+        """
+            Finds a largest set of variables which are pairwise compared
+                by notEqual comparisons, using branch and bound with a
+                greedy coloring bound
+            The search is exponential in the worst case; it stops once a
+                clique of size_cap variables is found, or once node_budget
+                search nodes were expanded, in which case the best clique
+                found so far (possibly not a largest one) is returned
+            Returns the variables in that clique
+        """
+        adjacency = {}
+        for var, adjacent_vars in self.comparison_variables['notEqual'].items():
+            adjacency.setdefault(var, set()).update(adjacent_vars)
+            for adjacent_var in adjacent_vars:
+                adjacency.setdefault(adjacent_var, set()).add(var)
+        for var in adjacency:
+            adjacency[var].discard(var)
+
+        best = [[]]
+        nodes = [0]
+
+        def color_bound(candidates):
+            # Greedy coloring; vertices of one color class are pairwise
+            #  non-adjacent, so a clique takes at most one from each class
+            colored = []
+            color_classes = []
+            for var in candidates:
+                for color_class in color_classes:
+                    if not adjacency[var] & color_class:
+                        color_class.add(var)
+                        break
+                else:
+                    color_classes.append(set([var]))
+            for color, color_class in enumerate(color_classes):
+                for var in sorted(color_class):
+                    colored.append((var, color + 1))
+            return colored
+
+        def expand(clique, candidates):
+            nodes[0] += 1
+            if len(best[0]) >= size_cap or nodes[0] > node_budget:
+                return
+            colored = color_bound(candidates)
+            while colored:
+                var, color = colored.pop()
+                if len(clique) + color <= len(best[0]):
+                    return
+                new_clique = clique + [var]
+                new_candidates = [other for other in candidates if other in adjacency[var]]
+                if new_candidates:
+                    expand(new_clique, new_candidates)
+                elif len(new_clique) > len(best[0]):
+                    best[0] = new_clique
+                if len(best[0]) >= size_cap or nodes[0] > node_budget:
+                    return
+                candidates = [other for other in candidates if other != var]
+
+        # Order candidates by decreasing degree so large cliques are found early
+        candidates = sorted(adjacency.keys(), key=lambda v: (-len(adjacency[v]), v))
+        expand([], candidates)
+        return best[0][:size_cap]
 
     def get_counting_variables(self):
         """
-            Gets potential counting variables using comparisons by 
-                finding the longest consecutive comparison path out of 
-                both types of comparisons
+            Gets potential counting variables using comparisons by
+                finding the longest chain of greatThan comparisons and
+                the largest clique of notEqual comparisons
+            The chain search is polynomial in the number of comparisons;
+                the clique search is bounded by MAX_CLIQUE_SEARCH_NODES,
+                and the chain is used whenever its result is at least as
+                large
             This function is called in EquivalenceTransformer.rewritable
         """
-        # For both comparison types, find the longest comparison path starting from each variable
-        longest_paths = []
-        for comparison_type in self.comparison_variables.keys():
-            for var in self.comparison_variables[comparison_type].keys():
-                longest_path = self.longest_path_finder(comparison_type, set(), var)
-                longest_paths.append(longest_path)
-
-        # Return the subset of counting_vars_combs with greatest length    
-        # This works non-deterministically, but if we have overlapping yet non-equal
-        #  possibilities, the rule will note be rewritten anyway
-        greatest = []
-        for path in longest_paths:
-            if len(path) > len(greatest):
-                greatest = path
+        # If we have overlapping yet non-equal possibilities, the rule
+        #  will not be rewritten anyway
+        greatest = self.longest_chain()
+        clique = self.largest_clique()
+        if len(clique) > len(greatest):
+            greatest = clique
         return greatest
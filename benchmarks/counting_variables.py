@@ -0,0 +1,92 @@
+#!/usr/bin/env python2.7
+"""
+    Measures how the counting variable search of VariableCounter scales
+        with the number b of compared variables, for
+        - a chain of '<' comparisons (X1 < X2 < ... < Xb),
+        - a clique of '!=' comparisons between all b variables, and
+        - random '<' and '!=' comparisons between b variables, with
+            each pair compared with the given probability
+"""
+
+import argparse, json, os, random, sys, time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), 'aagg'))
+
+import clingo
+import constants
+from variable_counter import VariableCounter
+
+
+def variable(name):
+    return clingo.ast.Variable(constants.LOCATION, name)
+
+
+def chain_comparisons(size, rng, density):
+    return [("X%d" % index, "X%d" % (index + 1), clingo.ast.ComparisonOperator.LessThan)
+            for index in range(1, size)]
+
+
+def clique_comparisons(size, rng, density):
+    return [("X%d" % index, "X%d" % other, clingo.ast.ComparisonOperator.NotEqual)
+            for index in range(1, size + 1) for other in range(index + 1, size + 1)]
+
+
+def random_comparisons(size, rng, density):
+    operators = [clingo.ast.ComparisonOperator.LessThan, clingo.ast.ComparisonOperator.NotEqual]
+    return [("X%d" % index, "X%d" % other, rng.choice(operators))
+            for index in range(1, size + 1) for other in range(index + 1, size + 1) if rng.random() < density]
+
+
+SHAPES = {'chain': chain_comparisons, 'clique': clique_comparisons, 'random': random_comparisons}
+
+
+def time_search(comparisons, repeats):
+    """
+        Given comparisons as (variable name, variable name, operator)
+        Returns the smallest time of the counting variable search over
+            the repeats, and the number of counting variables found
+    """
+    terms = [(variable(name1), variable(name2), operator) for name1, name2, operator in comparisons]
+    best = None
+    for _ in range(repeats):
+        variable_counter = VariableCounter()
+        for term1, term2, operator in terms:
+            variable_counter.mark_comparison(term1, term2, operator)
+
+        start = time.time()
+        counting_variables = variable_counter.get_counting_variables()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(counting_variables)
+
+
+def define_args(arg_parser):
+    arg_parser.description = 'Benchmark the scaling of the VariableCounter counting variable search'
+    arg_parser.add_argument('--sizes', type=int, nargs='*', default=[2, 4, 8, 16, 32, 64, 128],
+                            help='Numbers of compared variables')
+    arg_parser.add_argument('--density', type=float, default=0.5,
+                            help='Probability of a comparison between two variables of the random shape')
+    arg_parser.add_argument('-n', '--repeats', type=int, default=5, help='Runs per size (the fastest is kept)')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('-o', '--output', type=str, default='', help='Write the results to this JSON file')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    define_args(parser)
+    args = parser.parse_args()
+
+    results = []
+    print("%-8s%8s%12s%10s" % ("shape", "b", "seconds", "found"))
+    for shape in sorted(SHAPES):
+        rng = random.Random(args.seed)
+        for size in args.sizes:
+            seconds, found = time_search(SHAPES[shape](size, rng, args.density), args.repeats)
+            results.append({'shape': shape, 'b': size, 'seconds': seconds, 'found': found})
+            print("%-8s%8d%12.6f%10d" % (shape, size, seconds, found))
+
+    if args.output:
+        with open(args.output, 'w') as output_fd:
+            json.dump({'density': args.density, 'seed': args.seed, 'results': results}, output_fd,
+                      sort_keys=True, indent=2, separators=(',', ': '))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python2.7
+"""
+    Generates synthetic ASP encodings for benchmarking the AAgg.
+
+    An encoding consists of
+        - a layered chain of 'depth' predicates, l1 depending on l0, l2
+            on l1, and so on, whose facts are given by intervals,
+        - 'rules' candidate rules, each counting over a predicate of the
+            chain with a chain of 'b' comparisons ('<' or '!='), and
+            sharing 'projection' further variables with its other
+            literals (so that a projection rule is needed),
+        - pools in the body of a 'pool_density' fraction of candidate
+            rules, and
+        - for a 'recursion' fraction of candidate rules, a rule making
+            the chain depend on the head of the candidate rule, so that
+            the counting predicate depends on the head (forms 2 and 3
+            become unsafe)
+"""
+
+import argparse, random, sys
+
+
+# Parameters of a workload, with their default values
+DEFAULTS = {
+    'rules': 100,
+    'b': 2,
+    'comparison': '<',
+    'projection': 1,
+    'pool_density': 0.0,
+    'depth': 3,
+    'recursion': 0.0,
+    'domain': 10,
+    'seed': 0,
+}
+
+
+def workload_parameters(**parameters):
+    """
+        Given workload parameters, checks them and fills in defaults
+        Returns the full parameter dictionary
+    """
+    for name in parameters:
+        if name not in DEFAULTS:
+            raise ValueError("Unknown workload parameter: %s" % name)
+    full_parameters = dict(DEFAULTS)
+    full_parameters.update(parameters)
+
+    if full_parameters['comparison'] not in ('<', '!='):
+        raise ValueError("Comparison must be '<' or '!=', not %s" % full_parameters['comparison'])
+    if full_parameters['b'] < 2:
+        raise ValueError("Chain length b must be at least 2")
+    if full_parameters['depth'] < 1:
+        raise ValueError("Dependency graph depth must be at least 1")
+    return full_parameters
+
+
+def variable_list(prefix, count):
+    return ["%s%d" % (prefix, index) for index in range(1, count + 1)]
+
+
+def layer_rules(parameters):
+    """Returns the facts and rules of the layered predicate chain"""
+    arity = parameters['projection'] + 1
+    domain = "1..%d" % parameters['domain']
+    statements = ["l0(%s)." % ", ".join([domain] * arity)]
+
+    variables = variable_list("X", arity)
+    for layer in range(1, parameters['depth']):
+        statements.append("l%d(%s) :- l%d(%s)." % (layer, ", ".join(variables), layer - 1, ", ".join(variables)))
+    return statements
+
+
+def candidate_rule(index, parameters, rng):
+    """
+        Returns the candidate rule of the given index, and the rule
+            closing a cycle through its head if it is recursive
+    """
+    layer = rng.randrange(parameters['depth'])
+    counting = variable_list("C", parameters['b'])
+    projected = variable_list("Z", parameters['projection'])
+
+    body = ["l%d(%s)" % (layer, ", ".join([counting_variable] + projected)) for counting_variable in counting]
+    if parameters['comparison'] == '<':
+        body.extend("%s < %s" % (counting[position], counting[position + 1])
+                    for position in range(len(counting) - 1))
+    else:
+        body.extend("%s != %s" % (counting[position], counting[other])
+                    for position in range(len(counting)) for other in range(position + 1, len(counting)))
+
+    if rng.random() < parameters['pool_density']:
+        body.append("tag(%d;%d)" % (index, index + 1))
+
+    head = "h%d(%s)" % (index, ", ".join(projected)) if projected else "h%d" % index
+    statements = ["%s :- %s." % (head, "; ".join(body))]
+
+    if rng.random() < parameters['recursion']:
+        closing_variables = variable_list("X", parameters['projection'] + 1)
+        closing_body = "h%d(%s)" % (index, ", ".join(closing_variables[1:])) if projected else "h%d" % index
+        statements.append("l0(%s) :- %s; l0(%s)." % (", ".join(closing_variables), closing_body,
+                                                    ", ".join(closing_variables)))
+    return statements
+
+
+def generate(parameters):
+    """
+        Given (full) workload parameters
+        Returns the text of the encoding
+    """
+    rng = random.Random(parameters['seed'])
+    statements = ["% AAgg benchmark workload: " +
+                  ", ".join("%s=%s" % (name, parameters[name]) for name in sorted(parameters))]
+    statements.extend(layer_rules(parameters))
+    if parameters['pool_density'] > 0:
+        statements.append("tag(0..%d)." % (parameters['rules'] + 1))
+    for index in range(parameters['rules']):
+        statements.extend(candidate_rule(index, parameters, rng))
+    return "\n".join(statements) + "\n"
+
+
+def define_args(arg_parser):
+    arg_parser.description = 'Generate a synthetic AAgg benchmark encoding'
+    arg_parser.add_argument('-o', '--output', type=str, default='', help='Output file (standard output by default)')
+    for name in sorted(DEFAULTS):
+        arg_parser.add_argument('--' + name.replace('_', '-'), dest=name, type=type(DEFAULTS[name]),
+                                default=DEFAULTS[name])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    define_args(parser)
+    args = parser.parse_args()
+
+    workload = generate(workload_parameters(**dict((name, getattr(args, name)) for name in DEFAULTS)))
+    if args.output:
+        with open(args.output, 'w') as out_fd:
+            out_fd.write(workload)
+    else:
+        sys.stdout.write(workload)
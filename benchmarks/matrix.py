@@ -0,0 +1,306 @@
+#!/usr/bin/env python2.7
+"""
+    Grounds and solves encodings against a directory of instances, for
+        the original encoding and its rewritings in each aggregate form,
+        with anonymous and with named aggregate elements.
+
+    Each encoding is first rewritten once per variant. Then every
+        (encoding, instance, variant) job is run in its own process, in
+        parallel, with warm-up runs and a timeout per run. The median
+        and interquartile range of the ground and solve times of each
+        job are written as CSV or JSON.
+    With --incremental, the encodings are grounded and solved step by
+        step as in clingo's incremental mode, and the JSON output also
+        holds the ground size and times of each step
+"""
+
+import argparse, csv, fnmatch, json, multiprocessing, os, shutil, sys, tempfile, time, traceback
+from multiprocessing.pool import ThreadPool
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), 'aagg'))
+
+import constants
+from main import AutomatedAggregator, build_arguments, program_metrics, solve_incremental
+
+# Name of the variant grounding the encoding as given
+ORIGINAL = 'original'
+
+# Columns of the CSV output, in order
+COLUMNS = ['encoding', 'instance', 'variant', 'form', 'anonymous', 'status', 'satisfiable', 'runs',
+           'ground_median', 'ground_iqr', 'solve_median', 'solve_iqr', 'atoms', 'rules', 'aggregates',
+           'steps', 'rewritten_rules', 'sum_b', 'sum_projection']
+
+
+def variants(forms):
+    """
+        Given the aggregate forms to use
+        Returns (name, aggregate form, anonymous) triples of the original
+            and every rewriting
+    """
+    matrix = [(ORIGINAL, None, None)]
+    for form in forms:
+        for anonymous in (False, True):
+            matrix.append(("form%d%s" % (form, '-anon' if anonymous else ''), form, anonymous))
+    return matrix
+
+
+def quantile(values, fraction):
+    """Returns the given quantile of the values, interpolating linearly"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def interquartile_range(values):
+    return quantile(values, 0.75) - quantile(values, 0.25)
+
+
+def init_rewriter():
+    sys.stdout = open(os.devnull, 'w')
+
+
+def rewrite(task):
+    """
+        Worker task: given an encoding, a variant and an output file,
+            rewrites the encoding into the output file
+        Returns the task, the number of rewritten rules with the sums
+            of their b and projection arities (the features of the cost
+            model), and the error that occurred, if any
+    """
+    encoding, (name, form, anonymous), output = task
+    try:
+        arguments = build_arguments([encoding], output=output, confirm_rewrite=True,
+                                    aggregate_form=form, use_anonymous_variable=anonymous)
+        aggregator = AutomatedAggregator(arguments)
+        aggregator.run()
+        rewrite_forms = aggregator.transformer.rewrite_forms
+        features = {
+            'rewritten_rules': len(rewrite_forms),
+            'sum_b': sum(b for b, _, _ in rewrite_forms),
+            'sum_projection': sum(projection_arity for _, projection_arity, _ in rewrite_forms),
+        }
+        return task, features, None
+    except Exception:
+        return task, None, traceback.format_exc()
+
+
+def solve_child(files, runs, incremental, connection):
+    """
+        Grounds and solves the given files the given number of times,
+            each with a new control, sending the ground and solve times,
+            satisfiability and ground program metrics of each run
+            through the connection as soon as it is done
+        If incremental mode options (imin, imax, istop) are given, the
+            files are solved step by step, and the metrics of each step
+            are sent too
+    """
+    try:
+        for _ in range(runs):
+            control = AutomatedAggregator.create_control()
+            for path in files:
+                control.load(path)
+
+            if incremental is not None:
+                steps, result = solve_incremental(control, **incremental)
+                connection.send({'ground': sum(step['ground time'] for step in steps),
+                                 'solve': sum(step['solve time'] for step in steps),
+                                 'satisfiable': result.satisfiable,
+                                 'metrics': dict(steps[-1]), 'steps': [dict(step) for step in steps]})
+                continue
+
+            ground_start = time.time()
+            control.ground([('base', [])])
+            ground_time = time.time() - ground_start
+
+            solve_start = time.time()
+            satisfiable = control.solve().satisfiable
+            solve_time = time.time() - solve_start
+
+            connection.send({'ground': ground_time, 'solve': solve_time, 'satisfiable': satisfiable,
+                             'metrics': dict(program_metrics(control.statistics, ground_time, solve_time))})
+    except Exception:
+        connection.send({'error': traceback.format_exc()})
+    finally:
+        connection.close()
+
+
+def run_job(job, warmup, repeats, timeout, incremental=None):
+    """
+        Given a job, the number of warm-up and measured runs, the
+            timeout (in seconds) of each run, and the incremental mode
+            options, if the job is solved step by step
+        Runs the job in a separate process, which is terminated when a
+            run exceeds the timeout
+        Returns the result row of the job
+    """
+    row = dict((key, value) for key, value in job.items() if key != 'files')
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=solve_child, args=(job['files'], warmup + repeats, incremental, sender))
+    process.start()
+    sender.close()
+
+    runs = []
+    row['status'] = 'ok'
+    try:
+        for _ in range(warmup + repeats):
+            if not receiver.poll(timeout):
+                row['status'] = 'timeout'
+                break
+            run = receiver.recv()
+            if 'error' in run:
+                row['status'] = 'error'
+                row['error'] = run['error']
+                break
+            runs.append(run)
+    except EOFError:
+        row['status'] = 'error'
+        row['error'] = "Run exited with code %s" % process.exitcode
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+    measured = runs[warmup:]
+    row['runs'] = len(measured)
+    if measured:
+        row['satisfiable'] = measured[-1]['satisfiable']
+        for phase in ('ground', 'solve'):
+            times = [run[phase] for run in measured]
+            row[phase + '_median'] = quantile(times, 0.5)
+            row[phase + '_iqr'] = interquartile_range(times)
+        for metric in ('atoms', 'rules', 'aggregates'):
+            row[metric] = measured[-1]['metrics'][metric]
+        if 'steps' in measured[-1]:
+            row['steps'] = len(measured[-1]['steps'])
+            row['step_metrics'] = measured[-1]['steps']
+    return row
+
+
+def find_instances(directory, pattern):
+    instances = []
+    for root, _, names in os.walk(directory):
+        instances.extend(os.path.join(root, name) for name in fnmatch.filter(names, pattern))
+    return sorted(instances)
+
+
+def run_matrix(encodings, instances, matrix, arguments, directory):
+    """
+        Rewrites every encoding in every variant of the matrix, then
+            runs every job with arguments.jobs jobs at a time
+        Returns the result rows, in matrix order
+    """
+    rewritten = {}
+    features = {}
+    tasks = []
+    for encoding in encodings:
+        for variant in matrix:
+            if variant[0] == ORIGINAL:
+                rewritten[encoding, variant[0]] = encoding
+                features[encoding, variant[0]] = {'rewritten_rules': 0, 'sum_b': 0, 'sum_projection': 0}
+                continue
+            output = os.path.join(directory, "%d-%s-%s" % (len(tasks), variant[0], os.path.basename(encoding)))
+            tasks.append((encoding, variant, output))
+
+    pool = multiprocessing.Pool(arguments.jobs, init_rewriter)
+    try:
+        for (encoding, variant, output), variant_features, error in pool.imap(rewrite, tasks):
+            if error is None:
+                rewritten[encoding, variant[0]] = output
+                features[encoding, variant[0]] = variant_features
+            else:
+                sys.stderr.write("Rewriting %s in %s failed:\n%s" % (encoding, variant[0], error))
+    finally:
+        pool.close()
+        pool.join()
+
+    jobs = []
+    for encoding in encodings:
+        for instance in instances:
+            for name, form, anonymous in matrix:
+                job = {'encoding': encoding, 'instance': instance, 'variant': name,
+                       'form': form, 'anonymous': anonymous}
+                if (encoding, name) in rewritten:
+                    job['files'] = [rewritten[encoding, name], instance]
+                    job.update(features[encoding, name])
+                jobs.append(job)
+
+    incremental = None
+    if arguments.incremental:
+        incremental = {'imin': arguments.imin, 'imax': arguments.imax, 'istop': arguments.istop}
+
+    def run(job):
+        if 'files' not in job:
+            row = dict(job)
+            row.update({'status': 'error', 'error': 'rewriting failed', 'runs': 0})
+            return row
+        row = run_job(job, arguments.warmup, arguments.repeats, arguments.timeout, incremental)
+        sys.stderr.write("%s %s %s: %s\n" % (os.path.basename(job['encoding']), os.path.basename(job['instance']),
+                                            job['variant'], row['status']))
+        return row
+
+    # Threads only wait on the processes running the jobs
+    thread_pool = ThreadPool(arguments.jobs)
+    try:
+        return thread_pool.map(run, jobs, 1)
+    finally:
+        thread_pool.close()
+        thread_pool.join()
+
+
+def write_rows(rows, output, output_format):
+    with open(output, 'wb' if output_format == 'csv' else 'w') as output_fd:
+        if output_format == 'csv':
+            writer = csv.DictWriter(output_fd, COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, output_fd, sort_keys=True, indent=2, separators=(',', ': '))
+
+
+def define_args(arg_parser):
+    arg_parser.description = 'Ground and solve encodings against instances, for the original and rewritten encodings'
+    arg_parser.add_argument('encoding', nargs='+', help='Gringo encodings')
+    arg_parser.add_argument('-i', '--instances', type=str, required=True, help='Directory of instance files')
+    arg_parser.add_argument('--pattern', type=str, default='*.lp', help='File name pattern of instances')
+    arg_parser.add_argument('--forms', type=int, nargs='*', default=[1, 2, 3], help='Aggregate forms to use')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                            help='Number of jobs run at a time')
+    arg_parser.add_argument('-t', '--timeout', type=float, default=300, help='Timeout of each run, in seconds')
+    arg_parser.add_argument('-w', '--warmup', type=int, default=1, help='Unmeasured runs of each job')
+    arg_parser.add_argument('-n', '--repeats', type=int, default=3, help='Measured runs of each job')
+    arg_parser.add_argument('-o', '--output', type=str, default='matrix.csv', help='Output file')
+    arg_parser.add_argument('--format', choices=['csv', 'json'], default=None,
+                            help='Output format (by default, from the extension of the output file)')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='Ground and solve step by step, as clingo\'s incremental mode (see main.py)')
+    arg_parser.add_argument('--imin', type=int, default=0, help='Minimum number of steps of --incremental')
+    arg_parser.add_argument('--imax', type=int, default=0,
+                            help='Maximum number of steps of --incremental (0 for no limit)')
+    arg_parser.add_argument('--istop', choices=[constants.ISTOP_SAT, constants.ISTOP_UNSAT, constants.ISTOP_UNKNOWN],
+                            default=constants.ISTOP_SAT, help='Result which stops --incremental')
+    arg_parser.add_argument('--keep', type=str, default='', help='Keep rewritten encodings in this directory')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    define_args(parser)
+    args = parser.parse_args()
+
+    instance_files = find_instances(args.instances, args.pattern)
+    if not instance_files:
+        parser.error("No instances matching %s in %s" % (args.pattern, args.instances))
+
+    work_directory = args.keep or tempfile.mkdtemp(prefix='aagg-matrix-')
+    if not os.path.isdir(work_directory):
+        os.makedirs(work_directory)
+    try:
+        result_rows = run_matrix(args.encoding, instance_files, variants(args.forms), args, work_directory)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_directory)
+
+    write_rows(result_rows, args.output, args.format or ('json' if args.output.endswith('.json') else 'csv'))
+    print("%d jobs written to %s" % (len(result_rows), args.output))
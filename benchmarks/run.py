@@ -0,0 +1,260 @@
+#!/usr/bin/env python2.7
+"""
+    Runs the AAgg end to end on generated workloads (see generate.py),
+        recording the time of each phase of AutomatedAggregator.run and
+        the peak memory of each run in a JSON results file, along with
+        the ground program metrics of workloads which run clingo.
+
+    Each run happens in a forked process, so peak memory is that of a
+        single run and no state is shared between runs.
+
+    Given a baseline results file, the results are compared against it
+        and regressions are reported; the exit status is 1 if any was
+        found
+"""
+
+import argparse, json, multiprocessing, os, platform, resource, shutil, sys, tempfile, time, traceback
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), 'aagg'))
+
+from generate import workload_parameters, generate
+from main import AutomatedAggregator, build_arguments
+
+
+# Phases timed by AutomatedAggregator.run, in order
+PHASES = ['parse', 'explore', 'transform', 'write', 'ground', 'solve']
+
+
+def workload(name, options=None, **parameters):
+    """
+        Given a workload name, AAgg options (as accepted by
+            build_arguments) and generator parameters
+        Returns the workload description
+    """
+    return {'name': name, 'parameters': workload_parameters(**parameters), 'options': options or {}}
+
+
+SUITES = {
+    'quick': [
+        workload('rules-100', rules=100),
+        workload('neq-b3', rules=100, b=3, comparison='!='),
+        workload('recursive', rules=100, depth=5, recursion=0.5),
+    ],
+    'default': [
+        workload('rules-100', rules=100),
+        workload('rules-1000', rules=1000),
+        workload('rules-5000', rules=5000),
+        workload('lt-b2', rules=500, b=2),
+        workload('lt-b4', rules=500, b=4),
+        workload('lt-b8', rules=500, b=8),
+        workload('neq-b2', rules=500, b=2, comparison='!='),
+        workload('neq-b4', rules=500, b=4, comparison='!='),
+        workload('neq-b8', rules=500, b=8, comparison='!='),
+        workload('projection-0', rules=500, projection=0),
+        workload('projection-3', rules=500, projection=3),
+        workload('pools-50', rules=500, pool_density=0.5),
+        workload('pools-50-kept', {'keep_pools': True}, rules=500, pool_density=0.5),
+        workload('depth-20', rules=500, depth=20),
+        workload('recursive-50', rules=500, depth=20, recursion=0.5),
+        workload('form-2', {'aggregate_form': 2}, rules=500, b=4),
+        workload('form-3', {'aggregate_form': 3}, rules=500, b=4),
+        workload('stream', {'stream': True}, rules=1000),
+        workload('jobs-4', {'jobs': 4}, rules=1000),
+        workload('ground-solve', {'run_clingo': True}, rules=100, domain=20),
+        workload('ground-compare', {'compare_original': True}, rules=100, domain=20),
+    ],
+}
+
+
+def run_child(encoding, output, options, connection):
+    """
+        Runs the AAgg once in a forked process
+        Sends the phase timings and peak memory (in kilobytes) of the
+            run, or the error that occurred, through the connection
+    """
+    try:
+        sys.stdout = open(os.devnull, 'w')
+        arguments = build_arguments([encoding], output=output, confirm_rewrite=True, **options)
+        aggregator = AutomatedAggregator(arguments)
+        start = time.time()
+        aggregator.run()
+        timings = dict(aggregator.timings)
+        timings['total'] = time.time() - start
+        connection.send({'timings': timings, 'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                         'metrics': dict(aggregator.metrics) if aggregator.metrics is not None else None})
+    except Exception:
+        connection.send({'error': traceback.format_exc()})
+    finally:
+        connection.close()
+
+
+def run_once(encoding, output, options):
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=run_child, args=(encoding, output, options, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {'error': "Run exited with code %s" % process.exitcode}
+    process.join()
+    return result
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2 == 1:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+def run_workload(description, directory, repeats):
+    """
+        Given a workload description, a working directory and the
+            number of repeated runs
+        Returns the results of the workload: the median time of each
+            phase and the largest peak memory over the runs
+    """
+    encoding = os.path.join(directory, description['name'] + '.lp')
+    program = generate(description['parameters'])
+    with open(encoding, 'w') as enc:
+        enc.write(program)
+    output = os.path.join(directory, description['name'] + '_rewritten.lp')
+
+    result = dict(description)
+    result['statements'] = program.count('\n')
+    runs = []
+    for _ in range(repeats):
+        run = run_once(encoding, output, description['options'])
+        if 'error' in run:
+            result['error'] = run['error']
+            return result
+        runs.append(run)
+
+    result['runs'] = [run['timings'] for run in runs]
+    result['timings'] = dict((phase, median([run['timings'][phase] for run in runs]))
+                             for phase in PHASES + ['total'] if phase in runs[0]['timings'])
+    result['peak_rss_kb'] = max(run['peak_rss_kb'] for run in runs)
+    if runs[0]['metrics'] is not None:
+        result['metrics'] = runs[0]['metrics']
+    return result
+
+
+def run_suite(workloads, repeats, keep_directory=None):
+    directory = keep_directory or tempfile.mkdtemp(prefix='aagg-benchmark-')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        results = []
+        for description in workloads:
+            sys.stderr.write("Running %s...\n" % description['name'])
+            results.append(run_workload(description, directory, repeats))
+            if 'error' in results[-1]:
+                sys.stderr.write(results[-1]['error'])
+        return results
+    finally:
+        if keep_directory is None:
+            shutil.rmtree(directory)
+
+
+def compare(baseline, results, threshold, min_seconds):
+    """
+        Given baseline and current results, a relative slowdown (or
+            memory growth) threshold, and a time difference below
+            which timings are considered noise
+        Returns a list of regression descriptions
+    """
+    baseline_results = dict((result['name'], result) for result in baseline['results'])
+    regressions = []
+    for result in results['results']:
+        base = baseline_results.get(result['name'])
+        if base is None or 'error' in base:
+            continue
+        if 'error' in result:
+            regressions.append("%s: failed (%s)" % (result['name'], result['error'].strip().splitlines()[-1]))
+            continue
+        if base['parameters'] != result['parameters'] or base['options'] != result['options']:
+            sys.stderr.write("Skipping %s: workload differs from the baseline\n" % result['name'])
+            continue
+
+        for phase, seconds in sorted(result['timings'].items()):
+            base_seconds = base['timings'].get(phase)
+            if base_seconds is None:
+                continue
+            if seconds - base_seconds > min_seconds and seconds > base_seconds * (1 + threshold):
+                regressions.append("%s: %s %.3fs -> %.3fs (%+.0f%%)" % (
+                    result['name'], phase, base_seconds, seconds, 100.0 * (seconds / base_seconds - 1)))
+
+        if result['peak_rss_kb'] > base['peak_rss_kb'] * (1 + threshold):
+            regressions.append("%s: peak memory %d KB -> %d KB (%+.0f%%)" % (
+                result['name'], base['peak_rss_kb'], result['peak_rss_kb'],
+                100.0 * (float(result['peak_rss_kb']) / base['peak_rss_kb'] - 1)))
+    return regressions
+
+
+def print_results(results):
+    print("%-16s" % "workload" + "".join("%11s" % phase for phase in PHASES + ['total']) + "%13s" % "peak KB")
+    for result in results['results']:
+        if 'error' in result:
+            print("%-16s failed" % result['name'])
+            continue
+        line = "%-16s" % result['name']
+        for phase in PHASES + ['total']:
+            line += "%11.3f" % result['timings'][phase] if phase in result['timings'] else "%11s" % "-"
+        print(line + "%13d" % result['peak_rss_kb'])
+
+
+def define_args(arg_parser):
+    arg_parser.description = 'Benchmark the AAgg on generated workloads'
+    arg_parser.add_argument('--suite', choices=sorted(SUITES.keys()), default='default',
+                            help='Workloads to run')
+    arg_parser.add_argument('--only', type=str, nargs='*', default=[], help='Run only the named workloads')
+    arg_parser.add_argument('-n', '--repeats', type=int, default=3, help='Runs per workload (the median is kept)')
+    arg_parser.add_argument('-o', '--output', type=str, default='', help='Write the results to this JSON file')
+    arg_parser.add_argument('--baseline', type=str, default='', help='Compare the results against this JSON file')
+    arg_parser.add_argument('--results', type=str, default='',
+                            help='Compare this JSON results file instead of running the workloads')
+    arg_parser.add_argument('--threshold', type=float, default=0.10,
+                            help='Relative slowdown or memory growth reported as a regression')
+    arg_parser.add_argument('--min-seconds', type=float, default=0.005,
+                            help='Timing differences below this many seconds are ignored')
+    arg_parser.add_argument('--keep', type=str, default='',
+                            help='Keep generated encodings and outputs in this directory')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    define_args(parser)
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as results_fd:
+            current = json.load(results_fd)
+    else:
+        selected = [description for description in SUITES[args.suite]
+                    if not args.only or description['name'] in args.only]
+        current = {
+            'suite': args.suite,
+            'repeats': args.repeats,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': run_suite(selected, args.repeats, args.keep or None),
+        }
+        if args.output:
+            with open(args.output, 'w') as output_fd:
+                json.dump(current, output_fd, sort_keys=True, indent=2, separators=(',', ': '))
+
+    print_results(current)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_fd:
+            regressions = compare(json.load(baseline_fd), current, args.threshold, args.min_seconds)
+        if regressions:
+            print("\nRegressions against %s:" % args.baseline)
+            for regression in regressions:
+                print(" " + regression)
+            sys.exit(1)
+        print("\nNo regressions against %s" % args.baseline)
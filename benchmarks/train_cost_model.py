@@ -0,0 +1,140 @@
+#!/usr/bin/env python2.7
+"""
+    Fits the cost model of --aggregate-form auto to results of
+        benchmarks/matrix.py.
+
+    For each job of a rewritten encoding, the cost of its rewritten
+        rules is taken as its ground and solve time less that of the
+        original encoding on the same instance. This cost is the sum of
+        the costs of the rewritten rules, so the features of the job are
+        the sums of the features of its rules (see FEATURES in
+        aagg/cost_model.py). Coefficients of each form are then fitted
+        by (slightly regularized) least squares
+"""
+
+import argparse, csv, json, os, sys, time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), 'aagg'))
+
+from cost_model import FormCostModel, FEATURES, DEFAULT_PATH
+
+
+def load_rows(path):
+    """Returns the result rows of a matrix.py CSV or JSON file"""
+    with open(path) as results_fd:
+        if path.endswith('.json'):
+            return json.load(results_fd)
+        rows = list(csv.DictReader(results_fd))
+
+    # CSV values are strings
+    for row in rows:
+        for key in ('ground_median', 'solve_median', 'sum_b', 'sum_projection'):
+            row[key] = float(row[key]) if row.get(key) else None
+        row['rewritten_rules'] = int(row['rewritten_rules']) if row.get('rewritten_rules') else 0
+        row['form'] = int(row['form']) if row.get('form') else None
+        row['anonymous'] = row.get('anonymous') == 'True'
+    return rows
+
+
+def training_data(rows):
+    """
+        Given result rows
+        Returns a map of form to the list of (features, cost) pairs of
+            the jobs rewritten in that form
+    """
+    original_times = {}
+    for row in rows:
+        if row['variant'] == 'original' and row['status'] == 'ok':
+            original_times[row['encoding'], row['instance']] = row['ground_median'] + row['solve_median']
+
+    data = {}
+    for row in rows:
+        if row['variant'] == 'original' or row['status'] != 'ok' or not row['rewritten_rules']:
+            continue
+        original_time = original_times.get((row['encoding'], row['instance']))
+        if original_time is None:
+            continue
+
+        rules = float(row['rewritten_rules'])
+        features = [rules, row['sum_b'], row['sum_projection'], rules if row['anonymous'] else 0.0]
+        cost = row['ground_median'] + row['solve_median'] - original_time
+        data.setdefault(row['form'], []).append((features, cost))
+    return data
+
+
+def solve_linear_system(matrix, vector):
+    """Solves matrix * x = vector by Gaussian elimination with partial pivoting"""
+    size = len(vector)
+    rows = [list(matrix[index]) + [vector[index]] for index in range(size)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda index: abs(rows[index][column]))
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        if rows[column][column] == 0:
+            raise ValueError("Singular system")
+        for index in range(column + 1, size):
+            factor = rows[index][column] / rows[column][column]
+            for position in range(column, size + 1):
+                rows[index][position] -= factor * rows[column][position]
+
+    solution = [0.0] * size
+    for index in reversed(range(size)):
+        total = rows[index][size] - sum(rows[index][position] * solution[position]
+                                        for position in range(index + 1, size))
+        solution[index] = total / rows[index][index]
+    return solution
+
+
+def fit(samples, regularization):
+    """
+        Given (features, cost) pairs and a ridge regularization weight
+        Returns the least squares coefficients
+    """
+    size = len(FEATURES)
+    normal_matrix = [[sum(features[row] * features[column] for features, _ in samples) for column in range(size)]
+                     for row in range(size)]
+    for index in range(size):
+        normal_matrix[index][index] += regularization
+    normal_vector = [sum(features[row] * cost for features, cost in samples) for row in range(size)]
+    return solve_linear_system(normal_matrix, normal_vector)
+
+
+def define_args(arg_parser):
+    arg_parser.description = 'Fit the --aggregate-form auto cost model to benchmarks/matrix.py results'
+    arg_parser.add_argument('results', nargs='+', help='CSV or JSON results of benchmarks/matrix.py')
+    arg_parser.add_argument('-o', '--output', type=str, default='cost_model.json', help='Cost model file to write')
+    arg_parser.add_argument('--base', type=str, default=DEFAULT_PATH,
+                            help='Cost model whose coefficients are kept for forms without enough results')
+    arg_parser.add_argument('--regularization', type=float, default=1e-6, help='Ridge regularization weight')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    define_args(parser)
+    args = parser.parse_args()
+
+    all_rows = []
+    for results_file in args.results:
+        all_rows.extend(load_rows(results_file))
+
+    model = FormCostModel.load(args.base)
+    fitted_jobs = 0
+    kept_forms = []
+    for form, form_samples in sorted(training_data(all_rows).items()):
+        if len(form_samples) < len(FEATURES):
+            print("Form (%d): %d jobs, keeping the coefficients of %s" % (form, len(form_samples), args.base))
+            kept_forms.append(form)
+            continue
+        model.coefficients[form] = fit(form_samples, args.regularization)
+        fitted_jobs += len(form_samples)
+        print("Form (%d): %d jobs, %s" % (form, len(form_samples), ", ".join(
+            "%s %.6g" % (feature, coefficient) for feature, coefficient in zip(FEATURES, model.coefficients[form]))))
+
+    model.description = "Fitted to %d jobs of %s on %s" % (fitted_jobs, ", ".join(args.results),
+                                                           time.strftime('%Y-%m-%d'))
+    if kept_forms:
+        model.description += "; form(s) %s keep the coefficients of %s" % (
+            ", ".join("(%d)" % form for form in kept_forms), args.base)
+    model.calibrated = fitted_jobs > 0
+    model.save(args.output)
+    print("Cost model written to %s" % args.output)
@@ -0,0 +1,139 @@
+"""
+    Tests of rewriting rules whose counting variables also occur outside
+        the counting literals and comparisons, in families of literals
+        which are moved into the condition of the aggregate elements
+        (see EquivalenceTransformer.condition_literal_positions).
+
+    Each rule is rewritten in every aggregate form, with and without
+        --use-anonymous-variable, and must have the same answer sets as
+        the original rule, together with a choice of the facts of its
+        predicates (auxiliary projection predicates aside).
+
+    Run from the repository root with
+        python -m unittest discover tests
+"""
+
+import os
+import re
+import sys
+import StringIO
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'aagg'))
+
+import clingo
+import constants
+from main import AutomatedAggregator, build_arguments
+
+FORMS = [constants.AGGR_FORM1, constants.AGGR_FORM2, constants.AGGR_FORM3]
+
+# Rules which are rewritten, with the choice rules their answer sets are compared under
+REWRITTEN = {
+    'condition family': (":- p(X), p(Y), q(X), q(Y), X < Y.",
+                         "{ p(1..3) }. { q(1..3) }."),
+    'negated condition family': (":- p(X), p(Y), not q(X), not q(Y), X != Y.",
+                                 "{ p(1..3) }. { q(1..3) }."),
+    'two condition families': (":- p(X), p(Y), q(X), q(Y), t(X), t(Y), X < Y.",
+                               "{ p(1..3) }. { q(1..3) }. { t(1..3) }."),
+    'three counting variables': (":- p(X), p(Y), p(Z), q(X), q(Y), q(Z), X < Y, Y < Z.",
+                                 "{ p(1..4) }. { q(1..4) }."),
+    'comparison family': ("r(A) :- e(A,X), e(A,Y), X != 3, Y != 3, X < Y.",
+                          "{ e(1..2,1..4) }."),
+    'same constant arguments': (":- p(X), p(Y), s(X,1), s(Y,1), X < Y.",
+                                "{ p(1..3) }. { s(1..3,1..2) }."),
+    'family variable bound elsewhere': (":- p(X), p(Y), r(X,Z), r(Y,Z), c(Z), X < Y.",
+                                        "{ p(1..3) }. { r(1..3,1..2) }. { c(1..2) }."),
+    'projection': ("h(A) :- e(A,X), e(A,Y), c(X), c(Y), X < Y.",
+                   "{ e(1..2,1..3) }. { c(1..3) }."),
+    'projection and family variable bound elsewhere': (":- col(C), e(A,X), e(A,Y), c(X,C), c(Y,C), X < Y.",
+                                                       "{ col(1..2) }. { e(1,1..3) }. { c(1..3,1..2) }."),
+}
+
+# Rules which must not be rewritten, as moving their other literals would change their meaning
+NOT_REWRITTEN = {
+    'counting variable in the head': ("s(X) :- p(X), p(Y), q(X), q(Y), X < Y.",
+                                      "{ p(1..3) }. { q(1..3) }."),
+    'incomplete family': (":- p(X), p(Y), q(X), X < Y.",
+                          "{ p(1..3) }. { q(1..3) }."),
+    'different constant arguments': (":- p(X), p(Y), s(X,1), s(Y,2), X < Y.",
+                                     "{ p(1..3) }. { s(1..3,1..2) }."),
+    'unbound family variable': (":- p(X), p(Y), r(X,Z), r(Y,Z), X < Y.",
+                                "{ p(1..3) }. { r(1..3,1..2) }."),
+}
+
+
+def rewrite(program, aggregate_form, anonymous=False):
+    """
+        Given a program, an aggregate form and whether to use anonymous
+            variables.
+        Returns the rewritten program and the rewrite report of the
+            transformer
+    """
+    arguments = build_arguments([], output=os.devnull, aggregate_form=aggregate_form,
+                                use_anonymous_variable=anonymous)
+    arguments.confirm_rewrite = True  # Never prompt
+    arguments.quiet = True
+    aggregator = AutomatedAggregator(arguments, program=program)
+    out_fd = StringIO.StringIO()
+    aggregator.run(out_fd)
+    return out_fd.getvalue(), aggregator.transformer.rewrite_report
+
+
+def answer_sets(program):
+    """Returns every answer set of the program, without atoms of projection predicates, as sets of strings"""
+    control = clingo.Control(['0'])
+    control.add('base', [], program)
+    control.ground([('base', [])])
+    models = set()
+    control.solve(on_model=lambda model: models.add(frozenset(
+        "%s" % symbol for symbol in model.symbols(atoms=True) if '_project_' not in symbol.name)))
+    return models
+
+
+class ConditionLiteralTest(unittest.TestCase):
+
+    def assert_equivalent(self, case, rule, choices, rewritten):
+        """
+            Asserts that the rule is rewritten (or not) in every form,
+                and that the rewritten rule has the answer sets of the
+                original rule under the choices
+        """
+        expected = answer_sets(rule + "\n" + choices)
+        self.assertTrue(len(expected) > 1, "%s: the choices leave no room for the rule" % case)
+        for form in FORMS:
+            for anonymous in (False, True):
+                output, report = rewrite(rule, form, anonymous)
+                description = "%s, form (%d)%s:\n%s" % (case, form, " with anonymous variables" if anonymous else "",
+                                                        output)
+                self.assertEqual(len(report), 1 if rewritten else 0, description)
+                self.assertEqual(answer_sets(output + "\n" + choices), expected, description)
+
+    def test_rewritten_rules_are_equivalent(self):
+        for case, (rule, choices) in sorted(REWRITTEN.items()):
+            self.assert_equivalent(case, rule, choices, True)
+
+    def test_other_rules_are_not_rewritten(self):
+        for case, (rule, choices) in sorted(NOT_REWRITTEN.items()):
+            self.assert_equivalent(case, rule, choices, False)
+
+    def test_conditions_mention_one_counting_variable(self):
+        # The literals of every counting variable but the one of the aggregate element are dropped
+        rule, _ = REWRITTEN['three counting variables']
+        for form in FORMS:
+            output, _ = rewrite(rule, form)
+            self.assertEqual(len(set(re.findall(r"q\((\w+)\)", output))), 1, output)
+            self.assertNotIn("X<Y", output)
+            self.assertNotIn("Y<Z", output)
+
+    def test_anonymous_variable_keeps_counting_variable(self):
+        # Conditions mention the counting variable, so it cannot be replaced by an anonymous variable
+        rule, _ = REWRITTEN['condition family']
+        for form in FORMS:
+            output, _ = rewrite(rule, form, anonymous=True)
+            self.assertNotIn("_", output, output)
+            self.assertEqual(len(set(re.findall(r"q\((\w+)\)", output))), 1, output)
+
+
+if __name__ == '__main__':
+    unittest.main()
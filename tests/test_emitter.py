@@ -0,0 +1,246 @@
+"""
+    Round trip tests of the GringoEmitter: every statement of a program
+        is emitted, the emitted text is parsed by clingo again, and the
+        statements parsed from it must equal the original statements
+        and be emitted as the same text.
+
+    Run from the repository root with
+        python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'aagg'))
+
+import clingo
+from emitter import GringoEmitter
+
+# Statement types which the GringoEmitter writes itself; each must occur in PROGRAMS
+STATEMENT_TYPES = ['Rule', 'Definition', 'ShowSignature', 'ShowTerm', 'Minimize', 'Program', 'External', 'Edge',
+                   'Heuristic', 'ProjectAtom', 'ProjectSignature', 'Defined']
+
+# Programs to round trip, by the case they cover
+PROGRAMS = {
+    'disjunction': """
+        a; b :- c.
+        a(X) : b(X); c :- d.
+        """,
+    'choice': """
+        { a(X) : b(X); c } 2 :- d.
+        1 <= { a; b }.
+        { a(1..3) }.
+        """,
+    'head aggregate': """
+        #count { X,Y : a(X) : b(Y) } = 1 :- c.
+        #sum { 1 : a; 2 : b } > 1.
+        """,
+    'body aggregate': """
+        :- #count { X : p(X), q(X); Y : r(Y) } > 2.
+        :- 1 <= #sum { X,Y : p(X,Y) } <= 3.
+        :- not #max { X : p(X) } = 3.
+        a :- #sum+ { X : p(X) } < 4, #min { X : p(X) } != 1.
+        """,
+    'conditional literal': """
+        :- a(X) : b(X), not c(X); d.
+        a :- b(X) : c(X); not d.
+        """,
+    'literals': """
+        a :- not b, not not c, -d.
+        a :- #true.
+        :- #false.
+        p("a\\"b\\\\c").
+        :- p(X), X != 1, X >= 2, X = Y+1, q(Y), X < Y, X <= 3, X > 0.
+        """,
+    'definition': """
+        #const n = 3.
+        #const m = n+1. [override]
+        """,
+    'show': """
+        #show.
+        #show p/2.
+        #show -p/1.
+        #show a.
+        #show X : p(X); not q(X).
+        """,
+    'minimize': """
+        #minimize { X@1,p : p(X); 2@2 : q }.
+        #minimize { 1@2 }.
+        :~ p(X), q. [X@1,X]
+        """,
+    'program': """
+        #program base.
+        a.
+        #program step(t).
+        b(t).
+        #program check(t,u).
+        c(t,u).
+        """,
+    'external': """
+        #external e(X) : p(X).
+        #external f.
+        """,
+    'edge': """
+        #edge (a,b) : c.
+        #edge (X,Y) : e(X,Y).
+        """,
+    'heuristic': """
+        #heuristic a(X) : b(X). [X@2,level]
+        #heuristic c. [1,sign]
+        """,
+    'project': """
+        #project a(X) : b(X).
+        #project a.
+        #project p/2.
+        """,
+    'defined': """
+        #defined p/3.
+        """,
+    'unary minus': """
+        p(-X) :- q(X).
+        p(-(-X)) :- q(X).
+        p(-f(X)) :- q(X).
+        p(|X|,~X) :- q(X).
+        """,
+    'negative right operand': """
+        p(X-(-1)) :- q(X).
+        p(X-(-Y)) :- q(X,Y).
+        p(X*(-Y)) :- q(X,Y).
+        p(X**2,X\\3,X/2,X^Y,X?Y,X&Y) :- q(X,Y).
+        """,
+    'pool': """
+        p(1;2).
+        p(X;Y) :- q(X,Y).
+        p(a,1;b,2).
+        p(X) :- q(X;Y).
+        """,
+    'tuple': """
+        p(()).
+        p((1,)).
+        p((1,2)).
+        p(((),(1,))).
+        """,
+    'interval': """
+        p(1..3).
+        p(X) :- X = 1..n.
+        """,
+}
+
+
+def parse(program):
+    """
+        Given the text of a program.
+        Returns its statements, without the '#program base.' statement
+            clingo reports before any parsed statement
+    """
+    statements = []
+    clingo.parse_program(program, statements.append)
+    return statements[1:]
+
+
+class EmitterRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.emitter = GringoEmitter()
+
+    def assert_round_trip(self, case):
+        """Asserts that each statement of the program of the case survives being emitted and parsed again"""
+        statements = parse(PROGRAMS[case])
+        self.assertTrue(len(statements) > 0, "%s: nothing was parsed" % case)
+        emitted = [self.emitter.emit(statement) for statement in statements]
+        reparsed = parse("\n".join(emitted))
+        self.assertEqual(len(reparsed), len(statements),
+                         "%s: %d statements were emitted as %d:\n%s" %
+                         (case, len(statements), len(reparsed), "\n".join(emitted)))
+        for statement, text, statement_again in zip(statements, emitted, reparsed):
+            self.assertEqual("%s" % statement_again, "%s" % statement,
+                             "%s: %s was emitted as %s" % (case, statement, text))
+            self.assertEqual(self.emitter.emit(statement_again), text)
+        return emitted
+
+    def test_disjunction(self):
+        self.assert_round_trip('disjunction')
+
+    def test_choice(self):
+        self.assert_round_trip('choice')
+
+    def test_head_aggregate(self):
+        self.assert_round_trip('head aggregate')
+
+    def test_body_aggregate(self):
+        self.assert_round_trip('body aggregate')
+
+    def test_conditional_literal(self):
+        self.assert_round_trip('conditional literal')
+
+    def test_literals(self):
+        self.assert_round_trip('literals')
+
+    def test_definition(self):
+        emitted = self.assert_round_trip('definition')
+        self.assertEqual(emitted[0], "#const n = 3.")
+        self.assertTrue(emitted[1].endswith(" [override]"))
+
+    def test_show(self):
+        emitted = self.assert_round_trip('show')
+        self.assertEqual(emitted[0], "#show.")
+        self.assertEqual(emitted[1], "#show p/2.")
+        self.assertEqual(emitted[2], "#show -p/1.")
+
+    def test_minimize(self):
+        emitted = self.assert_round_trip('minimize')
+        self.assertIn("#minimize { 1@2 }.", emitted)
+        self.assertTrue(any(text.startswith(":~ ") for text in emitted))
+
+    def test_program(self):
+        emitted = self.assert_round_trip('program')
+        self.assertIn("#program step(t).", emitted)
+        self.assertIn("#program check(t,u).", emitted)
+
+    def test_external(self):
+        self.assert_round_trip('external')
+
+    def test_edge(self):
+        self.assert_round_trip('edge')
+
+    def test_heuristic(self):
+        self.assert_round_trip('heuristic')
+
+    def test_project(self):
+        emitted = self.assert_round_trip('project')
+        self.assertEqual(emitted[2], "#project p/2.")
+
+    def test_defined(self):
+        emitted = self.assert_round_trip('defined')
+        self.assertEqual(emitted, ["#defined p/3."])
+
+    def test_unary_minus(self):
+        self.assert_round_trip('unary minus')
+
+    def test_negative_right_operand(self):
+        self.assert_round_trip('negative right operand')
+
+    def test_pool(self):
+        emitted = self.assert_round_trip('pool')
+        self.assertEqual(emitted[0], "p(1;2).")
+
+    def test_tuple(self):
+        emitted = self.assert_round_trip('tuple')
+        self.assertEqual(emitted[0], "p(()).")
+        self.assertEqual(emitted[1], "p((1,)).")
+        self.assertEqual(emitted[2], "p((1,2)).")
+
+    def test_interval(self):
+        self.assert_round_trip('interval')
+
+    def test_every_statement_type_is_covered(self):
+        covered = set()
+        for program in PROGRAMS.values():
+            covered.update("%s" % statement.type for statement in parse(program))
+        self.assertEqual([statement_type for statement_type in STATEMENT_TYPES if statement_type not in covered], [])
+
+
+if __name__ == '__main__':
+    unittest.main()